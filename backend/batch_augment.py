@@ -0,0 +1,108 @@
+import math
+
+import torch
+import torch.nn.functional as F
+from torchvision import transforms
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def decode_transform(image_size=224):
+    """Per-sample transform for batch augmentation: resize and convert to uint8 only"""
+    return transforms.Compose([
+        transforms.Resize((image_size, image_size)),
+        transforms.PILToTensor()
+    ])
+
+
+class BatchAugment:
+    """Vectorized augmentation of collated (B, 3, H, W) uint8 batches
+
+    Mirrors the per-image training pipeline (rotation, horizontal flip,
+    brightness/contrast jitter, normalization) with per-sample random
+    parameters drawn as tensors, so a whole batch is augmented in a few ops
+    on the main process instead of image by image in DataLoader workers.
+    With ``train=False`` only dtype conversion and normalization run.
+    """
+
+    def __init__(self, train=True, degrees=10, flip_p=0.5, brightness=0.1, contrast=0.1,
+                 mean=IMAGENET_MEAN, std=IMAGENET_STD, generator=None):
+        self.train = train
+        self.degrees = degrees
+        self.flip_p = flip_p
+        self.brightness = brightness
+        self.contrast = contrast
+        self.mean = torch.tensor(mean).view(1, -1, 1, 1)
+        self.std = torch.tensor(std).view(1, -1, 1, 1)
+        self.generator = generator
+
+    def _uniform(self, batch_size, low, high, device):
+        values = torch.rand(batch_size, generator=self.generator)
+        return (low + (high - low) * values).to(device)
+
+    def __call__(self, images):
+        images = images.float().div_(255)
+        if self.train:
+            images = self._augment(images)
+        mean = self.mean.to(images.device)
+        std = self.std.to(images.device)
+        return (images - mean) / std
+
+    def _augment(self, images):
+        batch_size, _, height, width = images.shape
+        device = images.device
+
+        # Random rotation: one affine grid per sample, zero fill outside
+        if self.degrees:
+            angles = self._uniform(batch_size, -self.degrees, self.degrees, device) * math.pi / 180
+            cos, sin = torch.cos(angles), torch.sin(angles)
+            zeros = torch.zeros_like(cos)
+            theta = torch.stack([
+                torch.stack([cos, -sin, zeros], dim=1),
+                torch.stack([sin, cos, zeros], dim=1)
+            ], dim=1)
+            grid = F.affine_grid(theta, list(images.shape), align_corners=False)
+            images = F.grid_sample(images, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+
+        # Random horizontal flip
+        if self.flip_p:
+            flip = self._uniform(batch_size, 0, 1, device) < self.flip_p
+            images = torch.where(flip.view(-1, 1, 1, 1), images.flip(-1), images)
+
+        # Brightness jitter
+        if self.brightness:
+            factor = self._uniform(batch_size, 1 - self.brightness, 1 + self.brightness, device)
+            images = (images * factor.view(-1, 1, 1, 1)).clamp_(0, 1)
+
+        # Contrast jitter around each image's mean grayscale intensity
+        if self.contrast:
+            factor = self._uniform(batch_size, 1 - self.contrast, 1 + self.contrast, device).view(-1, 1, 1, 1)
+            gray = 0.299 * images[:, 0] + 0.587 * images[:, 1] + 0.114 * images[:, 2]
+            gray_mean = gray.mean(dim=(1, 2)).view(-1, 1, 1, 1)
+            images = ((images - gray_mean) * factor + gray_mean).clamp_(0, 1)
+
+        return images
+
+
+class AugmentedLoader:
+    """Wraps a DataLoader and applies a batch transform to each collated batch"""
+
+    def __init__(self, loader, batch_transform):
+        self.loader = loader
+        self.batch_transform = batch_transform
+
+    @property
+    def dataset(self):
+        return self.loader.dataset
+
+    @property
+    def sampler(self):
+        return self.loader.sampler
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for images, labels in self.loader:
+            yield self.batch_transform(images), labels
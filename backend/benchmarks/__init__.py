@@ -0,0 +1,7 @@
+"""Benchmarks for the backend. Run from the backend directory, e.g.
+
+    python -m benchmarks.augmentation
+
+``python -m benchmarks.suite`` runs several of them and checks the results
+against a baseline run.
+"""
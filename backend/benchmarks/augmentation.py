@@ -0,0 +1,74 @@
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+from torch.utils.data import DataLoader
+
+from batch_augment import AugmentedLoader, BatchAugment, decode_transform
+from benchmarks.synthetic import write_synthetic_dataset
+from train_model import BrainTumorDataset, build_transforms
+
+
+def build_loader(mode, paths, labels, batch_size, num_workers):
+    if mode == 'pil':
+        train_transform, _ = build_transforms()
+        dataset = BrainTumorDataset(paths, labels, train_transform)
+        return DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+
+    dataset = BrainTumorDataset(paths, labels, decode_transform())
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=num_workers)
+    return AugmentedLoader(loader, BatchAugment(train=True))
+
+
+def measure(loader, epochs):
+    # First pass spins up workers and warms caches
+    for _ in loader:
+        pass
+
+    images = 0
+    start = time.perf_counter()
+    for _ in range(epochs):
+        for batch, _ in loader:
+            images += batch.size(0)
+    return images / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-image PIL and batched tensor augmentation")
+    parser.add_argument('--images', type=int, default=512)
+    parser.add_argument('--image-size', type=int, default=512)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 2, 4, 8])
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths, labels = write_synthetic_dataset(Path(tmp), args.images, args.image_size, args.seed)
+
+        for num_workers in args.workers:
+            row = {"num_workers": num_workers}
+            for mode in ('pil', 'batch'):
+                loader = build_loader(mode, paths, labels, args.batch_size, num_workers)
+                row[f"{mode}_images_per_sec"] = measure(loader, args.epochs)
+            row["speedup"] = row["batch_images_per_sec"] / row["pil_images_per_sec"]
+            results.append(row)
+            print(f"workers={num_workers:2d}  pil={row['pil_images_per_sec']:8.1f} img/s  "
+                  f"batch={row['batch_images_per_sec']:8.1f} img/s  x{row['speedup']:.2f}")
+
+    report = {"benchmark": "augmentation", "config": vars(args), "results": results}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
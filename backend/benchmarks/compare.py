@@ -0,0 +1,108 @@
+import argparse
+import json
+import math
+import sys
+from pathlib import Path
+
+# Metric direction is read from the key name, which every benchmark here follows
+HIGHER_IS_BETTER = ('per_sec', 'speedup', 'efficiency')
+LOWER_IS_BETTER = ('_ms', '_s', '_ms_per_map', '_bytes', 'error_rate')
+
+
+def metric_direction(key):
+    """1 if higher is better, -1 if lower is better, None if ``key`` is not a metric"""
+    if any(token in key for token in HIGHER_IS_BETTER):
+        return 1
+    if key.endswith(LOWER_IS_BETTER):
+        return -1
+    return None
+
+
+def row_label(row):
+    """Identify a result row by its non-metric fields, e.g. ``model=resnet50,batch_size=8``"""
+    return ",".join(
+        f"{key}={value}" for key, value in row.items()
+        if metric_direction(key) is None and isinstance(value, (str, int, bool))
+    )
+
+
+def report_metrics(report):
+    """Flatten a report's ``results`` into ``{(row, metric): (value, direction)}``"""
+    metrics = {}
+    for row in report.get("results", []):
+        label = row_label(row)
+        for key, value in row.items():
+            direction = metric_direction(key)
+            if direction is not None and isinstance(value, (int, float)) and not isinstance(value, bool):
+                metrics[(label, key)] = (float(value), direction)
+    return metrics
+
+
+def compare_reports(baseline, current, threshold=0.1):
+    """Compare every metric present in both reports
+
+    A metric regresses when it is worse than the baseline by more than
+    ``threshold`` (a fraction, so 0.1 allows 10% noise). Returns a list of
+    rows sorted with regressions first.
+    """
+    if baseline.get("benchmark") != current.get("benchmark"):
+        raise ValueError(
+            f"Cannot compare '{baseline.get('benchmark')}' results with '{current.get('benchmark')}'"
+        )
+
+    baseline_metrics = report_metrics(baseline)
+    rows = []
+    for (label, key), (value, direction) in report_metrics(current).items():
+        if (label, key) not in baseline_metrics:
+            continue
+        base_value = baseline_metrics[(label, key)][0]
+        if base_value == 0:
+            change = math.copysign(math.inf, value) if value else 0.0
+        else:
+            change = (value - base_value) / abs(base_value)
+        # Positive means worse, whichever way the metric points
+        worse_by = -change * direction
+        rows.append({
+            "row": label,
+            "metric": key,
+            "baseline": base_value,
+            "current": value,
+            "change": change,
+            "regression": worse_by > threshold
+        })
+    rows.sort(key=lambda r: (not r["regression"], r["row"], r["metric"]))
+    return rows
+
+
+def print_comparison(name, rows):
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else "ok"
+        print(f"{flag:10s} {name}  {row['row']}  {row['metric']}: "
+              f"{row['baseline']:.4g} -> {row['current']:.4g} ({row['change']:+.1%})")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare a benchmark JSON report against a baseline; exits 1 on regressions"
+    )
+    parser.add_argument('baseline', help="Baseline report written with --output")
+    parser.add_argument('current', help="Report to check")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Allowed relative slowdown before a metric counts as a regression")
+    parser.add_argument('--output', help="Write the comparison as JSON to this file")
+    args = parser.parse_args()
+
+    baseline = json.loads(Path(args.baseline).read_text())
+    current = json.loads(Path(args.current).read_text())
+    rows = compare_reports(baseline, current, args.threshold)
+    print_comparison(current.get("benchmark", ""), rows)
+
+    regressions = sum(row["regression"] for row in rows)
+    print(f"{len(rows)} metrics compared, {regressions} regressed beyond {args.threshold:.0%}")
+    if args.output:
+        Path(args.output).write_text(json.dumps({"threshold": args.threshold, "comparison": rows}, indent=2))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
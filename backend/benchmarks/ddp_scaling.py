@@ -0,0 +1,104 @@
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader, TensorDataset
+from torch.utils.data.distributed import DistributedSampler
+
+from distributed import cleanup_distributed, get_world_size, init_distributed, is_main_process
+from train_model import BrainTumorClassifier, ModelTrainer
+
+
+def run_worker(args):
+    """One torchrun process: time training epochs over a fixed synthetic dataset"""
+    distributed = init_distributed()
+
+    # Same data and initial weights on every rank
+    generator = torch.Generator().manual_seed(args.seed)
+    images = torch.randn(args.images, 3, 224, 224, generator=generator)
+    labels = torch.randint(0, 4, (args.images,), generator=generator)
+    dataset = TensorDataset(images, labels)
+    sampler = DistributedSampler(dataset, shuffle=True, seed=args.seed) if distributed else None
+    loader = DataLoader(dataset, batch_size=args.batch_size, sampler=sampler, shuffle=sampler is None)
+
+    torch.manual_seed(args.seed)
+    model = BrainTumorClassifier(num_classes=4, model_name='resnet50', pretrained=False)
+    trainer = ModelTrainer(model, device='cpu', distributed=distributed)
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(trainer.model.parameters(), lr=0.001)
+
+    epoch_times = []
+    for epoch in range(args.epochs):
+        if sampler is not None:
+            sampler.set_epoch(epoch)
+        start = time.perf_counter()
+        trainer.train_epoch(loader, criterion, optimizer)
+        epoch_times.append(time.perf_counter() - start)
+
+    if is_main_process():
+        measured = epoch_times[1:] if len(epoch_times) > 1 else epoch_times
+        epoch_s = sum(measured) / len(measured)
+        Path(args.result_file).write_text(json.dumps({
+            "processes": get_world_size(),
+            "threads_per_process": torch.get_num_threads(),
+            "epoch_s": epoch_s,
+            "images_per_sec": args.images / epoch_s,
+        }))
+
+    cleanup_distributed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure DistributedDataParallel scaling on CPU")
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--images', type=int, default=256)
+    parser.add_argument('--batch-size', type=int, default=16, help="Per-process batch size")
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for nproc in args.processes:
+            result_file = Path(tmp) / f"nproc_{nproc}.json"
+            command = [
+                sys.executable, "-m", "torch.distributed.run",
+                "--standalone", f"--nproc_per_node={nproc}",
+                "-m", "benchmarks.ddp_scaling", "--worker",
+                "--images", str(args.images), "--batch-size", str(args.batch_size),
+                "--epochs", str(args.epochs), "--seed", str(args.seed),
+                "--result-file", str(result_file),
+            ]
+            subprocess.run(command, check=True, cwd=Path(__file__).resolve().parent.parent)
+            results.append(json.loads(result_file.read_text()))
+
+    baseline = results[0]["images_per_sec"] / results[0]["processes"]
+    for row in results:
+        row["speedup"] = row["images_per_sec"] / results[0]["images_per_sec"]
+        row["scaling_efficiency"] = row["images_per_sec"] / (baseline * row["processes"])
+        print(f"processes={row['processes']}  {row['images_per_sec']:7.1f} img/s  "
+              f"speedup x{row['speedup']:.2f}  efficiency {row['scaling_efficiency']:.0%}")
+
+    report = {"benchmark": "ddp_scaling", "config": vars(args), "results": results}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import synthetic_mri
+from benchmarks.timing import latency_summary
+
+ENDPOINTS = ('predict', 'analyze')
+
+
+def configure_environment(args):
+    """Pin the settings main.py reads at import so runs are comparable across machines
+
+    Set before ``main`` is imported, and before its ``load_dotenv`` can fill
+    them from a local ``.env``.
+    """
+    os.environ['EXPLAINER_CLIENT'] = 'stub'
+    os.environ['EXPLAINER_STUB_LATENCY_MS'] = str(args.explainer_latency_ms)
+    os.environ['RESULT_CACHE_DB'] = ''
+    os.environ['EXPLANATION_CACHE_DB'] = ''
+    os.environ['PROFILE_ENABLED'] = 'false'
+
+
+def encode_uploads(count, seed):
+    """Distinct JPEG uploads so every request misses the result cache"""
+    uploads = []
+    for i in range(count):
+        buffer = io.BytesIO()
+        synthetic_mri(512, seed + i).save(buffer, format='JPEG', quality=90)
+        uploads.append(buffer.getvalue())
+    return uploads
+
+
+async def run_load(client, endpoint, uploads, concurrency, params):
+    """Send every upload once with ``concurrency`` requests in flight"""
+    latencies = []
+    statuses = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < len(uploads):
+            image_bytes = uploads[next_index]
+            next_index += 1
+            start = time.perf_counter()
+            response = await client.post(
+                f"/{endpoint}", params=params,
+                files={"file": ("scan.jpg", image_bytes, "image/jpeg")}
+            )
+            latencies.append(time.perf_counter() - start)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": len(latencies),
+        "requests_per_sec": len(latencies) / elapsed,
+        "error_rate": 1 - statuses.get(200, 0) / len(latencies),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+        **latency_summary(latencies)
+    }
+
+
+async def run(args):
+    import httpx
+    import main as server
+
+    # ASGITransport does not send lifespan events, so start the app by hand
+    await server.startup_event()
+    if server.warmup_task is not None:
+        await server.warmup_task
+    if not server.readiness["ready"]:
+        raise RuntimeError(f"Server failed to start: {server.readiness['error']}")
+
+    results = []
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            for endpoint in args.endpoints:
+                params = {"maps": ",".join(args.maps)} if endpoint == 'analyze' else {}
+                requests = args.analyze_requests if endpoint == 'analyze' else args.requests
+                for concurrency in args.concurrency:
+                    # A fresh seed range per level keeps every level uncached
+                    seed = args.seed + 10000 * len(results)
+                    uploads = encode_uploads(requests, seed)
+                    row = {"endpoint": endpoint, "concurrency": concurrency,
+                           **await run_load(client, endpoint, uploads, concurrency, params)}
+                    results.append(row)
+                    print(f"/{endpoint:8s} concurrency={concurrency:3d}  {row['requests_per_sec']:7.2f} req/s  "
+                          f"p50={row['p50_ms']:8.1f} ms  p99={row['p99_ms']:8.1f} ms  "
+                          f"errors={row['error_rate']:.1%}")
+    finally:
+        await server.shutdown_event()
+
+    return results, server.startup_report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load /predict and /analyze in-process through the ASGI app with concurrent clients"
+    )
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=64, help="/predict requests per concurrency level")
+    parser.add_argument('--analyze-requests', type=int, default=16, help="/analyze requests per concurrency level")
+    parser.add_argument('--maps', nargs='+', default=['gradcam', 'integrated_gradients'])
+    parser.add_argument('--explainer-latency-ms', type=float, default=0.0,
+                        help="Latency of the stub LLM client used by /analyze")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    configure_environment(args)
+    results, startup_report = asyncio.run(run(args))
+
+    report = {
+        "benchmark": "endpoints",
+        "config": vars(args),
+        "startup": startup_report,
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "results": results
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
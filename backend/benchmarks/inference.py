@@ -0,0 +1,123 @@
+import argparse
+import json
+import time
+from pathlib import Path
+
+import torch
+
+from benchmarks.synthetic import synthetic_mri, synthetic_saliency_map
+from benchmarks.timing import latency_summary, time_calls
+from classifier import BrainTumorClassifier
+from main import numpy_to_base64, transform
+from saliency_maps import SaliencyMapGenerator
+
+MODEL_NAMES = ('resnet50', 'efficientnet')
+SALIENCY_METHODS = ('gradcam', 'integrated_gradients', 'occlusion')
+
+
+def build_model(model_name, seed):
+    # Random weights cost the same as trained ones and need no checkpoint or download
+    torch.manual_seed(seed)
+    model = BrainTumorClassifier(num_classes=4, model_name=model_name, pretrained=False)
+    return model.eval()
+
+
+def synthetic_batch(batch_size, seed):
+    """Preprocessed synthetic slices, exactly as /predict would feed them to the model"""
+    return torch.stack([transform(synthetic_mri(512, seed + i)) for i in range(batch_size)])
+
+
+def bench_forward(model, batch, iterations, warmup):
+    def forward():
+        with torch.inference_mode():
+            model(batch)
+
+    samples = time_calls(forward, iterations, warmup)
+    summary = latency_summary(samples)
+    summary["images_per_sec"] = batch.size(0) * len(samples) / sum(samples)
+    return summary
+
+
+def bench_saliency(generator, image_tensor, method, args):
+    if method == 'gradcam':
+        run = lambda: generator.generate_gradcam(image_tensor, 0)
+    elif method == 'integrated_gradients':
+        run = lambda: generator.generate_integrated_gradients(
+            image_tensor, 0, steps=args.ig_steps, internal_batch_size=args.ig_batch_size
+        )
+    else:
+        run = lambda: generator.generate_occlusion_map(
+            image_tensor, 0, patch_size=args.occlusion_patch_size, stride=args.occlusion_stride
+        )
+    return latency_summary(time_calls(run, args.saliency_repeats, warmup=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure forward throughput, saliency latency and map encoding cost on synthetic scans"
+    )
+    parser.add_argument('--models', nargs='+', choices=MODEL_NAMES, default=list(MODEL_NAMES))
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--iterations', type=int, default=20, help="Timed forward passes per batch size")
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--methods', nargs='+', choices=SALIENCY_METHODS, default=list(SALIENCY_METHODS))
+    parser.add_argument('--saliency-repeats', type=int, default=5)
+    parser.add_argument('--ig-steps', type=int, default=50)
+    parser.add_argument('--ig-batch-size', type=int, default=16)
+    parser.add_argument('--occlusion-patch-size', type=int, default=20)
+    parser.add_argument('--occlusion-stride', type=int, default=10)
+    parser.add_argument('--encode-repeats', type=int, default=50)
+    parser.add_argument('--threads', type=int, help="torch intra-op threads (default: torch's choice)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    results = []
+    for model_name in args.models:
+        model = build_model(model_name, args.seed)
+
+        for batch_size in args.batch_sizes:
+            batch = synthetic_batch(batch_size, args.seed)
+            row = {"section": "forward", "model": model_name, "batch_size": batch_size,
+                   **bench_forward(model, batch, args.iterations, args.warmup)}
+            results.append(row)
+            print(f"forward   {model_name:12s} batch={batch_size:3d}  {row['images_per_sec']:8.1f} img/s  "
+                  f"p50={row['p50_ms']:8.2f} ms")
+
+        generator = SaliencyMapGenerator(model, 'cpu')
+        image_tensor = synthetic_batch(1, args.seed)[0]
+        for method in args.methods:
+            row = {"section": "saliency", "model": model_name, "method": method,
+                   **bench_saliency(generator, image_tensor, method, args)}
+            results.append(row)
+            print(f"saliency  {model_name:12s} {method:20s}  p50={row['p50_ms']:8.2f} ms  "
+                  f"p95={row['p95_ms']:8.2f} ms")
+
+    # Same PNG + base64 path /analyze uses for every map in a JSON response
+    for kind in ('gradcam', 'integrated_gradients'):
+        array = synthetic_saliency_map(224, kind, args.seed)
+        samples = time_calls(lambda: numpy_to_base64(array), args.encode_repeats)
+        row = {"section": "encode", "function": "numpy_to_base64", "map_kind": kind,
+               "output_bytes": len(numpy_to_base64(array)), **latency_summary(samples)}
+        results.append(row)
+        print(f"encode    numpy_to_base64 {kind:20s}  p50={row['p50_ms']:6.3f} ms  {row['output_bytes']} B")
+
+    report = {
+        "benchmark": "inference",
+        "config": vars(args),
+        "torch_version": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "results": results
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import importlib.util
+import json
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import synthetic_saliency_map
+from map_transport import EncodedMap, encode_msgpack, encode_multipart, json_maps
+
+MAP_KINDS = ('gradcam', 'integrated_gradients')
+
+
+def time_encode(arrays, encoding, png_level, repeats):
+    """Mean server-side encode time per map in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for array in arrays:
+            EncodedMap.from_array(array, encoding, png_level)
+    return (time.perf_counter() - start) * 1000 / (repeats * len(arrays))
+
+
+def wire_bytes(maps, response_format):
+    """Size of the saliency portion of an /analyze response body"""
+    if response_format == 'json':
+        return len(json.dumps({"saliency_maps": json_maps(maps)}).encode())
+    if response_format == 'multipart':
+        body, _ = encode_multipart({}, maps)
+        return len(body)
+    return len(encode_msgpack({}, maps))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare saliency map encodings: bytes on the wire and encode time")
+    parser.add_argument('--size', type=int, default=224)
+    parser.add_argument('--samples', type=int, default=8, help="Synthetic maps per kind")
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--png-levels', type=int, nargs='+', default=[1, 6, 9])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    # msgpack is optional (the server answers 406 without it), so only measure it when installed
+    if importlib.util.find_spec('msgpack') is not None:
+        formats = ('json', 'multipart', 'msgpack')
+    else:
+        formats = ('json', 'multipart')
+
+    arrays = {
+        kind: [synthetic_saliency_map(args.size, kind, args.seed + i) for i in range(args.samples)]
+        for kind in MAP_KINDS
+    }
+    variants = [('png', level) for level in args.png_levels] + [('uint8', 6), ('float16', 6)]
+
+    results = []
+    for encoding, png_level in variants:
+        label = f"png{png_level}" if encoding == 'png' else encoding
+        all_arrays = [array for kind in MAP_KINDS for array in arrays[kind]]
+        row = {
+            "encoding": label,
+            "encode_ms_per_map": time_encode(all_arrays, encoding, png_level, args.repeats),
+        }
+        for kind in MAP_KINDS:
+            sizes = [len(EncodedMap.from_array(a, encoding, png_level).data) for a in arrays[kind]]
+            row[f"{kind}_bytes"] = sum(sizes) / len(sizes)
+
+        # One response carrying one map of each kind
+        maps = {kind: EncodedMap.from_array(arrays[kind][0], encoding, png_level) for kind in MAP_KINDS}
+        for response_format in formats:
+            row[f"{response_format}_wire_bytes"] = wire_bytes(maps, response_format)
+        results.append(row)
+
+        wire = "  ".join(f"{f}={row[f'{f}_wire_bytes']:7d} B" for f in formats)
+        print(f"{label:8s}  encode={row['encode_ms_per_map']:6.3f} ms/map  {wire}")
+
+    # Historical baseline: base64 PNG at the default level inside JSON
+    baseline = next(r for r in results if r["encoding"] == "png6") if 6 in args.png_levels else results[0]
+    for row in results:
+        row["json_vs_baseline"] = row["json_wire_bytes"] / baseline["json_wire_bytes"]
+        for response_format in formats[1:]:
+            row[f"{response_format}_vs_baseline"] = row[f"{response_format}_wire_bytes"] / baseline["json_wire_bytes"]
+
+    report = {"benchmark": "map_transport", "config": vars(args), "formats": list(formats), "results": results}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from benchmarks.compare import compare_reports, print_comparison
+
+# Extra arguments for --quick runs, small enough for a CI job
+QUICK_ARGS = {
+    'inference': ['--batch-sizes', '1', '8', '--iterations', '5', '--saliency-repeats', '2', '--ig-steps', '16'],
+    'endpoints': ['--concurrency', '1', '4', '--requests', '16', '--analyze-requests', '4'],
+    'map_transport': ['--samples', '2', '--repeats', '5'],
+    'augmentation': ['--images', '64', '--workers', '0', '2', '--epochs', '1'],
+    'training_precision': ['--images', '64', '--epochs', '1'],
+    'ddp_scaling': ['--processes', '1', '2', '--images', '64', '--epochs', '1'],
+}
+SERVING_BENCHMARKS = ('inference', 'endpoints', 'map_transport')
+
+
+def run_benchmark(name, output_path, seed, quick):
+    """Run one benchmark module in a fresh interpreter so runs do not share warm state"""
+    command = [sys.executable, '-m', f'benchmarks.{name}', '--seed', str(seed), '--output', str(output_path)]
+    if quick:
+        command += QUICK_ARGS[name]
+    print(f"=== {name}: {' '.join(command[1:])}")
+    return subprocess.run(command).returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run benchmarks into one directory and optionally check them against a baseline run"
+    )
+    parser.add_argument('--benchmarks', nargs='+', choices=list(QUICK_ARGS), default=list(SERVING_BENCHMARKS))
+    parser.add_argument('--output-dir', default='benchmark_results')
+    parser.add_argument('--baseline-dir', help="Directory from an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="Allowed relative slowdown before a metric counts as a regression")
+    parser.add_argument('--quick', action='store_true', help="Smaller workloads for smoke tests and CI")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    failed = []
+    regressions = 0
+    for name in args.benchmarks:
+        output_path = output_dir / f"{name}.json"
+        if run_benchmark(name, output_path, args.seed, args.quick) != 0:
+            failed.append(name)
+            continue
+
+        baseline_path = Path(args.baseline_dir) / f"{name}.json" if args.baseline_dir else None
+        if baseline_path is None:
+            continue
+        if not baseline_path.exists():
+            print(f"No baseline for {name} in {args.baseline_dir}, skipping comparison")
+            continue
+        rows = compare_reports(
+            json.loads(baseline_path.read_text()), json.loads(output_path.read_text()), args.threshold
+        )
+        print_comparison(name, [row for row in rows if row["regression"]])
+        regressions += sum(row["regression"] for row in rows)
+
+    print(f"Results in {output_dir}: {len(args.benchmarks) - len(failed)} benchmarks ran"
+          + (f", failed: {', '.join(failed)}" if failed else "")
+          + (f", {regressions} regressions beyond {args.threshold:.0%}" if args.baseline_dir else ""))
+    sys.exit(1 if failed or regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import numpy as np
+from PIL import Image
+
+
+def synthetic_mri(size=512, seed=0):
+    """Grayscale MRI-like slice: a noisy elliptical head with a bright lesion"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[-1:1:size * 1j, -1:1:size * 1j]
+
+    # Skull outline and brain tissue
+    head = (x / 0.8) ** 2 + (y / 0.95) ** 2
+    image = np.where(head < 1.0, 0.35, 0.0)
+    image += np.where((head > 0.9) & (head < 1.0), 0.5, 0.0)
+
+    # Lesion at a random position inside the brain
+    cx, cy = rng.uniform(-0.4, 0.4, size=2)
+    radius = rng.uniform(0.08, 0.2)
+    image += np.where((x - cx) ** 2 + (y - cy) ** 2 < radius ** 2, 0.4, 0.0)
+
+    image += rng.normal(0.0, 0.05, size=image.shape)
+    image = np.clip(image, 0.0, 1.0)
+    return Image.fromarray((image * 255).astype(np.uint8), mode='L').convert('RGB')
+
+
+def write_synthetic_dataset(output_dir, count, size=512, seed=0):
+    """Write ``count`` synthetic JPEG slices and return (paths, labels)"""
+    paths = []
+    labels = []
+    for i in range(count):
+        path = output_dir / f"synthetic_{i:05d}.jpg"
+        synthetic_mri(size, seed + i).save(path, quality=90)
+        paths.append(str(path))
+        labels.append(i % 4)
+    return paths, labels
+
+
+def synthetic_saliency_map(size=224, kind='gradcam', seed=0):
+    """Float32 [0, 1] map shaped like a real one: smooth (Grad-CAM) or speckled (IG)"""
+    rng = np.random.default_rng(seed)
+    if kind == 'gradcam':
+        # A 7x7 activation grid upsampled bilinearly, as Grad-CAM does on layer4
+        coarse = Image.fromarray(rng.random((7, 7), dtype=np.float32), mode='F')
+        saliency = np.asarray(coarse.resize((size, size), Image.BILINEAR), dtype=np.float32)
+    else:
+        # Pixel-level attributions: sparse, high-frequency and mostly near zero
+        saliency = np.abs(rng.normal(0.0, 1.0, size=(size, size))).astype(np.float32) ** 3
+    saliency = saliency - saliency.min()
+    return saliency / max(float(saliency.max()), 1e-8)
@@ -0,0 +1,26 @@
+import time
+
+import numpy as np
+
+
+def latency_summary(samples_s):
+    """Milliseconds percentiles of a list of per-call durations in seconds"""
+    samples_ms = np.asarray(samples_s, dtype=np.float64) * 1000
+    return {
+        "mean_ms": float(samples_ms.mean()),
+        "p50_ms": float(np.percentile(samples_ms, 50)),
+        "p95_ms": float(np.percentile(samples_ms, 95)),
+        "p99_ms": float(np.percentile(samples_ms, 99)),
+    }
+
+
+def time_calls(fn, repeats, warmup=1):
+    """Call ``fn()`` ``warmup`` times untimed, then return ``repeats`` durations in seconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
@@ -0,0 +1,112 @@
+import argparse
+import copy
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader
+
+from benchmarks.synthetic import write_synthetic_dataset
+from train_model import (BrainTumorClassifier, BrainTumorDataset, ModelTrainer,
+                         build_transforms, find_training_images)
+
+CONFIGS = [
+    {"name": "fp32", "precision": "fp32", "channels_last": False},
+    {"name": "fp32_channels_last", "precision": "fp32", "channels_last": True},
+    {"name": "bf16", "precision": "bf16", "channels_last": False},
+    {"name": "bf16_channels_last", "precision": "bf16", "channels_last": True},
+]
+
+
+def subset_images(count, tmp_dir, seed):
+    """Every k-th real training image when the dataset is present, else synthetic slices"""
+    image_paths, labels = find_training_images()
+    if image_paths:
+        step = max(1, len(image_paths) // count)
+        return image_paths[::step][:count], labels[::step][:count], "dataset"
+    paths, labels = write_synthetic_dataset(Path(tmp_dir), count, seed=seed)
+    return paths, labels, "synthetic"
+
+
+def time_config(config, base_model, loader, epochs, grad_accum_steps):
+    trainer = ModelTrainer(
+        copy.deepcopy(base_model), device='cpu',
+        precision=config["precision"],
+        channels_last=config["channels_last"],
+        grad_accum_steps=grad_accum_steps
+    )
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(trainer.model.parameters(), lr=0.001)
+
+    train_times = []
+    val_times = []
+    for _ in range(epochs):
+        start = time.perf_counter()
+        trainer.train_epoch(loader, criterion, optimizer)
+        train_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        trainer.validate_epoch(loader, criterion)
+        val_times.append(time.perf_counter() - start)
+
+    # Drop the first epoch (allocator growth, kernel selection) when possible
+    measured = slice(1, None) if epochs > 1 else slice(None)
+    return {
+        "train_epoch_s": sum(train_times[measured]) / len(train_times[measured]),
+        "validate_epoch_s": sum(val_times[measured]) / len(val_times[measured]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fp32, bf16 and channels_last CPU epoch times")
+    parser.add_argument('--images', type=int, default=256, help="Subset size")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--grad-accum-steps', type=int, default=1)
+    parser.add_argument('--num-workers', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    base_model = BrainTumorClassifier(num_classes=4, model_name='resnet50', pretrained=False)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths, labels, source = subset_images(args.images, tmp, args.seed)
+        _, val_transform = build_transforms()
+        loader = DataLoader(
+            BrainTumorDataset(paths, labels, val_transform),
+            batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers
+        )
+
+        results = []
+        for config in CONFIGS:
+            timings = time_config(config, base_model, loader, args.epochs, args.grad_accum_steps)
+            results.append({**config, **timings})
+
+    baseline = results[0]
+    for row in results:
+        row["train_speedup_vs_fp32"] = baseline["train_epoch_s"] / row["train_epoch_s"]
+        row["validate_speedup_vs_fp32"] = baseline["validate_epoch_s"] / row["validate_epoch_s"]
+        print(f"{row['name']:20s} train={row['train_epoch_s']:7.2f}s "
+              f"(x{row['train_speedup_vs_fp32']:.2f})  val={row['validate_epoch_s']:7.2f}s "
+              f"(x{row['validate_speedup_vs_fp32']:.2f})")
+
+    report = {
+        "benchmark": "training_precision",
+        "config": {**vars(args), "source": source, "images": len(paths)},
+        "torch_threads": torch.get_num_threads(),
+        "results": results
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+import random
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import torch
+
+CHECKPOINT_PATTERN = re.compile(r"checkpoint_epoch_(\d+)\.pt$")
+
+
+def _snapshot(value):
+    """Detached CPU copy of a nested state structure, safe to write from another thread"""
+    if torch.is_tensor(value):
+        return value.detach().to('cpu', copy=True)
+    if isinstance(value, dict):
+        return {key: _snapshot(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(_snapshot(item) for item in value)
+    return value
+
+
+def capture_rng_state():
+    state = {
+        "python": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state(),
+    }
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def restore_rng_state(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+class CheckpointManager:
+    """Writes full training checkpoints atomically on a background thread
+
+    ``save`` snapshots the state to CPU on the calling thread, then a single
+    writer thread serializes it to a temporary file, fsyncs it and renames
+    it into place, so a crash never leaves a truncated checkpoint. Only the
+    newest ``keep_last`` checkpoints are kept.
+    """
+
+    def __init__(self, checkpoint_dir="models/checkpoints", keep_last=3):
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.keep_last = max(1, int(keep_last))
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="checkpoint")
+        self._pending = None
+
+    def save(self, epoch, state):
+        """Queue a checkpoint for ``epoch``; returns once the state is snapshotted"""
+        # At most one snapshot in flight keeps memory bounded
+        self.wait()
+        snapshot = _snapshot(state)
+        self._pending = self._writer.submit(self._write, epoch, snapshot)
+
+    def _write(self, epoch, snapshot):
+        path = self.checkpoint_dir / f"checkpoint_epoch_{epoch:04d}.pt"
+        tmp_path = path.with_name(path.name + ".tmp")
+
+        with open(tmp_path, 'wb') as f:
+            torch.save(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+        self._rotate()
+        return path
+
+    def _rotate(self):
+        for stale in self.list_checkpoints()[:-self.keep_last]:
+            stale.unlink(missing_ok=True)
+
+    def list_checkpoints(self):
+        """Checkpoint files ordered from oldest to newest epoch"""
+        checkpoints = []
+        for path in self.checkpoint_dir.glob("checkpoint_epoch_*.pt"):
+            match = CHECKPOINT_PATTERN.search(path.name)
+            if match:
+                checkpoints.append((int(match.group(1)), path))
+        return [path for _, path in sorted(checkpoints)]
+
+    def latest(self):
+        checkpoints = self.list_checkpoints()
+        return checkpoints[-1] if checkpoints else None
+
+    def load(self, path=None):
+        """Load a checkpoint (the newest one by default) onto the CPU"""
+        path = Path(path) if path is not None else self.latest()
+        if path is None:
+            raise FileNotFoundError(f"No checkpoints found in {self.checkpoint_dir}")
+        # Checkpoints hold RNG states and history, not just tensors
+        return torch.load(path, map_location='cpu', weights_only=False)
+
+    def wait(self):
+        """Block until the in-flight checkpoint (if any) is on disk"""
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    def close(self):
+        self.wait()
+        self._writer.shutdown(wait=True)
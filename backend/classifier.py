@@ -0,0 +1,55 @@
+import torch
+import torch.nn as nn
+from torchvision import models
+
+
+class BrainTumorClassifier(nn.Module):
+    """ResNet-50 or EfficientNet-B0 backbone with a 4-class head
+
+    ``pretrained=True`` starts from ImageNet weights (downloaded on first
+    use) for training; serving passes ``pretrained=False`` because the
+    fine-tuned state dict replaces every weight anyway, which keeps startup
+    fast and lets it work offline.
+    """
+
+    def __init__(self, num_classes=4, model_name='resnet50', pretrained=True):
+        super(BrainTumorClassifier, self).__init__()
+
+        if model_name == 'resnet50':
+            weights = models.ResNet50_Weights.IMAGENET1K_V1 if pretrained else None
+            self.backbone = models.resnet50(weights=weights)
+            num_features = self.backbone.fc.in_features
+            self.backbone.fc = nn.Linear(num_features, num_classes)
+        elif model_name == 'efficientnet':
+            weights = models.EfficientNet_B0_Weights.IMAGENET1K_V1 if pretrained else None
+            self.backbone = models.efficientnet_b0(weights=weights)
+            num_features = self.backbone.classifier[1].in_features
+            self.backbone.classifier = nn.Sequential(
+                nn.Dropout(0.2),
+                nn.Linear(num_features, num_classes)
+            )
+        else:
+            raise ValueError(f"Unknown model '{model_name}', choose 'resnet50' or 'efficientnet'")
+
+    def forward(self, x):
+        return self.backbone(x)
+
+
+def load_state_dict_file(path, map_location='cpu'):
+    """Load a saved state dict memory-mapped and tensors-only when torch supports it
+
+    ``mmap=True`` (torch >= 2.1) pages weights in from the file instead of
+    reading it into memory first; ``weights_only`` refuses arbitrary pickles.
+    Older torch versions fall back to progressively plainer loads.
+    """
+    attempts = (
+        {"mmap": True, "weights_only": True},
+        {"weights_only": True},
+        {},
+    )
+    for kwargs in attempts:
+        try:
+            return torch.load(path, map_location=map_location, **kwargs)
+        except TypeError:
+            continue
+    raise RuntimeError(f"Could not load state dict from {path}")
@@ -0,0 +1,55 @@
+import os
+
+import torch
+import torch.distributed as dist
+
+
+def init_distributed():
+    """Join the gloo process group when launched by torchrun
+
+    Returns True when running with more than one process. Each process
+    gets an equal share of the local CPU cores for intra-op threads.
+    """
+    world_size = int(os.environ.get('WORLD_SIZE', '1'))
+    if world_size <= 1:
+        return False
+
+    if not dist.is_initialized():
+        dist.init_process_group(backend='gloo')
+
+    local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', world_size))
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // local_world_size))
+    return True
+
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+
+def is_main_process():
+    return get_rank() == 0
+
+
+def all_reduce_sum(tensor):
+    """Sum a tensor across processes in place (no-op when not distributed)"""
+    if is_distributed():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+
+def barrier():
+    if is_distributed():
+        dist.barrier()
+
+
+def cleanup_distributed():
+    if is_distributed():
+        dist.destroy_process_group()
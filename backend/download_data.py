@@ -1,29 +1,47 @@
+import argparse
+import csv
+import hashlib
+import io
 import os
+import threading
 import zipfile
-import kaggle
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def download_brain_tumor_dataset():
+from PIL import Image
+
+DATASET = 'masoudnickparvar/brain-tumor-mri-dataset'
+CLASS_NAMES = ['glioma', 'meningioma', 'notumor', 'pituitary']
+SPLITS = {'Training': 'train', 'Testing': 'test'}
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_FIELDS = ['path', 'class', 'label', 'split', 'hash', 'phash', 'width', 'height']
+
+
+def download_brain_tumor_dataset(data_dir="data", num_workers=8, dedupe='content'):
     """Download brain tumor dataset from Kaggle"""
-    
+
     # Create data directory
-    data_dir = Path("data")
+    data_dir = Path(data_dir)
     data_dir.mkdir(exist_ok=True)
-    
+
     print("Downloading brain tumor dataset from Kaggle...")
-    
+
     # Download dataset
     try:
-        kaggle.api.dataset_download_files(
-            'masoudnickparvar/brain-tumor-mri-dataset',
-            path=str(data_dir),
-            unzip=True
-        )
+        # Imported here because the kaggle package authenticates on import,
+        # which offline ingestion from --archive must not require
+        import kaggle
+
+        kaggle.api.dataset_download_files(DATASET, path=str(data_dir), unzip=False)
         print("✅ Dataset downloaded successfully!")
-        
+
+        archive_path = data_dir / f"{DATASET.split('/')[-1]}.zip"
+        ingest_archive(archive_path, data_dir, num_workers=num_workers, dedupe=dedupe)
+
         # Organize the data structure
-        organize_dataset()
-        
+        organize_dataset(data_dir)
+
     except Exception as e:
         print(f"❌ Error downloading dataset: {e}")
         print("Make sure you have kaggle API configured:")
@@ -31,24 +49,209 @@ def download_brain_tumor_dataset():
         print("2. Go to Account -> API -> Create New API Token")
         print("3. Place kaggle.json in ~/.kaggle/")
         print("4. Run: chmod 600 ~/.kaggle/kaggle.json")
+        print("Or ingest an already downloaded archive: python download_data.py --archive <zip>")
+
+def classify_member(name):
+    """Map an archive member or relative path to (split, class) or None if it is not a dataset image
+
+    Absolute paths and ``..`` components are rejected, so a crafted archive
+    cannot write outside the data directory.
+    """
+    parts = Path(name).parts
+    if not name.lower().endswith(IMAGE_EXTENSIONS):
+        return None
+    if Path(name).is_absolute() or '..' in parts:
+        return None
+    for i, part in enumerate(parts[:-2]):
+        if part in SPLITS and parts[i + 1] in CLASS_NAMES:
+            return SPLITS[part], parts[i + 1]
+    return None
+
+def perceptual_hash(image, hash_size=8):
+    """Difference hash: one bit per horizontal gradient of a tiny grayscale thumbnail"""
+    pixels = list(image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            offset = row * (hash_size + 1) + col
+            bits = (bits << 1) | (pixels[offset] > pixels[offset + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+def inspect_image(data):
+    """Decode image bytes once; returns (sha256, phash, width, height) or None if corrupt"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # load() forces a full decode so truncated files are caught too
+            image.load()
+            return hashlib.sha256(data).hexdigest(), perceptual_hash(image), image.width, image.height
+    except Exception:
+        return None
+
+def _ingest(data, relative_path, data_dir, split, class_name):
+    """Verify one image and write it under ``data_dir``; returns its manifest row or None"""
+    info = inspect_image(data)
+    if info is None:
+        return None
+
+    sha256, phash, width, height = info
+    dest = data_dir / relative_path
+    if not dest.resolve().is_relative_to(data_dir.resolve()):
+        raise ValueError(f"Refusing to write {relative_path} outside {data_dir}")
+    if not (dest.exists() and dest.stat().st_size == len(data)):
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.write_bytes(data)
+
+    return {
+        'path': relative_path.as_posix(),
+        'class': class_name,
+        'label': CLASS_NAMES.index(class_name),
+        'split': split,
+        'hash': sha256,
+        'phash': phash,
+        'width': width,
+        'height': height
+    }
+
+def ingest_archive(archive_path, data_dir="data", num_workers=8, dedupe='content'):
+    """Extract, verify and index a dataset zip in parallel; works fully offline
+
+    Each worker thread keeps its own handle on the archive, so members are
+    inflated, decoded and written concurrently (zlib and PIL release the GIL).
+    """
+    archive_path = Path(archive_path)
+    data_dir = Path(data_dir)
+    local = threading.local()
+    handles = []
 
-def organize_dataset():
-    """Organize dataset into train/test/val splits"""
-    
-    data_dir = Path("data")
-    
-    # Check if dataset was extracted
-    if not any(data_dir.iterdir()):
-        print("❌ Dataset directory is empty")
+    def process(member):
+        if not hasattr(local, 'archive'):
+            local.archive = zipfile.ZipFile(archive_path)
+            handles.append(local.archive)
+        split, class_name = classify_member(member)
+        # Drop any wrapper directory so files land in data/Training/<class>/
+        parts = Path(member).parts
+        start = next(i for i, part in enumerate(parts) if part in SPLITS)
+        return _ingest(local.archive.read(member), Path(*parts[start:]), data_dir, split, class_name)
+
+    with zipfile.ZipFile(archive_path) as archive:
+        members = sorted(name for name in archive.namelist() if classify_member(name))
+
+    print(f"📦 Ingesting {len(members)} images from {archive_path} with {num_workers} workers")
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            rows = list(pool.map(process, members))
+    finally:
+        for handle in handles:
+            handle.close()
+
+    return write_manifest(rows, members, data_dir, dedupe)
+
+def ingest_directory(data_dir="data", num_workers=8, dedupe='content'):
+    """Verify and index images already extracted under ``data_dir``"""
+    data_dir = Path(data_dir)
+    members = sorted(
+        path.relative_to(data_dir).as_posix() for path in data_dir.rglob("*")
+        if path.is_file() and classify_member(path.relative_to(data_dir).as_posix())
+    )
+
+    def process(member):
+        split, class_name = classify_member(member)
+        return _ingest((data_dir / member).read_bytes(), Path(member), data_dir, split, class_name)
+
+    print(f"🔎 Indexing {len(members)} images in {data_dir} with {num_workers} workers")
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        rows = list(pool.map(process, members))
+
+    return write_manifest(rows, members, data_dir, dedupe)
+
+def write_manifest(rows, members, data_dir, dedupe='content'):
+    """Drop corrupt and duplicate images, then write the manifest atomically
+
+    The first occurrence (in sorted path order) of each content hash, or of
+    each perceptual hash with ``dedupe='perceptual'``, is kept; later copies
+    are left out of the manifest so they can never leak across splits. Files
+    are never deleted: a perceptual match is only a 64-bit dHash and can
+    collide on distinct but similar slices.
+    """
+    if dedupe not in ('content', 'perceptual'):
+        raise ValueError(f"Unknown dedupe mode '{dedupe}', choose 'content' or 'perceptual'")
+
+    key = 'hash' if dedupe == 'content' else 'phash'
+    seen = {}
+    kept = []
+    corrupt = duplicates = 0
+    for member, row in zip(members, rows):
+        if row is None:
+            corrupt += 1
+            print(f"  ⚠️  Skipping unreadable image {member}")
+            continue
+        if row[key] in seen:
+            duplicates += 1
+            print(f"  ⚠️  Leaving duplicate {row['path']} out of the manifest (same {key} as {seen[row[key]]})")
+            continue
+        seen[row[key]] = row['path']
+        kept.append(row)
+
+    manifest_path = data_dir / MANIFEST_NAME
+    tmp_path = manifest_path.with_name(MANIFEST_NAME + ".tmp")
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+        writer.writeheader()
+        writer.writerows(kept)
+    os.replace(tmp_path, manifest_path)
+
+    print(f"✅ Manifest written to {manifest_path}: {len(kept)} images "
+          f"({corrupt} corrupt, {duplicates} duplicates not indexed)")
+    return manifest_path
+
+def load_manifest(data_dir="data", split=None):
+    """Manifest rows (optionally for one split), or None if no manifest exists"""
+    manifest_path = Path(data_dir) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return None
+    with open(manifest_path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    for row in rows:
+        row['label'] = int(row['label'])
+        row['width'] = int(row['width'])
+        row['height'] = int(row['height'])
+    if split is not None:
+        rows = [row for row in rows if row['split'] == split]
+    return rows
+
+def organize_dataset(data_dir="data"):
+    """Summarize the ingested dataset per split and class"""
+
+    rows = load_manifest(data_dir)
+    if not rows:
+        print("❌ No dataset manifest found")
         return
-    
+
     print("📁 Dataset structure:")
-    for item in data_dir.rglob("*"):
-        if item.is_dir():
-            print(f"  📂 {item.relative_to(data_dir)}")
-        elif item.suffix in ['.jpg', '.jpeg', '.png']:
-            print(f"    🖼️  {item.name}")
-            break  # Just show one example file per directory
+    for split in SPLITS.values():
+        split_rows = [row for row in rows if row['split'] == split]
+        print(f"  📂 {split}: {len(split_rows)} images")
+        for class_name in CLASS_NAMES:
+            count = sum(row['class'] == class_name for row in split_rows)
+            print(f"    🖼️  {class_name}: {count}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Download, verify and index the brain tumor MRI dataset")
+    parser.add_argument('--archive', help="Ingest a local dataset zip instead of downloading (offline)")
+    parser.add_argument('--reindex', action='store_true', help="Index images already extracted under --data-dir")
+    parser.add_argument('--data-dir', default="data")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--dedupe', choices=['content', 'perceptual'], default='content')
+    args = parser.parse_args()
+
+    if args.archive:
+        ingest_archive(args.archive, args.data_dir, num_workers=args.workers, dedupe=args.dedupe)
+        organize_dataset(args.data_dir)
+    elif args.reindex:
+        ingest_directory(args.data_dir, num_workers=args.workers, dedupe=args.dedupe)
+        organize_dataset(args.data_dir)
+    else:
+        download_brain_tumor_dataset(args.data_dir, num_workers=args.workers, dedupe=args.dedupe)
 
 if __name__ == "__main__":
-    download_brain_tumor_dataset()
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from gemini_explainer import ExplanationClient
+
+STUB_TEXT = (
+    "## Stub Analysis\n\n"
+    "This explanation was produced by the local explainer stub, not by Gemini. "
+    "It exists so the /analyze path can be exercised and benchmarked offline."
+)
+
+
+class StubExplanationClient(ExplanationClient):
+    """In-process client with configurable latency and failure rate"""
+
+    name = 'stub'
+
+    def __init__(self, latency_ms=500.0, jitter_ms=0.0, failure_rate=0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+
+    def _delay(self):
+        return max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    async def generate(self, prompt, images):
+        await asyncio.sleep(self._delay())
+        if self._random.random() < self.failure_rate:
+            raise RuntimeError("Stub explainer failure")
+        return STUB_TEXT
+
+
+def make_handler(latency_ms, jitter_ms, failure_rate):
+    client = StubExplanationClient(latency_ms, jitter_ms, failure_rate)
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+
+            time.sleep(client._delay())
+            if client._random.random() < client.failure_rate:
+                self.send_error(503, "Stub explainer failure")
+                return
+
+            body = json.dumps({"text": STUB_TEXT, "images": len(payload.get("images", []))}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def serve(host='127.0.0.1', port=8765, latency_ms=500.0, jitter_ms=0.0, failure_rate=0.0):
+    """Run the stub explanation server (for HttpExplanationClient) until interrupted"""
+    server = ThreadingHTTPServer((host, port), make_handler(latency_ms, jitter_ms, failure_rate))
+    print(f"🧪 Explainer stub on http://{host}:{port}/generate "
+          f"(latency {latency_ms}±{jitter_ms} ms, failure rate {failure_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=500.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.latency_ms, args.jitter_ms, args.failure_rate)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from tiered_cache import TieredCache
+
+
+def confidence_bucket(confidence):
+    """Confidence at the resolution the prompt shows it (``{confidence:.1%}``)"""
+    return round(float(confidence) * 1000)
+
+
+class ExplanationCache(TieredCache):
+    """Deduplicating cache for LLM explanations.
+
+    Entries are keyed on the explanation source (client and model), the
+    image content hash, the predicted class and the confidence bucket, which
+    together determine who answers and the prompt and image sent upstream. Entries expire after ``ttl`` seconds and the in-memory tier is
+    an LRU bounded by ``max_entries``; with ``disk_path`` they are written
+    through to SQLite so they survive restarts.
+
+    Concurrent requests for the same key share one upstream call: the first
+    caller runs the factory and the rest await its result. Each entry
+    remembers how long its upstream call took, so hits report the latency
+    they saved. Lookups and stores from the event loop move SQLite work
+    onto a thread.
+    """
+
+    def __init__(self, max_entries=1024, ttl=24 * 3600, disk_path=None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._expirations = 0
+        self._evictions = 0
+        self._saved_latency = 0.0
+        self._upstream_latency = 0.0
+
+        self._db = None
+        if disk_path:
+            Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(disk_path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS explanations ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "latency REAL NOT NULL, expires REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def key(self, image_hash, prediction_class, confidence, source='default'):
+        return f"{source}:{image_hash}:{prediction_class}:{confidence_bucket(confidence)}"
+
+    def get(self, key):
+        """Return a live cached explanation, or None (misses are counted by ``get_or_create``)"""
+        value = self._get_memory(key)
+        if value is not None or self._db is None:
+            return value
+
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, latency, expires FROM explanations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                encoded, latency, expires = bytes(row[0]), row[1], row[2]
+                if expires > now:
+                    self._store_memory(key, expires, encoded, latency)
+                    self._disk_hits += 1
+                    self._saved_latency += latency
+                    return json.loads(encoded)
+                self._db.execute("DELETE FROM explanations WHERE key = ?", (key,))
+                self._db.commit()
+                self._expirations += 1
+
+            return None
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, encoded, latency = entry
+            if expires <= time.time():
+                del self._entries[key]
+                self._expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            self._saved_latency += latency
+        return json.loads(encoded)
+
+    def set(self, key, value, latency=0.0):
+        encoded = json.dumps(value, separators=(',', ':')).encode()
+        expires = time.time() + self.ttl
+
+        with self._lock:
+            self._store_memory(key, expires, encoded, latency)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO explanations (key, value, latency, expires) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, encoded, latency, expires)
+                )
+                self._db.execute("DELETE FROM explanations WHERE expires <= ?", (time.time(),))
+                self._db.commit()
+
+    def _store_memory(self, key, expires, encoded, latency):
+        self._entries.pop(key, None)
+        self._entries[key] = (expires, encoded, latency)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    async def get_or_create(self, key, factory, cacheable=lambda value: True):
+        """Return the cached value for ``key`` or await ``factory()`` exactly once
+
+        The upstream call runs as one shared task that every caller awaits
+        through ``asyncio.shield``, so a caller that is cancelled (a client
+        disconnect) leaves the call running for the others. If the shared
+        task itself is cancelled, the callers still waiting start it again.
+        Results rejected by ``cacheable`` are still shared with the callers
+        that were waiting on them but are not stored.
+        """
+        cached = await self.get_async(key)
+        if cached is not None:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        # Tasks belong to one event loop; the sync explainer wrappers each run their own
+        flight_key = (loop, key)
+        while True:
+            with self._lock:
+                task = self._in_flight.get(flight_key)
+                if task is None:
+                    task = loop.create_task(self._create(flight_key, factory, cacheable))
+                    self._in_flight[flight_key] = task
+                    self._misses += 1
+                else:
+                    self._coalesced += 1
+
+            try:
+                return await asyncio.shield(task)
+            except asyncio.CancelledError:
+                if not task.cancelled():
+                    # This caller was cancelled; the shared call carries on
+                    raise
+
+    async def _create(self, flight_key, factory, cacheable):
+        start = time.perf_counter()
+        try:
+            value = await factory()
+            latency = time.perf_counter() - start
+            with self._lock:
+                self._upstream_latency += latency
+            if cacheable(value):
+                if self._db is not None:
+                    await asyncio.to_thread(self.set, flight_key[1], value, latency)
+                else:
+                    self.set(flight_key[1], value, latency)
+            return value
+        finally:
+            # Only after the value is stored, so no caller slips between the two
+            with self._lock:
+                if self._in_flight.get(flight_key) is asyncio.current_task():
+                    del self._in_flight[flight_key]
+
+    def get_stats(self):
+        """Hit/miss counters and the upstream latency avoided by hits"""
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._coalesced + self._misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "coalesced": self._coalesced,
+                "misses": self._misses,
+                "in_flight": len(self._in_flight),
+                "hit_rate": (self._hits + self._disk_hits + self._coalesced) / lookups if lookups else 0.0,
+                "expirations": self._expirations,
+                "evictions": self._evictions,
+                "saved_latency_s": round(self._saved_latency, 3),
+                "upstream_latency_s": round(self._upstream_latency, 3),
+                "disk_enabled": self._db is not None,
+            }
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,249 @@
+import argparse
+import copy
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+from torch.utils.data import DataLoader, TensorDataset
+
+FEATURE_CACHE_DIR = Path("data/feature_cache")
+
+
+def split_head(model):
+    """Return (frozen feature extractor, classification head) for a BrainTumorClassifier"""
+    extractor = copy.deepcopy(model)
+    backbone = extractor.backbone
+    if isinstance(getattr(backbone, 'fc', None), nn.Module):
+        head = model.backbone.fc
+        backbone.fc = nn.Identity()
+    elif isinstance(getattr(backbone, 'classifier', None), nn.Module):
+        head = model.backbone.classifier
+        backbone.classifier = nn.Identity()
+    else:
+        raise ValueError("Backbone has neither an 'fc' nor a 'classifier' head")
+
+    extractor.eval()
+    for parameter in extractor.parameters():
+        parameter.requires_grad_(False)
+    return extractor, head
+
+
+def backbone_hash(extractor):
+    """Hash of every backbone parameter and buffer (the head is excluded)"""
+    digest = hashlib.sha256()
+    for name, tensor in sorted(extractor.state_dict().items()):
+        digest.update(name.encode())
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def image_hash(path):
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+class FeatureCache:
+    """Pooled backbone features stored in a memory-mapped array
+
+    Rows are keyed by image content hash inside a directory named after the
+    backbone weights hash, so changing the backbone weights automatically
+    starts a fresh cache and stale directories are removed. Each image's
+    hash is remembered with its size and mtime in ``files.json``, so
+    unchanged images are not read again on later builds and loads.
+    """
+
+    def __init__(self, extractor, cache_dir=FEATURE_CACHE_DIR):
+        self.extractor = extractor
+        self.version = backbone_hash(extractor)
+        self.root = Path(cache_dir)
+        self.cache_dir = self.root / self.version
+        self.features_path = self.cache_dir / "features.npy"
+        self.index_path = self.cache_dir / "index.json"
+        self.index = json.loads(self.index_path.read_text()) if self.index_path.exists() else {}
+        # Shared by every backbone version: path -> [size, mtime_ns, content hash]
+        self.files_path = self.root / "files.json"
+        self.files = json.loads(self.files_path.read_text()) if self.files_path.exists() else {}
+        self._files_changed = False
+
+    def _content_hash(self, path):
+        """Content hash of an image, read again only when its size or mtime changed"""
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        entry = self.files.get(key)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = image_hash(path)
+        self.files[key] = [stat.st_size, stat.st_mtime_ns, digest]
+        self._files_changed = True
+        return digest
+
+    def _save_files(self):
+        if not self._files_changed:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.files_path.with_name("files.tmp.json")
+        tmp_path.write_text(json.dumps(self.files))
+        os.replace(tmp_path, self.files_path)
+        self._files_changed = False
+
+    def _prune_stale_versions(self):
+        if not self.root.exists():
+            return
+        for entry in self.root.iterdir():
+            if entry.is_dir() and entry.name != self.version:
+                shutil.rmtree(entry, ignore_errors=True)
+
+    def build(self, image_paths, transform, batch_size=64, num_workers=4, device='cpu'):
+        """Extract features for any images not yet cached; returns the number added"""
+        from train_model import BrainTumorDataset
+
+        self._prune_stale_versions()
+        hashes = [self._content_hash(path) for path in image_paths]
+        self._save_files()
+        missing = {}
+        for path, digest in zip(image_paths, hashes):
+            if digest not in self.index and digest not in missing:
+                missing[digest] = path
+        if not missing:
+            return 0
+
+        missing_hashes = list(missing)
+        dataset = BrainTumorDataset([missing[h] for h in missing_hashes], [0] * len(missing), transform)
+        loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+
+        extractor = self.extractor.to(device)
+        new_features = []
+        with torch.no_grad():
+            for images, _ in loader:
+                new_features.append(extractor(images.to(device)).float().cpu().numpy())
+        new_features = np.concatenate(new_features)
+
+        # Grow the array by writing a new memmap and swapping it in atomically
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        old_rows = len(self.index)
+        tmp_path = self.features_path.with_name("features.tmp.npy")
+        grown = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=np.float32,
+            shape=(old_rows + len(new_features), new_features.shape[1])
+        )
+        if old_rows:
+            grown[:old_rows] = np.load(self.features_path, mmap_mode='r')
+        grown[old_rows:] = new_features
+        grown.flush()
+        del grown
+        os.replace(tmp_path, self.features_path)
+
+        for offset, digest in enumerate(missing_hashes):
+            self.index[digest] = old_rows + offset
+        self.index_path.write_text(json.dumps(self.index))
+        return len(missing_hashes)
+
+    def load(self, image_paths):
+        """Return cached features for ``image_paths`` as a float tensor"""
+        features = np.load(self.features_path, mmap_mode='r')
+        rows = [self.index[self._content_hash(path)] for path in image_paths]
+        self._save_files()
+        return torch.from_numpy(np.ascontiguousarray(features[rows]))
+
+
+def train_head(head, train_features, train_labels, val_features, val_labels,
+               epochs=30, lr=0.001, batch_size=256):
+    """Train a classification head on cached features; returns per-epoch history
+
+    The head is left with the weights of its best validation epoch.
+    """
+    head.train()
+    for parameter in head.parameters():
+        parameter.requires_grad_(True)
+
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.Adam(head.parameters(), lr=lr)
+    loader = DataLoader(TensorDataset(train_features, train_labels), batch_size=batch_size, shuffle=True)
+    history = []
+    best_val_acc, best_state = -1.0, None
+
+    for epoch in range(epochs):
+        head.train()
+        running_loss = 0.0
+        for features, labels in loader:
+            optimizer.zero_grad()
+            loss = criterion(head(features), labels)
+            loss.backward()
+            optimizer.step()
+            running_loss += loss.item() * labels.size(0)
+
+        head.eval()
+        with torch.no_grad():
+            val_outputs = head(val_features)
+            val_loss = criterion(val_outputs, val_labels).item()
+            val_acc = 100 * (val_outputs.argmax(dim=1) == val_labels).float().mean().item()
+
+        history.append({
+            "epoch": epoch + 1,
+            "train_loss": running_loss / len(train_labels),
+            "val_loss": val_loss,
+            "val_acc": val_acc
+        })
+        print(f"Epoch {epoch+1}/{epochs}  Train Loss: {history[-1]['train_loss']:.4f}  "
+              f"Val Loss: {val_loss:.4f}  Val Acc: {val_acc:.2f}%")
+        if val_acc > best_val_acc:
+            best_val_acc, best_state = val_acc, copy.deepcopy(head.state_dict())
+
+    if best_state is not None:
+        head.load_state_dict(best_state)
+    return history
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrain the classification head on cached backbone features")
+    parser.add_argument('--model-name', choices=['resnet50', 'efficientnet'], default='resnet50')
+    parser.add_argument('--weights', help="Start from these model weights instead of ImageNet")
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--lr', type=float, default=0.001)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--cache-dir', default=str(FEATURE_CACHE_DIR))
+    parser.add_argument('--output', default=None, help="Where to save the full model")
+    args = parser.parse_args()
+
+    from sklearn.model_selection import train_test_split
+    from classifier import BrainTumorClassifier, load_state_dict_file
+    from train_model import build_transforms, find_training_images
+
+    model = BrainTumorClassifier(num_classes=4, model_name=args.model_name, pretrained=not args.weights)
+    if args.weights:
+        model.load_state_dict(load_state_dict_file(args.weights))
+
+    image_paths, labels = find_training_images()
+    train_paths, val_paths, train_labels, val_labels = train_test_split(
+        image_paths, labels, test_size=0.2, random_state=42, stratify=labels
+    )
+
+    extractor, head = split_head(model)
+    cache = FeatureCache(extractor, args.cache_dir)
+    print(f"🧊 Backbone version {cache.version}")
+    _, val_transform = build_transforms()
+    added = cache.build(image_paths, val_transform,
+                        device='cuda' if torch.cuda.is_available() else 'cpu')
+    print(f"💾 Feature cache: {added} images extracted, {len(cache.index) - added} reused")
+
+    history = train_head(
+        head,
+        cache.load(train_paths), torch.tensor(train_labels),
+        cache.load(val_paths), torch.tensor(val_labels),
+        epochs=args.epochs, lr=args.lr, batch_size=args.batch_size
+    )
+
+    # The head is shared with ``model``, so its state dict has the best trained head
+    output = args.output or f"models/head_retrained_{args.model_name}.pth"
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    torch.save(model.state_dict(), output)
+    print(f"✅ Best Val Acc: {max(h['val_acc'] for h in history):.2f}%  Model saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
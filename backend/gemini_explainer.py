@@ -1,22 +1,164 @@
 import os
-import google.generativeai as genai
+import asyncio
+import threading
+import time
+import weakref
+import requests
 from dotenv import load_dotenv
 import base64
 import io
 from PIL import Image
 import json
 
+from metrics import ERRORS_TOTAL, STAGE_SECONDS
+
 load_dotenv()
 
-class GeminiExplainer:
-    def __init__(self):
-        # Configure Gemini API
-        api_key = os.getenv('GEMINI_API_KEY')
+
+class ExplanationClient:
+    """Interface for the LLM backend used by ``GeminiExplainer``
+    
+    Implementations return the generated text for a prompt and a list of
+    PIL images; exceptions are treated as failures by the circuit breaker.
+    ``name`` identifies the backend and model in explanation cache keys.
+    """
+    
+    name = 'custom'
+    
+    async def generate(self, prompt, images):
+        raise NotImplementedError
+
+
+class GeminiClient(ExplanationClient):
+    """Google Gemini through the async ``generate_content_async`` API"""
+    
+    def __init__(self, model_name='gemini-1.5-flash', api_key=None):
+        api_key = api_key or os.getenv('GEMINI_API_KEY')
         if not api_key:
             raise ValueError("GEMINI_API_KEY not found in environment variables")
         
+        # Imported on first use: the SDK (and its gRPC stack) is slow to import
+        import google.generativeai as genai
+        
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash')
+        self.model = genai.GenerativeModel(model_name)
+        self.name = f"gemini:{model_name}"
+    
+    async def generate(self, prompt, images):
+        response = await self.model.generate_content_async([prompt, *images])
+        return response.text
+
+
+class HttpExplanationClient(ExplanationClient):
+    """Client for an HTTP explanation service such as ``explainer_stub.py``
+    
+    POSTs ``{"prompt", "images"}`` (base64 PNGs) to ``url`` and reads
+    ``{"text"}`` back; the blocking request runs on a worker thread. Keep
+    ``timeout`` no larger than the explainer's: a thread the explainer has
+    stopped waiting for keeps running until it, holding a default-executor
+    slot.
+    """
+    
+    def __init__(self, url, timeout=30.0):
+        self.url = url
+        self.timeout = timeout
+        self.name = f"http:{url}"
+        self.session = requests.Session()
+    
+    def _post(self, prompt, images):
+        payload = {"prompt": prompt, "images": [encode_png_base64(image) for image in images]}
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["text"]
+    
+    async def generate(self, prompt, images):
+        return await asyncio.to_thread(self._post, prompt, images)
+
+
+def encode_png_base64(image):
+    """Convert PIL image to base64 string"""
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode()
+
+
+class CircuitBreaker:
+    """Stops calling a failing backend for ``reset_timeout`` seconds
+    
+    Opens after ``failure_threshold`` consecutive failures; once the reset
+    timeout passes a single trial call is let through (half-open), which
+    closes the breaker on success or re-opens it on failure.
+    """
+    
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+    
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+    
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+    
+    def allow(self):
+        """True to call the backend ("trial" for the half-open probe), False to short-circuit"""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return "trial"
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+    
+    def release(self):
+        """Free the half-open trial slot after a call that ended with no outcome (cancelled)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+class GeminiExplainer:
+    def __init__(self, client=None, max_concurrency=4, timeout=30.0, failure_threshold=5,
+                 reset_timeout=30.0, cache=None):
+        # Configure the LLM client (Gemini unless another one is plugged in)
+        self.client = client if client is not None else GeminiClient()
+        self.cache = cache
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        
+        # One semaphore per event loop: asyncio primitives are loop-bound and
+        # the sync wrapper runs calls on private loops
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._calls = 0
+        self._failures = 0
+        self._timeouts = 0
+        self._short_circuited = 0
         
         self.class_descriptions = {
             'glioma': {
@@ -43,21 +185,43 @@ class GeminiExplainer:
     
     def image_to_base64(self, image):
         """Convert PIL image to base64 string"""
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        return img_str
+        return encode_png_base64(image)
     
-    def generate_explanation(self, image, prediction_class, confidence, saliency_map=None):
-        """Generate detailed explanation using Gemini 1.5 Flash"""
-        
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+    
+    def _count(self, counter, delta=1):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + delta)
+    
+    def get_stats(self):
+        with self._stats_lock:
+            return {
+                "client": type(self.client).__name__,
+                "circuit": self.breaker.state,
+                "max_concurrency": self.max_concurrency,
+                "timeout_s": self.timeout,
+                "in_flight": self._in_flight,
+                "calls": self._calls,
+                "failures": self._failures,
+                "timeouts": self._timeouts,
+                "short_circuited": self._short_circuited,
+                "cache": self.cache.get_stats() if self.cache is not None else None
+            }
+    
+    def build_prompt(self, prediction_class, confidence):
+        """Single-image analysis prompt for the predicted class"""
         class_info = self.class_descriptions.get(prediction_class, {})
         class_name = class_info.get('name', prediction_class)
         class_desc = class_info.get('description', '')
         characteristics = class_info.get('characteristics', [])
         
-        # Prepare the prompt
-        prompt = f"""
+        return f"""
         You are an expert radiologist AI assistant analyzing brain MRI scans. 
         
         ANALYSIS CONTEXT:
@@ -92,61 +256,122 @@ class GeminiExplainer:
         Please write in a professional but accessible tone, suitable for both medical professionals and informed patients.
         Keep your response detailed but well-structured with clear sections.
         """
+    
+    def _structure_response(self, prediction_class, confidence, explanation, error=None):
+        class_info = self.class_descriptions.get(prediction_class, {})
+        response = {
+            "prediction": {
+                "class": class_info.get('name', prediction_class),
+                "confidence": confidence,
+                "raw_class": prediction_class
+            },
+            "explanation": explanation,
+            "class_info": class_info,
+            "technical_details": {
+                "model_type": "Transfer Learning CNN",
+                "architecture": "ResNet-50",
+                "preprocessing": "224x224 resize, normalization",
+                "confidence_threshold": 0.7
+            }
+        }
+        if error is not None:
+            response["error"] = error
+        return response
+    
+    def _fallback_response(self, prediction_class, confidence, error):
+        class_info = self.class_descriptions.get(prediction_class, {})
+        fallback_explanation = self._generate_fallback_explanation(
+            prediction_class, confidence, class_info
+        )
+        return self._structure_response(prediction_class, confidence, fallback_explanation, error)
+    
+    def _cache_key(self, image_hash, prediction_class, confidence):
+        # Explanations from one client or model are never served for another
+        return self.cache.key(image_hash, prediction_class, confidence, source=self.client.name)
+    
+    async def cached_explanation(self, image_hash, prediction_class, confidence):
+        """Cached explanation for this image and prediction, or None"""
+        if self.cache is None:
+            return None
+        return await self.cache.get_async(self._cache_key(image_hash, prediction_class, confidence))
+    
+    async def generate_explanation_async(self, image, prediction_class, confidence, saliency_map=None,
+                                         image_hash=None):
+        """Generate detailed explanation without blocking the event loop
+        
+        At most ``max_concurrency`` calls run at once per event loop, each is
+        cancelled after ``timeout`` seconds, and while the circuit breaker is
+        open the fallback explanation is returned without calling the client.
+        With a cache and the upload's ``image_hash``, identical requests are
+        answered from the cache or share one in-flight call; fallback
+        explanations are never cached.
+        """
+        if self.cache is None or image_hash is None:
+            return await self._generate_explanation_async(image, prediction_class, confidence)
+        
+        return await self.cache.get_or_create(
+            self._cache_key(image_hash, prediction_class, confidence),
+            lambda: self._generate_explanation_async(image, prediction_class, confidence),
+            cacheable=lambda response: "error" not in response
+        )
+    
+    async def _call_client(self, prompt, images):
+        """Run one guarded client call; returns (text, None) or (None, error message)"""
+        admission = self.breaker.allow()
+        if not admission:
+            self._count('_short_circuited')
+            return None, "Gemini API unavailable: circuit open after repeated failures"
         
         try:
-            # Convert image to appropriate format for Gemini
-            if isinstance(image, Image.Image):
-                # Image is already a PIL Image
-                response = self.model.generate_content([prompt, image])
-            else:
-                # Assume it's a file path or needs conversion
-                if isinstance(image, str):
-                    image = Image.open(image)
-                response = self.model.generate_content([prompt, image])
-            
-            explanation = response.text
-            
-            # Structure the response
-            structured_response = {
-                "prediction": {
-                    "class": class_name,
-                    "confidence": confidence,
-                    "raw_class": prediction_class
-                },
-                "explanation": explanation,
-                "class_info": class_info,
-                "technical_details": {
-                    "model_type": "Transfer Learning CNN",
-                    "architecture": "ResNet-50",
-                    "preprocessing": "224x224 resize, normalization",
-                    "confidence_threshold": 0.7
-                }
-            }
-            
-            return structured_response
-            
-        except Exception as e:
+            async with self._semaphore():
+                self._count('_in_flight')
+                self._count('_calls')
+                start = time.perf_counter()
+                try:
+                    text = await asyncio.wait_for(self.client.generate(prompt, images), self.timeout)
+                except asyncio.TimeoutError:
+                    self._count('_timeouts')
+                    self._count('_failures')
+                    ERRORS_TOTAL.inc(stage='explanation')
+                    self.breaker.record_failure()
+                    return None, f"Gemini API unavailable: timed out after {self.timeout}s"
+                except Exception as e:
+                    self._count('_failures')
+                    ERRORS_TOTAL.inc(stage='explanation')
+                    self.breaker.record_failure()
+                    return None, f"Gemini API unavailable: {str(e)}"
+                finally:
+                    self._count('_in_flight', -1)
+                    STAGE_SECONDS.observe(time.perf_counter() - start, stage='explanation')
+        except asyncio.CancelledError:
+            # Neither a success nor a failure, but a half-open trial must not stay claimed
+            if admission == "trial":
+                self.breaker.release()
+            raise
+        
+        self.breaker.record_success()
+        return text, None
+    
+    async def _generate_explanation_async(self, image, prediction_class, confidence):
+        if isinstance(image, str):
+            image = Image.open(image)
+        
+        prompt = self.build_prompt(prediction_class, confidence)
+        explanation, error = await self._call_client(prompt, [image])
+        if error is not None:
             # Fallback explanation if Gemini API fails
-            fallback_explanation = self._generate_fallback_explanation(
-                prediction_class, confidence, class_info
-            )
-            
-            return {
-                "prediction": {
-                    "class": class_name,
-                    "confidence": confidence,
-                    "raw_class": prediction_class
-                },
-                "explanation": fallback_explanation,
-                "class_info": class_info,
-                "error": f"Gemini API unavailable: {str(e)}",
-                "technical_details": {
-                    "model_type": "Transfer Learning CNN",
-                    "architecture": "ResNet-50",
-                    "preprocessing": "224x224 resize, normalization",
-                    "confidence_threshold": 0.7
-                }
-            }
+            return self._fallback_response(prediction_class, confidence, error)
+        return self._structure_response(prediction_class, confidence, explanation)
+    
+    def generate_explanation(self, image, prediction_class, confidence, saliency_map=None, image_hash=None):
+        """Generate detailed explanation using Gemini 1.5 Flash (blocking)
+        
+        Must not be called from a running event loop; use
+        ``generate_explanation_async`` there.
+        """
+        return asyncio.run(
+            self.generate_explanation_async(image, prediction_class, confidence, saliency_map, image_hash)
+        )
     
     def _generate_fallback_explanation(self, prediction_class, confidence, class_info):
         """Generate a fallback explanation when Gemini API is unavailable"""
@@ -190,11 +415,12 @@ class GeminiExplainer:
         
         return explanation.strip()
     
-    def generate_comparison_analysis(self, images_with_predictions):
-        """Generate comparative analysis for multiple images"""
-        
-        if len(images_with_predictions) < 2:
-            return "Comparison requires at least 2 images"
+    def build_comparison_prompt(self, images_with_predictions):
+        """Multi-scan comparison prompt listing each scan's prediction"""
+        scan_lines = []
+        for i, (_, pred_class, confidence) in enumerate(images_with_predictions):
+            class_name = self.class_descriptions.get(pred_class, {}).get('name', pred_class)
+            scan_lines.append(f"        - Scan {i + 1}: {class_name} ({confidence:.1%} confidence)")
         
         prompt = f"""
         You are analyzing multiple brain MRI scans for comparison. 
@@ -207,23 +433,66 @@ class GeminiExplainer:
         
         Number of scans: {len(images_with_predictions)}
         """
+        # The scans are attached in this order after the prompt
+        return prompt + "\n        Model predictions:\n" + "\n".join(scan_lines) + "\n"
+    
+    def _generate_fallback_comparison(self, images_with_predictions):
+        """Plain summary of the predictions when the comparison call fails"""
+        lines = []
+        for i, (_, pred_class, confidence) in enumerate(images_with_predictions):
+            class_name = self.class_descriptions.get(pred_class, {}).get('name', pred_class)
+            lines.append(f"• Scan {i + 1}: {class_name} ({confidence:.1%})")
+        classes = {pred_class for _, pred_class, _ in images_with_predictions}
+        consistency = (
+            "All scans received the same classification."
+            if len(classes) == 1 else
+            "The scans received different classifications; review them side by side with a radiologist."
+        )
+        return "## Comparison Summary\n\n" + "\n".join(lines) + "\n\n" + consistency
+    
+    async def generate_comparison_analysis_async(self, images_with_predictions, image_hashes=None):
+        """Generate comparative analysis for multiple images concurrently
+        
+        The per-scan explanations and one combined multi-image comparison
+        call are issued together; the explainer's semaphore bounds how many
+        reach the client at once and each call has the explainer timeout.
+        Individual analyses keep the input order.
+        """
+        
+        if len(images_with_predictions) < 2:
+            return "Comparison requires at least 2 images"
+        
+        image_hashes = image_hashes or [None] * len(images_with_predictions)
         
         try:
-            # For now, return a structured comparison
+            individual = [
+                self.generate_explanation_async(image, pred_class, confidence, image_hash=image_hash)
+                for (image, pred_class, confidence), image_hash in zip(images_with_predictions, image_hashes)
+            ]
+            combined = self._call_client(
+                self.build_comparison_prompt(images_with_predictions),
+                [image for image, _, _ in images_with_predictions]
+            )
+            *analyses, (comparison_text, comparison_error) = await asyncio.gather(*individual, combined)
+            
             comparison = {
                 "summary": "Comparative analysis of brain MRI scans",
                 "scan_count": len(images_with_predictions),
-                "individual_analyses": []
+                "comparison": comparison_text,
+                "individual_analyses": [
+                    {"scan_number": i + 1, "analysis": analysis}
+                    for i, analysis in enumerate(analyses)
+                ]
             }
-            
-            for i, (image, pred_class, confidence) in enumerate(images_with_predictions):
-                analysis = self.generate_explanation(image, pred_class, confidence)
-                comparison["individual_analyses"].append({
-                    "scan_number": i + 1,
-                    "analysis": analysis
-                })
+            if comparison_error is not None:
+                comparison["comparison"] = self._generate_fallback_comparison(images_with_predictions)
+                comparison["error"] = comparison_error
             
             return comparison
             
         except Exception as e:
             return f"Error generating comparison: {str(e)}"
+    
+    def generate_comparison_analysis(self, images_with_predictions, image_hashes=None):
+        """Generate comparative analysis for multiple images (blocking)"""
+        return asyncio.run(self.generate_comparison_analysis_async(images_with_predictions, image_hashes))
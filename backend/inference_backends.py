@@ -0,0 +1,260 @@
+import argparse
+import copy
+import json
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from result_cache import weights_version
+
+BACKENDS = ('eager', 'dynamic_int8', 'static_int8', 'torchscript', 'compile', 'onnx')
+ARTIFACT_DIR = Path("models/backends")
+VALIDATION_REPORT = ARTIFACT_DIR / "validation.json"
+INPUT_SHAPE = (1, 3, 224, 224)
+
+
+class OnnxRuntimeModule(nn.Module):
+    """Runs an exported ONNX graph through onnxruntime behind the nn.Module interface"""
+
+    def __init__(self, onnx_path, num_threads=None):
+        super(OnnxRuntimeModule, self).__init__()
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = int(num_threads)
+        self.session = ort.InferenceSession(
+            str(onnx_path), options, providers=['CPUExecutionProvider']
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def forward(self, x):
+        outputs = self.session.run(None, {self.input_name: x.detach().cpu().numpy()})[0]
+        return torch.from_numpy(outputs)
+
+
+def artifact_path(backend, artifact_dir=ARTIFACT_DIR):
+    """File an exported backend is stored in, or None for backends built at load time"""
+    suffixes = {'static_int8': '.pt', 'torchscript': '.pt', 'onnx': '.onnx'}
+    if backend not in suffixes:
+        return None
+    return Path(artifact_dir) / f"{backend}{suffixes[backend]}"
+
+
+def _quantization_engine():
+    engines = torch.backends.quantized.supported_engines
+    for engine in ('x86', 'fbgemm', 'qnnpack'):
+        if engine in engines:
+            return engine
+    raise RuntimeError(f"No supported quantization engine in {engines}")
+
+
+def build_backend(model, backend, calibration_loader=None, num_calibration_batches=10,
+                  artifact_dir=ARTIFACT_DIR):
+    """Build a CPU inference backend from the eager model, exporting artifacts if needed
+
+    ``static_int8`` needs a ``calibration_loader``; its observers see at most
+    ``num_calibration_batches`` batches. The eager model is never modified.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', choose from {BACKENDS}")
+    if backend == 'eager':
+        return model
+
+    model = copy.deepcopy(model).cpu().eval()
+    example_input = torch.randn(*INPUT_SHAPE)
+    path = artifact_path(backend, artifact_dir)
+    if path is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    if backend == 'dynamic_int8':
+        # Dynamic quantization only covers nn.Linear; on these CNNs that is just the
+        # classifier head, so the convolutions stay fp32 and speedups are negligible.
+        # static_int8 is the backend that quantizes the convolutions.
+        torch.backends.quantized.engine = _quantization_engine()
+        return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    if backend == 'static_int8':
+        if calibration_loader is None:
+            raise ValueError("static_int8 needs a calibration loader")
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+        engine = _quantization_engine()
+        torch.backends.quantized.engine = engine
+        prepared = prepare_fx(model, get_default_qconfig_mapping(engine), (example_input,))
+        with torch.no_grad():
+            for batch_index, (images, _) in enumerate(calibration_loader):
+                if batch_index >= num_calibration_batches:
+                    break
+                prepared(images)
+        quantized = convert_fx(prepared)
+
+        # Persist as TorchScript so serving never needs calibration data
+        scripted = torch.jit.freeze(torch.jit.trace(quantized, example_input))
+        torch.jit.save(scripted, str(path))
+        return scripted
+
+    if backend == 'torchscript':
+        with torch.no_grad():
+            scripted = torch.jit.trace(model, example_input)
+        scripted = torch.jit.optimize_for_inference(torch.jit.freeze(scripted))
+        torch.jit.save(scripted, str(path))
+        return scripted
+
+    if backend == 'compile':
+        return torch.compile(model)
+
+    # onnx
+    torch.onnx.export(
+        model, example_input, str(path),
+        input_names=['input'], output_names=['logits'],
+        dynamic_axes={'input': {0: 'batch'}, 'logits': {0: 'batch'}},
+        opset_version=17
+    )
+    return OnnxRuntimeModule(path)
+
+
+def load_backend(model, backend, artifact_dir=ARTIFACT_DIR, num_threads=None):
+    """Load a previously validated backend for serving"""
+    if backend in ('eager', 'dynamic_int8', 'compile'):
+        return build_backend(model, backend, artifact_dir=artifact_dir)
+
+    path = artifact_path(backend, artifact_dir)
+    if not path.exists():
+        raise FileNotFoundError(f"No exported {backend} model at {path}")
+    if backend == 'onnx':
+        return OnnxRuntimeModule(path, num_threads=num_threads)
+
+    if backend == 'static_int8':
+        torch.backends.quantized.engine = _quantization_engine()
+    return torch.jit.load(str(path), map_location='cpu')
+
+
+def validate_backend(eager_model, backend_model, loader, max_batches=None):
+    """Compare backend predictions against eager predictions on a labelled loader"""
+    eager_model = eager_model.cpu().eval()
+    total = agree = eager_correct = backend_correct = 0
+    max_prob_diff = 0.0
+    eager_seconds = backend_seconds = 0.0
+
+    with torch.no_grad():
+        for batch_index, (images, labels) in enumerate(loader):
+            if max_batches is not None and batch_index >= max_batches:
+                break
+
+            start = time.perf_counter()
+            eager_probs = F.softmax(eager_model(images), dim=1)
+            eager_seconds += time.perf_counter() - start
+
+            start = time.perf_counter()
+            backend_probs = F.softmax(backend_model(images).float(), dim=1)
+            backend_seconds += time.perf_counter() - start
+
+            eager_pred = eager_probs.argmax(dim=1)
+            backend_pred = backend_probs.argmax(dim=1)
+            total += labels.size(0)
+            agree += (eager_pred == backend_pred).sum().item()
+            eager_correct += (eager_pred == labels).sum().item()
+            backend_correct += (backend_pred == labels).sum().item()
+            max_prob_diff = max(max_prob_diff, (eager_probs - backend_probs).abs().max().item())
+
+    if total == 0:
+        raise ValueError("Validation loader produced no samples")
+
+    return {
+        "samples": total,
+        "agreement": agree / total,
+        "max_probability_diff": max_prob_diff,
+        "eager_accuracy": eager_correct / total,
+        "backend_accuracy": backend_correct / total,
+        "eager_ms_per_image": 1000 * eager_seconds / total,
+        "backend_ms_per_image": 1000 * backend_seconds / total,
+    }
+
+
+def read_validation_report(report_path=VALIDATION_REPORT):
+    path = Path(report_path)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def is_backend_validated(backend, version, report_path=VALIDATION_REPORT):
+    """A backend may serve only if it passed validation for these exact weights"""
+    if backend == 'eager':
+        return True
+    entry = read_validation_report(report_path).get(backend)
+    return bool(entry and entry.get("passed") and entry.get("weights_version") == version)
+
+
+def record_validation(backend, version, metrics, passed, report_path=VALIDATION_REPORT):
+    report = read_validation_report(report_path)
+    report[backend] = {
+        "weights_version": version,
+        "passed": passed,
+        "validated_at": datetime.now(timezone.utc).isoformat(),
+        **metrics,
+    }
+    path = Path(report_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build and validate a CPU inference backend")
+    parser.add_argument('--backend', required=True, choices=[b for b in BACKENDS if b != 'eager'])
+    parser.add_argument('--model-path', default="models/best_brain_tumor_model.pth")
+    parser.add_argument('--min-agreement', type=float, default=0.99,
+                        help="Minimum top-1 agreement with eager predictions")
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.01,
+                        help="Maximum allowed drop in validation accuracy")
+    parser.add_argument('--calibration-batches', type=int, default=10)
+    parser.add_argument('--max-batches', type=int, default=None,
+                        help="Limit validation to this many batches")
+    args = parser.parse_args()
+
+    from classifier import BrainTumorClassifier, load_state_dict_file
+    from train_model import prepare_data
+
+    model_path = Path(args.model_path)
+    if not model_path.exists():
+        raise SystemExit(f"❌ Model weights not found at {model_path}")
+    version = weights_version(model_path)
+
+    model = BrainTumorClassifier(num_classes=4, model_name='resnet50', pretrained=False)
+    model.load_state_dict(load_state_dict_file(model_path))
+    model.eval()
+
+    print("📊 Preparing validation data...")
+    _, val_loader = prepare_data()
+
+    print(f"🏗️  Building {args.backend} backend...")
+    backend_model = build_backend(
+        model, args.backend,
+        calibration_loader=val_loader,
+        num_calibration_batches=args.calibration_batches
+    )
+
+    print("🔍 Comparing against eager predictions...")
+    metrics = validate_backend(model, backend_model, val_loader, max_batches=args.max_batches)
+    passed = (
+        metrics["agreement"] >= args.min_agreement
+        and metrics["eager_accuracy"] - metrics["backend_accuracy"] <= args.max_accuracy_drop
+    )
+    record_validation(args.backend, version, metrics, passed)
+
+    print(json.dumps(metrics, indent=2))
+    if passed:
+        print(f"✅ {args.backend} passed validation and can be enabled with INFERENCE_BACKEND={args.backend}")
+    else:
+        print(f"❌ {args.backend} failed validation and will not be enabled")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
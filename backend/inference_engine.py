@@ -0,0 +1,206 @@
+import asyncio
+import time
+from collections import deque
+
+import torch
+import torch.nn.functional as F
+
+from inference_executor import ExecutorSaturatedError
+from metrics import STAGE_SECONDS
+from profiling import current_profile
+
+
+class BatchingStats:
+    """Rolling batch-size and queue-wait statistics for the inference engine"""
+
+    def __init__(self, window=1000):
+        self.batches = 0
+        self.items = 0
+        self.batch_size_counts = {}
+        self.max_queue_wait_ms = 0.0
+        self.recent_batch_sizes = deque(maxlen=window)
+        self.recent_queue_waits_ms = deque(maxlen=window)
+        self.recent_forward_ms = deque(maxlen=window)
+
+    def record(self, batch_size, queue_waits_ms, forward_ms):
+        self.batches += 1
+        self.items += batch_size
+        self.batch_size_counts[batch_size] = self.batch_size_counts.get(batch_size, 0) + 1
+        self.max_queue_wait_ms = max(self.max_queue_wait_ms, max(queue_waits_ms))
+        self.recent_batch_sizes.append(batch_size)
+        self.recent_queue_waits_ms.extend(queue_waits_ms)
+        self.recent_forward_ms.append(forward_ms)
+
+    @staticmethod
+    def _percentile(values, q):
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self):
+        waits = list(self.recent_queue_waits_ms)
+        sizes = list(self.recent_batch_sizes)
+        forwards = list(self.recent_forward_ms)
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "recent_mean_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+            "batch_size_counts": dict(sorted(self.batch_size_counts.items())),
+            "queue_wait_ms": {
+                "mean": sum(waits) / len(waits) if waits else 0.0,
+                "p50": self._percentile(waits, 0.50),
+                "p99": self._percentile(waits, 0.99),
+                "max": self.max_queue_wait_ms,
+            },
+            "forward_ms": {
+                "mean": sum(forwards) / len(forwards) if forwards else 0.0,
+                "p50": self._percentile(forwards, 0.50),
+                "p99": self._percentile(forwards, 0.99),
+            },
+        }
+
+
+class BatchingInferenceEngine:
+    """Groups concurrent single-image requests into batched forward passes.
+
+    Callers submit preprocessed (3, H, W) tensors with ``predict``. A background
+    task collects queued tensors until ``max_batch_size`` is reached or
+    ``max_wait_ms`` has passed since the first one arrived, runs one forward
+    pass on the ``InferenceExecutor``, and resolves each caller with its own
+    row of softmax probabilities. At most ``max_queue_size`` requests may be
+    waiting; beyond that ``predict`` raises ``ExecutorSaturatedError``.
+    """
+
+    def __init__(self, model, device, executor, max_batch_size=16, max_wait_ms=5.0,
+                 max_queue_size=256):
+        self.model = model
+        self.device = device
+        self.executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_queue_size = max(1, int(max_queue_size))
+        self.stats = BatchingStats()
+        self._queue = None
+        self._worker = None
+
+    @property
+    def running(self):
+        return self._worker is not None and not self._worker.done()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        """Start the background batching task on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching task and fail any requests still queued"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        while self._queue is not None and not self._queue.empty():
+            _, future, _, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Inference engine stopped"))
+
+    async def predict(self, image_tensor):
+        """Queue a preprocessed image tensor and wait for its softmax probabilities
+
+        A request being profiled carries its session into the queue, so the
+        batched forward pass it joins is profiled too (including the other
+        requests' rows in that batch).
+        """
+        if not self.running:
+            raise RuntimeError("Inference engine is not running")
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((image_tensor, future, time.perf_counter(), current_profile.get()))
+        except asyncio.QueueFull:
+            raise ExecutorSaturatedError(
+                f"Batching queue is full ({self.max_queue_size} waiting requests)"
+            )
+        return await future
+
+    async def _collect_batch(self):
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            # Drop requests whose callers went away while they were queued
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+
+            dispatched = time.perf_counter()
+            queue_waits_ms = [(dispatched - enqueued) * 1000 for _, _, enqueued, _ in batch]
+
+            # This task outlives requests, so hand it a profiled request's session explicitly
+            session = next((item[3] for item in batch if item[3] is not None), None)
+            token = current_profile.set(session)
+            try:
+                # Batches are already admission-controlled by the queue bound
+                probabilities = await self.executor.run(
+                    self.forward, [tensor for tensor, _, _, _ in batch], bounded=False
+                )
+            except Exception as e:
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                current_profile.reset(token)
+
+            forward_ms = (time.perf_counter() - dispatched) * 1000
+            self.stats.record(len(batch), queue_waits_ms, forward_ms)
+
+            for row, (_, future, _, _) in zip(probabilities, batch):
+                if not future.done():
+                    future.set_result(row)
+
+    def forward(self, tensors):
+        """Run one batched forward pass over a list of image tensors (blocking)"""
+        with torch.no_grad(), STAGE_SECONDS.time(stage='forward'):
+            image_batch = torch.stack(tensors).to(self.device)
+            outputs = self.model(image_batch)
+            return F.softmax(outputs, dim=1).cpu()
+
+    def get_stats(self):
+        """Return batching configuration and rolling statistics"""
+        return {
+            "running": self.running,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self.queue_depth,
+            "max_queue_size": self.max_queue_size,
+            **self.stats.snapshot(),
+        }
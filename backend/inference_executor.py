@@ -0,0 +1,131 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from profiling import current_profile
+
+
+class ExecutorSaturatedError(RuntimeError):
+    """Raised when the inference queue is full and a request must be shed"""
+
+
+class InferenceExecutor:
+    """Bounded thread pool that runs blocking model work off the event loop.
+
+    Each worker thread sets its own intra-op thread count so concurrent
+    forward passes split the CPU cores instead of oversubscribing them.
+    At most ``max_pending`` bounded jobs may be queued or running at once;
+    further submissions fail fast with ``ExecutorSaturatedError``.
+    """
+
+    def __init__(self, num_workers=2, max_pending=32, threads_per_worker=None):
+        self.num_workers = max(1, int(num_workers))
+        self.max_pending = max(1, int(max_pending))
+        if threads_per_worker is None:
+            threads_per_worker = max(1, (os.cpu_count() or 1) // self.num_workers)
+        self.threads_per_worker = int(threads_per_worker)
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.num_workers,
+            thread_name_prefix="inference",
+            initializer=torch.set_num_threads,
+            initargs=(self.threads_per_worker,)
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._unbounded = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._busy_seconds = 0.0
+        self._started_at = time.monotonic()
+
+    async def run(self, fn, *args, bounded=True):
+        """Run ``fn(*args)`` on a worker thread and await the result.
+
+        Bounded jobs count against ``max_pending`` and are rejected when the
+        queue is full. Callers that already apply their own admission
+        control (such as the batching engine) pass ``bounded=False``.
+        Jobs submitted while a request is being profiled run under that
+        request's profiler.
+        """
+        session = current_profile.get()
+        if session is not None:
+            fn = session.wrap(fn)
+
+        with self._lock:
+            if bounded and self._pending >= self.max_pending:
+                self._rejected += 1
+                raise ExecutorSaturatedError(
+                    f"Inference queue is full ({self.max_pending} pending jobs)"
+                )
+            if bounded:
+                self._pending += 1
+            else:
+                self._unbounded += 1
+
+        release = self._release if bounded else self._release_unbounded
+        try:
+            future = self._pool.submit(self._call, fn, *args)
+        except BaseException:
+            release()
+            raise
+        # Released when the job really ends (or is cancelled before starting),
+        # not when the caller stops waiting: a disconnected client's job still
+        # occupies a worker
+        future.add_done_callback(release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def _release_unbounded(self, future=None):
+        with self._lock:
+            self._unbounded -= 1
+
+    def _call(self, fn, *args):
+        with self._lock:
+            self._active += 1
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+        else:
+            with self._lock:
+                self._completed += 1
+            return result
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._busy_seconds += time.perf_counter() - start
+
+    def shutdown(self, wait=True):
+        """Stop accepting work and release the worker threads"""
+        self._pool.shutdown(wait=wait)
+
+    def get_stats(self):
+        """Return pool sizing and utilization counters"""
+        with self._lock:
+            uptime = max(time.monotonic() - self._started_at, 1e-9)
+            return {
+                "workers": self.num_workers,
+                "threads_per_worker": self.threads_per_worker,
+                "active": self._active,
+                "pending": self._pending,
+                "unbounded_pending": self._unbounded,
+                "max_pending": self.max_pending,
+                "utilization": self._active / self.num_workers,
+                "busy_fraction": min(1.0, self._busy_seconds / (uptime * self.num_workers)),
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+            }
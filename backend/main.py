@@ -1,22 +1,46 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import time
+
+# Measured before anything heavy is imported, for the startup report
+_import_start = time.perf_counter()
+
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
 import torch
 import torch.nn.functional as F
 from torchvision import transforms
 from PIL import Image
-import numpy as np
 import io
 import base64
 import json
+import os
+import asyncio
+import random
+import secrets
+import zipfile
 from pathlib import Path
+from typing import List, Optional
 import logging
 
 # Import our custom modules
-from train_model import BrainTumorClassifier
+from classifier import BrainTumorClassifier, load_state_dict_file
 from saliency_maps import SaliencyMapGenerator
-from gemini_explainer import GeminiExplainer
+from gemini_explainer import GeminiExplainer, HttpExplanationClient
+from explainer_stub import StubExplanationClient
+from explanation_cache import ExplanationCache
+from inference_engine import BatchingInferenceEngine
+from inference_executor import InferenceExecutor, ExecutorSaturatedError
+from result_cache import ResultCache, content_hash, weights_version
+from inference_backends import BACKENDS, is_backend_validated, load_backend
+from map_transport import (
+    MAP_ENCODINGS, EncodedMap, MapStore, encode_map, encode_msgpack, encode_multipart,
+    encoding_id, json_maps, negotiate_format
+)
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, ERRORS_TOTAL, REGISTRY, STAGE_SECONDS
+from profiling import ProfileStore, current_profile
+
+IMPORT_SECONDS = time.perf_counter() - _import_start
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -37,13 +61,156 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request-level metrics (stage histograms live in metrics.py)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "brain_tumor_request_seconds", "End-to-end request latency until the response starts",
+    ["method", "endpoint"]
+)
+REQUESTS_TOTAL = REGISTRY.counter(
+    "brain_tumor_requests_total", "Requests by endpoint and status code", ["method", "endpoint", "status"]
+)
+IN_FLIGHT = REGISTRY.gauge("brain_tumor_in_flight_requests", "Requests currently being handled")
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time every request and count it by route template (not raw path, to bound cardinality)"""
+    IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        endpoint = getattr(route, "path", "unmatched")
+        REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, endpoint=endpoint)
+        REQUESTS_TOTAL.inc(method=request.method, endpoint=endpoint, status=status)
+
+# Opt-in profiling: off by default, and when off the middleware is not even installed
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '20'))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN', '')
+
+profile_store = ProfileStore(PROFILE_DIR, PROFILE_MAX_FILES)
+
+def is_admin(token):
+    """Admin endpoints and forced profiling need PROFILE_ADMIN_TOKEN; without one they stay closed"""
+    return bool(PROFILE_ADMIN_TOKEN) and secrets.compare_digest(token or "", PROFILE_ADMIN_TOKEN)
+
+async def profile_request(request: Request, call_next):
+    """Profile requests that ask for it (``X-Profile: 1``) or are randomly sampled"""
+    # Covers the pool jobs a request submits (see profiling.py), but not jobs
+    # a streaming body starts after the response headers are sent
+    reason = None
+    if request.url.path.startswith("/admin"):
+        pass
+    elif request.headers.get("x-profile", "").lower() in ('1', 'true', 'yes'):
+        if is_admin(request.headers.get("x-admin-token")):
+            reason = "header"
+    elif PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        reason = "sampled"
+    if reason is None:
+        return await call_next(request)
+
+    session = await asyncio.to_thread(
+        profile_store.start, request.method, request.url.path, reason, PROFILE_SAMPLE_INTERVAL_MS / 1000
+    )
+    token = current_profile.set(session)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Profile-Id"] = session.profile_id
+        return response
+    finally:
+        current_profile.reset(token)
+        await asyncio.to_thread(profile_store.finish, session, status)
+
+if PROFILE_ENABLED:
+    app.middleware("http")(profile_request)
+
 # Global variables for model and utilities
 model = None
 saliency_generator = None
 explainer = None
+inference_engine = None
+inference_executor = None
+result_cache = None
+map_store = None
+startup_report = {}
+readiness = {"ready": False, "stage": "starting", "error": None}
+warmup_task = None
+serving_backend = 'eager'
 class_names = ['glioma', 'meningioma', 'notumor', 'pituitary']
 device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
+# Dynamic batching settings for /predict
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '16'))
+MAX_BATCH_WAIT_MS = float(os.getenv('MAX_BATCH_WAIT_MS', '5'))
+MAX_QUEUE_SIZE = int(os.getenv('MAX_QUEUE_SIZE', '256'))
+
+# Inference backend used by the batching engine (must pass inference_backends.py validation)
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'eager')
+
+# Worker pool for blocking decode, inference and saliency work
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '2'))
+INFERENCE_MAX_PENDING = int(os.getenv('INFERENCE_MAX_PENDING', '32'))
+TORCH_THREADS_PER_WORKER = os.getenv('TORCH_THREADS_PER_WORKER')
+
+# Content-addressed result cache (memory LRU plus optional SQLite tier)
+RESULT_CACHE_MAX_MB = float(os.getenv('RESULT_CACHE_MAX_MB', '256'))
+RESULT_CACHE_DB = os.getenv('RESULT_CACHE_DB', '')
+RESULT_CACHE_DB_MAX_MB = float(os.getenv('RESULT_CACHE_DB_MAX_MB', '2048'))
+
+# Study uploads accepted by /predict/batch
+MAX_BATCH_UPLOAD_FILES = int(os.getenv('MAX_BATCH_UPLOAD_FILES', '512'))
+MAX_BATCH_UPLOAD_MB = float(os.getenv('MAX_BATCH_UPLOAD_MB', '512'))  # decompressed images per request
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+# Scans accepted by /compare (each one is attached to the comparison LLM call)
+MAX_COMPARE_FILES = int(os.getenv('MAX_COMPARE_FILES', '20'))
+
+# Saliency maps generated by /analyze (occlusion is opt-in via ?maps=)
+SALIENCY_MAP_NAMES = ('gradcam', 'integrated_gradients', 'occlusion')
+DEFAULT_SALIENCY_MAPS = ('gradcam', 'integrated_gradients')
+IG_STEPS = int(os.getenv('IG_STEPS', '50'))
+IG_BATCH_SIZE = int(os.getenv('IG_BATCH_SIZE', '16'))
+IG_METHOD = os.getenv('IG_METHOD', 'riemann_trapezoid')
+OCCLUSION_PATCH_SIZE = int(os.getenv('OCCLUSION_PATCH_SIZE', '20'))
+OCCLUSION_STRIDE = int(os.getenv('OCCLUSION_STRIDE', '10'))
+OCCLUSION_BATCH_SIZE = int(os.getenv('OCCLUSION_BATCH_SIZE', '32'))
+
+# Warm-up before /ready reports ready: every batch size the engine can form
+# (empty means 1..MAX_BATCH_SIZE) plus each saliency method on every worker
+WARMUP_ENABLED = os.getenv('WARMUP_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+WARMUP_BATCH_SIZES = os.getenv('WARMUP_BATCH_SIZES', '')
+WARMUP_ITERATIONS = int(os.getenv('WARMUP_ITERATIONS', '1'))
+WARMUP_SALIENCY = os.getenv('WARMUP_SALIENCY', 'true').lower() in ('1', 'true', 'yes')
+
+# Saliency map transport: PNG zlib level and lifetime of /maps/{id} downloads
+SALIENCY_PNG_LEVEL = int(os.getenv('SALIENCY_PNG_LEVEL', '6'))
+MAP_STORE_TTL_S = float(os.getenv('MAP_STORE_TTL_S', '300'))
+MAP_STORE_MAX_ENTRIES = int(os.getenv('MAP_STORE_MAX_ENTRIES', '1024'))
+
+# LLM explanations: gemini, stub (in-process) or http (e.g. explainer_stub.py)
+EXPLAINER_CLIENT = os.getenv('EXPLAINER_CLIENT', 'gemini')
+EXPLAINER_URL = os.getenv('EXPLAINER_URL', 'http://127.0.0.1:8765/generate')
+EXPLAINER_STUB_LATENCY_MS = float(os.getenv('EXPLAINER_STUB_LATENCY_MS', '500'))
+EXPLAINER_MAX_CONCURRENCY = int(os.getenv('EXPLAINER_MAX_CONCURRENCY', '4'))
+EXPLAINER_TIMEOUT_S = float(os.getenv('EXPLAINER_TIMEOUT_S', '30'))
+EXPLAINER_FAILURE_THRESHOLD = int(os.getenv('EXPLAINER_FAILURE_THRESHOLD', '5'))
+EXPLAINER_RESET_S = float(os.getenv('EXPLAINER_RESET_S', '30'))
+
+# Explanation cache keyed on client/model, image hash, class and confidence bucket
+EXPLANATION_CACHE_MAX_ENTRIES = int(os.getenv('EXPLANATION_CACHE_MAX_ENTRIES', '1024'))
+EXPLANATION_CACHE_TTL_S = float(os.getenv('EXPLANATION_CACHE_TTL_S', '86400'))
+EXPLANATION_CACHE_DB = os.getenv('EXPLANATION_CACHE_DB', '')
+
 # Image preprocessing transform
 transform = transforms.Compose([
     transforms.Resize((224, 224)),
@@ -53,36 +220,127 @@ transform = transforms.Compose([
 
 def load_model():
     """Load the trained model"""
-    global model, saliency_generator
+    global model, saliency_generator, inference_engine, inference_executor, result_cache, map_store
     
     try:
-        model = BrainTumorClassifier(num_classes=4, model_name='resnet50')
+        # No ImageNet download: the fine-tuned state dict replaces every weight
+        start = time.perf_counter()
+        model = BrainTumorClassifier(num_classes=4, model_name='resnet50', pretrained=False)
+        startup_report["construct_s"] = time.perf_counter() - start
         model_path = Path("models/best_brain_tumor_model.pth")
         
+        start = time.perf_counter()
         if model_path.exists():
-            model.load_state_dict(torch.load(model_path, map_location=device))
+            model.load_state_dict(load_state_dict_file(model_path, map_location=device))
+            model_version = weights_version(model_path)
             logger.info("✅ Model loaded successfully")
         else:
+            # Random weights differ per process, so never share cached results
+            model_version = f"untrained-{secrets.token_hex(8)}"
             logger.warning("⚠️ Model file not found, using untrained model")
         
         model.to(device)
         model.eval()
+        startup_report["weights_s"] = time.perf_counter() - start
         
         # Initialize saliency map generator
         saliency_generator = SaliencyMapGenerator(model, device)
         
+        # Run blocking model work on a bounded pool, off the event loop
+        inference_executor = InferenceExecutor(
+            num_workers=INFERENCE_WORKERS,
+            max_pending=INFERENCE_MAX_PENDING,
+            threads_per_worker=int(TORCH_THREADS_PER_WORKER) if TORCH_THREADS_PER_WORKER else None
+        )
+        
+        # Saliency maps need gradients, so only prediction uses the backend
+        start = time.perf_counter()
+        serving_model, serving_device = select_serving_model(model_version)
+        startup_report["backend_s"] = time.perf_counter() - start
+        
+        # Batch concurrent /predict requests into shared forward passes
+        inference_engine = BatchingInferenceEngine(
+            serving_model, serving_device, inference_executor,
+            max_batch_size=MAX_BATCH_SIZE,
+            max_wait_ms=MAX_BATCH_WAIT_MS,
+            max_queue_size=MAX_QUEUE_SIZE
+        )
+        
+        # Cache results per upload and weights version
+        result_cache = ResultCache(
+            model_version,
+            max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024,
+            disk_path=RESULT_CACHE_DB or None,
+            disk_max_bytes=RESULT_CACHE_DB_MAX_MB * 1024 * 1024
+        )
+        map_store = MapStore(ttl=MAP_STORE_TTL_S, max_entries=MAP_STORE_MAX_ENTRIES)
+        
         return True
     except Exception as e:
         logger.error(f"❌ Error loading model: {e}")
         return False
 
+def select_serving_model(model_version):
+    """Return the (model, device) used for prediction, falling back to eager"""
+    global serving_backend
+    serving_backend = 'eager'
+    
+    if INFERENCE_BACKEND == 'eager':
+        return model, device
+    if INFERENCE_BACKEND not in BACKENDS:
+        logger.warning(f"⚠️ Unknown inference backend '{INFERENCE_BACKEND}', using eager")
+        return model, device
+    if device.type != 'cpu':
+        logger.warning(f"⚠️ {INFERENCE_BACKEND} backend is CPU-only, using eager on {device}")
+        return model, device
+    if not is_backend_validated(INFERENCE_BACKEND, model_version):
+        logger.warning(
+            f"⚠️ {INFERENCE_BACKEND} backend has not passed validation for these weights, "
+            f"using eager (run: python inference_backends.py --backend {INFERENCE_BACKEND})"
+        )
+        return model, device
+    
+    try:
+        backend_model = load_backend(
+            model, INFERENCE_BACKEND,
+            num_threads=int(TORCH_THREADS_PER_WORKER) if TORCH_THREADS_PER_WORKER else None
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ Could not load {INFERENCE_BACKEND} backend, using eager: {e}")
+        return model, device
+    
+    serving_backend = INFERENCE_BACKEND
+    logger.info(f"✅ Serving predictions with the {INFERENCE_BACKEND} backend")
+    return backend_model, torch.device('cpu')
+
+def create_explanation_client():
+    """LLM client selected by EXPLAINER_CLIENT (None means the Gemini default)"""
+    if EXPLAINER_CLIENT == 'stub':
+        return StubExplanationClient(latency_ms=EXPLAINER_STUB_LATENCY_MS)
+    if EXPLAINER_CLIENT == 'http':
+        return HttpExplanationClient(EXPLAINER_URL, timeout=EXPLAINER_TIMEOUT_S)
+    if EXPLAINER_CLIENT != 'gemini':
+        raise ValueError(f"Unknown EXPLAINER_CLIENT '{EXPLAINER_CLIENT}'")
+    return None
+
 def initialize_explainer():
     """Initialize Gemini explainer"""
     global explainer
     
     try:
-        explainer = GeminiExplainer()
-        logger.info("✅ Gemini explainer initialized")
+        explainer = GeminiExplainer(
+            client=create_explanation_client(),
+            max_concurrency=EXPLAINER_MAX_CONCURRENCY,
+            timeout=EXPLAINER_TIMEOUT_S,
+            failure_threshold=EXPLAINER_FAILURE_THRESHOLD,
+            reset_timeout=EXPLAINER_RESET_S,
+            cache=ExplanationCache(
+                max_entries=EXPLANATION_CACHE_MAX_ENTRIES,
+                ttl=EXPLANATION_CACHE_TTL_S,
+                disk_path=EXPLANATION_CACHE_DB or None
+            )
+        )
+        logger.info(f"✅ Gemini explainer initialized ({EXPLAINER_CLIENT} client)")
         return True
     except Exception as e:
         logger.warning(f"⚠️ Gemini explainer not available: {e}")
@@ -92,18 +350,95 @@ def initialize_explainer():
 @app.on_event("startup")
 async def startup_event():
     """Initialize the application"""
+    global warmup_task
     logger.info("🚀 Starting Brain Tumor Classification API")
+    startup_start = time.perf_counter()
+    startup_report["imports_s"] = IMPORT_SECONDS
     
     # Load model
     model_loaded = load_model()
     if not model_loaded:
         logger.error("❌ Failed to load model")
+    else:
+        await inference_engine.start()
+        logger.info(
+            f"✅ Batching engine started (max_batch_size={MAX_BATCH_SIZE}, "
+            f"max_wait_ms={MAX_BATCH_WAIT_MS})"
+        )
+        
+        # Warm up in the background: /health is live now, /ready waits for this
+        warmup_task = asyncio.create_task(warm_up())
     
     # Initialize explainer
+    start = time.perf_counter()
     initialize_explainer()
+    startup_report["explainer_s"] = time.perf_counter() - start
     
+    startup_report["total_s"] = IMPORT_SECONDS + time.perf_counter() - startup_start
+    logger.info("⏱️ Startup: " + ", ".join(
+        f"{stage[:-2]} {seconds:.2f}s" for stage, seconds in startup_report.items()
+    ))
     logger.info("✅ API ready!")
 
+def warmup_batch_sizes():
+    """Batch sizes to warm up, from WARMUP_BATCH_SIZES or 1..MAX_BATCH_SIZE"""
+    if WARMUP_BATCH_SIZES.strip():
+        sizes = {int(size) for size in WARMUP_BATCH_SIZES.split(",") if size.strip()}
+        return sorted(size for size in sizes if 1 <= size <= MAX_BATCH_SIZE)
+    return list(range(1, MAX_BATCH_SIZE + 1))
+
+def warm_saliency(image_tensor):
+    """Run every saliency path once on this worker thread (runs on the inference pool)"""
+    # The fused prediction + Grad-CAM pass used by /analyze on a cache miss
+    saliency_generator.predict_and_explain(image_tensor)
+    for name in SALIENCY_MAP_NAMES:
+        generate_saliency_map(name, image_tensor, 0)
+
+async def warm_up():
+    """Run synthetic work through prediction and saliency, then mark the server ready"""
+    start = time.perf_counter()
+    generator = torch.Generator().manual_seed(0)
+    image_tensor = torch.randn(3, 224, 224, generator=generator)
+    
+    try:
+        if WARMUP_ENABLED:
+            readiness["stage"] = "prediction"
+            for _ in range(WARMUP_ITERATIONS):
+                for batch_size in warmup_batch_sizes():
+                    await inference_executor.run(
+                        inference_engine.forward, [image_tensor] * batch_size, bounded=False
+                    )
+            
+            if WARMUP_SALIENCY and saliency_generator is not None:
+                readiness["stage"] = "saliency"
+                await asyncio.gather(*[
+                    inference_executor.run(warm_saliency, image_tensor, bounded=False)
+                    for _ in range(INFERENCE_WORKERS)
+                ])
+    except Exception as e:
+        # A cold replica still answers correctly, so readiness is not withheld
+        logger.warning(f"⚠️ Warm-up failed: {e}")
+        readiness["error"] = str(e)
+    
+    startup_report["warmup_s"] = time.perf_counter() - start
+    readiness["stage"] = "ready"
+    readiness["ready"] = True
+    logger.info(f"🔥 Warm-up finished in {startup_report['warmup_s']:.2f}s, ready for traffic")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release background resources"""
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if inference_engine is not None:
+        await inference_engine.stop()
+    if inference_executor is not None:
+        inference_executor.shutdown(wait=False)
+    if result_cache is not None:
+        result_cache.close()
+    if explainer is not None and explainer.cache is not None:
+        explainer.cache.close()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -122,161 +457,801 @@ async def health_check():
         "model_status": "loaded" if model is not None else "not_loaded",
         "device": str(device),
         "gemini_status": "available" if explainer is not None else "unavailable",
-        "classes": class_names
+        "explainer": explainer.get_stats() if explainer is not None else None,
+        "classes": class_names,
+        "inference_pool": inference_executor.get_stats() if inference_executor is not None else None,
+        "batching_queue_depth": inference_engine.queue_depth if inference_engine is not None else 0,
+        "startup": startup_report
+    }
+
+def register_state_metrics():
+    """Export queue depths, pool load and cache counters, read only when scraped"""
+    def queue_depth():
+        samples = []
+        if inference_engine is not None:
+            samples.append(({"queue": "batching"}, inference_engine.queue_depth))
+        if inference_executor is not None:
+            stats = inference_executor.get_stats()
+            samples.append(({"queue": "executor_pending"}, stats["pending"]))
+            samples.append(({"queue": "executor_unbounded"}, stats["unbounded_pending"]))
+            samples.append(({"queue": "executor_active"}, stats["active"]))
+        return samples
+    
+    def cache_lookups():
+        samples = []
+        caches = []
+        if result_cache is not None:
+            caches.append(("result", result_cache.get_stats()))
+        if explainer is not None and explainer.cache is not None:
+            caches.append(("explanation", explainer.cache.get_stats()))
+        for cache, stats in caches:
+            for result in ("hits", "disk_hits", "misses", "coalesced"):
+                if result in stats:
+                    samples.append(({"cache": cache, "result": result}, stats[result]))
+        return samples
+    
+    def executor_jobs():
+        if inference_executor is None:
+            return []
+        stats = inference_executor.get_stats()
+        return [({"outcome": outcome}, stats[outcome]) for outcome in ("completed", "failed", "rejected")]
+    
+    def explainer_circuit():
+        if explainer is None:
+            return []
+        return [({}, 0 if explainer.breaker.state == "closed" else 1)]
+    
+    REGISTRY.callback("brain_tumor_queue_depth", "Jobs waiting or running per queue", "gauge", queue_depth)
+    REGISTRY.callback("brain_tumor_cache_lookups_total", "Cache lookups by cache and result", "counter",
+                      cache_lookups)
+    REGISTRY.callback("brain_tumor_executor_jobs_total", "Inference pool jobs by outcome", "counter",
+                      executor_jobs)
+    REGISTRY.callback("brain_tumor_explainer_circuit_open", "1 while the explainer circuit breaker is open",
+                      "gauge", explainer_circuit)
+    REGISTRY.callback("brain_tumor_ready", "1 once warm-up has finished", "gauge",
+                      lambda: [({}, 1 if readiness["ready"] else 0)])
+
+register_state_metrics()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of request, stage, queue and cache metrics"""
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness for load balancers: 503 until the model is loaded and warmed up"""
+    if model is None:
+        return JSONResponse(status_code=503, content={**readiness, "ready": False, "stage": "model_not_loaded"})
+    if not readiness["ready"]:
+        return JSONResponse(status_code=503, content=readiness)
+    return readiness
+
+@app.get("/inference-stats")
+async def get_inference_stats():
+    """Batch size and queue wait statistics for the batching engine"""
+    if inference_engine is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return inference_engine.get_stats()
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    """Hit/miss counters and sizes for the result and explanation caches"""
+    if result_cache is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return {
+        **result_cache.get_stats(),
+        "explanations": explainer.cache.get_stats() if explainer is not None else None
     }
 
 def preprocess_image(image: Image.Image):
     """Preprocess image for model inference"""
-    # Convert to RGB if needed
-    if image.mode != 'RGB':
-        image = image.convert('RGB')
-    
-    # Apply transforms
-    image_tensor = transform(image)
+    with STAGE_SECONDS.time(stage='preprocess'):
+        # Convert to RGB if needed
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        
+        # Apply transforms
+        image_tensor = transform(image)
     return image_tensor
 
-def numpy_to_base64(array):
+def numpy_to_base64(array, png_level=SALIENCY_PNG_LEVEL):
     """Convert numpy array to base64 string"""
-    # Normalize to 0-255
-    array_normalized = (array * 255).astype(np.uint8)
+    return base64.b64encode(encode_map(array, 'png', png_level)).decode()
+
+def prediction_field(backend=None):
+    """Result cache field for a prediction from ``backend`` (default: the serving backend)"""
+    # Quantized or compiled backends give slightly different probabilities than eager
+    backend = backend or serving_backend
+    return 'prediction' if backend == 'eager' else f'prediction:{backend}'
+
+# Settings that change a method's output (the internal batch sizes only chunk the work)
+SALIENCY_CACHE_PARAMS = {
+    'integrated_gradients': f"steps={IG_STEPS},method={IG_METHOD}",
+    'occlusion': f"patch={OCCLUSION_PATCH_SIZE},stride={OCCLUSION_STRIDE}",
+}
+
+def saliency_field(name, encoding='png', png_level=SALIENCY_PNG_LEVEL):
+    """Result cache field for a saliency map computed with the current settings in a given encoding"""
+    field = f'saliency:{name}'
+    if name in SALIENCY_CACHE_PARAMS:
+        field += f'[{SALIENCY_CACHE_PARAMS[name]}]'
+    suffix = encoding_id(encoding, png_level)
+    return field if suffix == 'png' else f'{field}:{suffix}'
+
+def format_prediction(probabilities):
+    """Build the prediction and per-class probability fields from a softmax row"""
+    all_probs = probabilities.cpu().numpy()
+    predicted_class = int(all_probs.argmax())
     
-    # Convert to PIL Image
-    img = Image.fromarray(array_normalized, mode='L')
+    return {
+        "prediction": {
+            "class": class_names[predicted_class],
+            "confidence": float(all_probs[predicted_class]),
+            "class_index": predicted_class
+        },
+        "probabilities": {
+            class_names[i]: float(all_probs[i]) for i in range(len(class_names))
+        }
+    }
+
+def decode_image(image_bytes):
+    """Decode uploaded bytes into a fully loaded PIL image"""
+    with STAGE_SECONDS.time(stage='decode'):
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    return image
+
+async def read_upload(upload):
+    """Read an uploaded file, timing the upload_read stage"""
+    with STAGE_SECONDS.time(stage='upload_read'):
+        return await upload.read()
+
+def load_image_tensor(image_bytes):
+    """Decode and preprocess uploaded bytes (runs on the inference pool)"""
+    return preprocess_image(decode_image(image_bytes))
+
+def load_image_and_tensor(image_bytes):
+    """Decode once, returning the PIL image and its model input (runs on the inference pool)"""
+    image = decode_image(image_bytes)
+    return image, preprocess_image(image)
+
+def generate_saliency_map(name, image_tensor, predicted_class, encoding='png', png_level=SALIENCY_PNG_LEVEL):
+    """Build one saliency map and encode it as an EncodedMap (runs on the inference pool)"""
+    with STAGE_SECONDS.time(stage=name):
+        saliency_map = compute_saliency_map(name, image_tensor, predicted_class)
+    return encode_saliency_map(saliency_map, encoding, png_level)
+
+def encode_saliency_map(saliency_map, encoding='png', png_level=SALIENCY_PNG_LEVEL):
+    """Encode a raw saliency map as an EncodedMap, timing the encode stage"""
+    with STAGE_SECONDS.time(stage='encode'):
+        return EncodedMap.from_array(saliency_map, encoding, png_level)
+
+def compute_saliency_map(name, image_tensor, predicted_class):
+    """Raw [0, 1] float saliency map for one method"""
+    if name == 'gradcam':
+        saliency_map, _, _ = saliency_generator.generate_gradcam(image_tensor, predicted_class)
+    elif name == 'integrated_gradients':
+        saliency_map, _ = saliency_generator.generate_integrated_gradients(
+            image_tensor, predicted_class,
+            steps=IG_STEPS,
+            internal_batch_size=IG_BATCH_SIZE,
+            method=IG_METHOD
+        )
+    elif name == 'occlusion':
+        saliency_map, _ = saliency_generator.generate_occlusion_map(
+            image_tensor, predicted_class,
+            patch_size=OCCLUSION_PATCH_SIZE,
+            stride=OCCLUSION_STRIDE,
+            internal_batch_size=OCCLUSION_BATCH_SIZE
+        )
+    else:
+        raise ValueError(f"Unknown saliency map '{name}'")
+    return saliency_map
+
+def eager_prediction(image_tensor, with_gradcam=False):
+    """Eager-model prediction and, if asked, Grad-CAM from the same forward pass (runs on the inference pool)"""
+    if saliency_generator and with_gradcam:
+        # One forward pass with gradients yields both prediction and Grad-CAM
+        with STAGE_SECONDS.time(stage='gradcam'):
+            _, probabilities, gradcam_map = saliency_generator.predict_and_explain(image_tensor)
+        return format_prediction(probabilities), gradcam_map
+    
+    with torch.no_grad(), STAGE_SECONDS.time(stage='forward'):
+        image_batch = image_tensor.unsqueeze(0).to(device)
+        outputs = model(image_batch)
+        probabilities = F.softmax(outputs, dim=1)[0]
+    return format_prediction(probabilities), None
+
+def run_analysis(image_bytes, prediction=None, map_names=DEFAULT_SALIENCY_MAPS, encoding='png',
+                 png_level=SALIENCY_PNG_LEVEL):
+    """Decode, predict unless ``prediction`` is cached, and build saliency maps (runs on the inference pool)"""
+    image = decode_image(image_bytes)
+    original_image = image.copy()
+    image_tensor = preprocess_image(image)
     
-    # Convert to base64
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
+    # Make prediction
+    gradcam_map = None
+    if prediction is None:
+        prediction, gradcam_map = eager_prediction(image_tensor, 'gradcam' in map_names)
+    predicted_class = prediction["prediction"]["class_index"]
+    
+    # Generate saliency maps
+    saliency_maps = {}
+    
+    if saliency_generator and map_names:
+        try:
+            for name in map_names:
+                if name == 'gradcam' and gradcam_map is not None:
+                    saliency_maps[name] = encode_saliency_map(gradcam_map, encoding, png_level)
+                else:
+                    saliency_maps[name] = generate_saliency_map(
+                        name, image_tensor, predicted_class, encoding, png_level
+                    )
+            
+        except Exception as e:
+            logger.warning(f"Saliency map generation failed: {e}")
+            ERRORS_TOTAL.inc(stage='saliency')
+            saliency_maps = {"error": "Saliency maps unavailable"}
     
-    return img_str
+    return original_image, prediction, saliency_maps
+
+def parse_map_names(maps):
+    """Validate a comma-separated list of saliency map names"""
+    map_names = [name.strip() for name in maps.split(",") if name.strip()]
+    unknown = [name for name in map_names if name not in SALIENCY_MAP_NAMES]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown saliency maps {unknown}; choose from {list(SALIENCY_MAP_NAMES)}"
+        )
+    return list(dict.fromkeys(map_names))
+
+def check_map_encoding(map_encoding):
+    """Reject saliency map encodings the transport does not support"""
+    if map_encoding not in MAP_ENCODINGS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown map encoding '{map_encoding}'; choose from {list(MAP_ENCODINGS)}"
+        )
 
 @app.post("/predict")
 async def predict(file: UploadFile = File(...)):
     """Make prediction on uploaded image"""
     
-    if model is None:
+    if model is None or inference_engine is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     try:
-        # Read and process image
-        image_bytes = await file.read()
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Preprocess
-        image_tensor = preprocess_image(image)
+        image_bytes = await read_upload(file)
+        image_hash = content_hash(image_bytes)
         
-        # Make prediction
-        with torch.no_grad():
-            image_batch = image_tensor.unsqueeze(0).to(device)
-            outputs = model(image_batch)
-            probabilities = F.softmax(outputs, dim=1)
-            confidence, predicted_class = torch.max(probabilities, 1)
+        prediction = await result_cache.get_async(image_hash, prediction_field())
+        if prediction is None:
+            # Decode and preprocess on the worker pool
+            image_tensor = await inference_executor.run(load_image_tensor, image_bytes)
             
-            predicted_class = predicted_class.item()
-            confidence = confidence.item()
-        
-        # Get all class probabilities
-        all_probs = probabilities[0].cpu().numpy()
-        class_probabilities = {
-            class_names[i]: float(all_probs[i]) for i in range(len(class_names))
-        }
+            # Make prediction (batched with other concurrent requests)
+            probabilities = await inference_engine.predict(image_tensor)
+            prediction = format_prediction(probabilities)
+            await result_cache.set_async(image_hash, prediction_field(), prediction)
         
         return {
-            "prediction": {
-                "class": class_names[predicted_class],
-                "confidence": confidence,
-                "class_index": predicted_class
-            },
-            "probabilities": class_probabilities,
+            **prediction,
             "status": "success"
         }
         
+    except ExecutorSaturatedError as e:
+        ERRORS_TOTAL.inc(stage='rejected')
+        logger.warning(f"Prediction rejected: {e}")
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
     except Exception as e:
         logger.error(f"Prediction error: {e}")
         raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
+class UploadLimitError(ValueError):
+    """Raised when a study upload exceeds the file count or decompressed size limit"""
+
+def extract_zip_images(archive_bytes, max_files=MAX_BATCH_UPLOAD_FILES,
+                       max_bytes=MAX_BATCH_UPLOAD_MB * 1024 * 1024):
+    """Return (name, bytes) for every image in a zip archive, in name order"""
+    # Limits are checked against the central directory before anything is
+    # inflated, and zipfile never inflates a member past its declared size
+    with zipfile.ZipFile(io.BytesIO(archive_bytes)) as archive:
+        members = [
+            info for info in sorted(archive.infolist(), key=lambda info: info.filename)
+            if not info.is_dir() and '__MACOSX' not in info.filename
+            and Path(info.filename).suffix.lower() in IMAGE_EXTENSIONS
+        ]
+        if len(members) > max_files:
+            raise UploadLimitError(
+                f"Too many images; the archive has {len(members)} but only {max_files} more are allowed"
+            )
+        if sum(info.file_size for info in members) > max_bytes:
+            raise UploadLimitError(
+                f"Images exceed the decompressed size limit; only {max_bytes / (1024 * 1024):g} MB remain"
+            )
+        return [(info.filename, archive.read(info)) for info in members]
+
+def is_zip_upload(upload, data):
+    return (
+        upload.content_type in ('application/zip', 'application/x-zip-compressed')
+        or (upload.filename or '').lower().endswith('.zip')
+        or data[:4] == b'PK\x03\x04'
+    )
+
+def summarize_study(results):
+    """Aggregate per-slice predictions into a max-confidence tumor vote"""
+    succeeded = [result for result in results if result["status"] == "success"]
+    class_counts = {name: 0 for name in class_names}
+    max_confidence = {name: 0.0 for name in class_names}
+    
+    for result in succeeded:
+        predicted = result["prediction"]["class"]
+        class_counts[predicted] += 1
+        for name, probability in result["probabilities"].items():
+            max_confidence[name] = max(max_confidence[name], probability)
+    
+    # Any slice predicted as a tumor outranks slices predicted as no tumor
+    study_prediction = None
+    tumor_slices = [r for r in succeeded if r["prediction"]["class"] != 'notumor']
+    candidates = tumor_slices or succeeded
+    if candidates:
+        best = max(candidates, key=lambda r: r["prediction"]["confidence"])
+        study_prediction = {
+            "class": best["prediction"]["class"],
+            "confidence": best["prediction"]["confidence"],
+            "source_index": best["index"],
+            "source_filename": best["filename"]
+        }
+    
+    return {
+        "type": "summary",
+        "images": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "class_counts": class_counts,
+        "max_confidence": max_confidence,
+        "study_prediction": study_prediction
+    }
+
+async def decode_study_chunk(chunk):
+    """Decode a chunk of (index, name, bytes) concurrently on the worker pool"""
+    async def decode_one(index, name, image_bytes):
+        image_hash = content_hash(image_bytes)
+        cached = await result_cache.get_async(image_hash, prediction_field())
+        if cached is not None:
+            return index, name, image_hash, cached, None
+        try:
+            image_tensor = await inference_executor.run(load_image_tensor, image_bytes)
+            return index, name, image_hash, None, image_tensor
+        except Exception as e:
+            return index, name, image_hash, e, None
+    
+    return await asyncio.gather(*[decode_one(*item) for item in chunk])
+
+async def stream_study_predictions(images, aggregate):
+    """Yield NDJSON prediction lines while later chunks are still decoding"""
+    chunks = [images[i:i + MAX_BATCH_SIZE] for i in range(0, len(images), MAX_BATCH_SIZE)]
+    results = []
+    next_decode = asyncio.ensure_future(decode_study_chunk(chunks[0])) if chunks else None
+    
+    for chunk_index in range(len(chunks)):
+        decoded = await next_decode
+        # Decode the next chunk while this one runs through the model
+        if chunk_index + 1 < len(chunks):
+            next_decode = asyncio.ensure_future(decode_study_chunk(chunks[chunk_index + 1]))
+        
+        pending = [(index, name, image_hash, tensor)
+                   for index, name, image_hash, outcome, tensor in decoded if tensor is not None]
+        predictions = {}
+        if pending:
+            try:
+                probabilities = await inference_executor.run(
+                    inference_engine.forward, [tensor for _, _, _, tensor in pending]
+                )
+                for (index, _, image_hash, _), row in zip(pending, probabilities):
+                    predictions[index] = format_prediction(row)
+                    await result_cache.set_async(image_hash, prediction_field(), predictions[index])
+            except Exception as e:
+                logger.error(f"Batch prediction error: {e}")
+                for index, _, _, _ in pending:
+                    predictions[index] = e
+        
+        for index, name, _, outcome, tensor in decoded:
+            if tensor is not None:
+                outcome = predictions[index]
+            if isinstance(outcome, ExecutorSaturatedError):
+                result = {"type": "prediction", "index": index, "filename": name,
+                          "status": "error", "detail": "Server busy, please retry"}
+            elif isinstance(outcome, Exception):
+                detail = f"Prediction failed: {str(outcome)}"
+                result = {"type": "prediction", "index": index, "filename": name,
+                          "status": "error", "detail": detail}
+            else:
+                result = {"type": "prediction", "index": index, "filename": name,
+                          **outcome, "status": "success"}
+            results.append(result)
+            yield json.dumps(result) + "\n"
+    
+    if aggregate:
+        yield json.dumps(summarize_study(results)) + "\n"
+
+@app.post("/predict/batch")
+async def predict_batch(
+    files: List[UploadFile] = File(...),
+    aggregate: bool = Query(True, description="Append a per-study summary line")
+):
+    """Classify every slice of a study (image files and/or zip archives), streaming results as NDJSON"""
+    if model is None or inference_engine is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    images = []
+    total_bytes = 0
+    max_bytes = MAX_BATCH_UPLOAD_MB * 1024 * 1024
+    try:
+        for upload in files:
+            data = await read_upload(upload)
+            if is_zip_upload(upload, data):
+                # Whatever earlier uploads used counts against this archive's budget
+                images.extend(await inference_executor.run(
+                    extract_zip_images, data,
+                    MAX_BATCH_UPLOAD_FILES - len(images), max_bytes - total_bytes
+                ))
+                total_bytes = sum(len(image_bytes) for _, image_bytes in images)
+            else:
+                images.append((upload.filename or f"image_{len(images)}", data))
+                total_bytes += len(data)
+            if len(images) > MAX_BATCH_UPLOAD_FILES:
+                raise UploadLimitError(f"Too many images; the limit is {MAX_BATCH_UPLOAD_FILES}")
+            if total_bytes > max_bytes:
+                raise UploadLimitError(f"Images exceed the {MAX_BATCH_UPLOAD_MB:g} MB decompressed size limit")
+    except UploadLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ExecutorSaturatedError as e:
+        ERRORS_TOTAL.inc(stage='rejected')
+        logger.warning(f"Batch prediction rejected: {e}")
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"Invalid zip archive: {str(e)}")
+    
+    if not images:
+        raise HTTPException(status_code=400, detail="No images found in upload")
+    
+    indexed = [(index, name, data) for index, (name, data) in enumerate(images)]
+    return StreamingResponse(
+        stream_study_predictions(indexed, aggregate),
+        media_type="application/x-ndjson"
+    )
+
 @app.post("/analyze")
-async def analyze_with_saliency(file: UploadFile = File(...)):
+async def analyze_with_saliency(
+    file: UploadFile = File(...),
+    maps: str = Query(",".join(DEFAULT_SALIENCY_MAPS), description="Comma-separated saliency maps to generate"),
+    map_encoding: str = Query('png', description="Saliency map encoding: png, uint8 or float16"),
+    png_level: int = Query(SALIENCY_PNG_LEVEL, ge=0, le=9, description="PNG zlib compression level"),
+    by_reference: bool = Query(False, description="Return /maps/{id} URLs instead of map data"),
+    accept: Optional[str] = Header(None)
+):
     """Complete analysis with prediction, saliency maps, and explanation"""
     
-    if model is None:
+    if model is None or inference_executor is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
+    map_names = parse_map_names(maps)
+    check_map_encoding(map_encoding)
+    response_format = negotiate_format(accept)
+    
     try:
-        # Read and process image
-        image_bytes = await file.read()
-        image = Image.open(io.BytesIO(image_bytes))
-        original_image = image.copy()
-        
-        # Preprocess
-        image_tensor = preprocess_image(image)
-        
-        # Make prediction
-        with torch.no_grad():
-            image_batch = image_tensor.unsqueeze(0).to(device)
-            outputs = model(image_batch)
-            probabilities = F.softmax(outputs, dim=1)
-            confidence, predicted_class = torch.max(probabilities, 1)
-            
-            predicted_class = predicted_class.item()
-            confidence = confidence.item()
+        image_bytes = await read_upload(file)
+        image_hash = content_hash(image_bytes)
         
-        # Generate saliency maps
+        # Reuse whatever earlier /predict or /analyze calls already computed
+        prediction = await result_cache.get_async(image_hash, prediction_field('eager'))
         saliency_maps = {}
+        for name in map_names:
+            cached_map = await result_cache.get_async(image_hash, saliency_field(name, map_encoding, png_level))
+            if cached_map is not None:
+                saliency_maps[name] = EncodedMap.from_cache(cached_map, map_encoding)
+        missing_maps = [name for name in map_names if name not in saliency_maps]
+        explanation = None
+        if explainer and prediction is not None:
+            explanation = await explainer.cached_explanation(
+                image_hash, prediction["prediction"]["class"], prediction["prediction"]["confidence"]
+            )
         
-        if saliency_generator:
-            try:
-                # Grad-CAM
-                gradcam_map, _, _ = saliency_generator.generate_gradcam(
-                    image_tensor, predicted_class
-                )
-                saliency_maps['gradcam'] = numpy_to_base64(gradcam_map)
-                
-                # Integrated Gradients
-                ig_map, _ = saliency_generator.generate_integrated_gradients(
-                    image_tensor, predicted_class
-                )
-                saliency_maps['integrated_gradients'] = numpy_to_base64(ig_map)
-                
-            except Exception as e:
-                logger.warning(f"Saliency map generation failed: {e}")
-                saliency_maps = {"error": "Saliency maps unavailable"}
+        original_image = None
+        map_error = None
+        if prediction is None or missing_maps or (explainer and explanation is None):
+            # Decode, predict and build missing saliency maps on the pool
+            original_image, computed_prediction, computed_maps = await inference_executor.run(
+                run_analysis, image_bytes, prediction, missing_maps, map_encoding, png_level
+            )
+            if prediction is None:
+                prediction = computed_prediction
+                await result_cache.set_async(image_hash, prediction_field('eager'), prediction)
+            
+            if "error" in computed_maps:
+                map_error = computed_maps
+            else:
+                for name, encoded_map in computed_maps.items():
+                    await result_cache.set_async(
+                        image_hash, saliency_field(name, map_encoding, png_level), encoded_map.to_cache()
+                    )
+                    saliency_maps[name] = encoded_map
         
-        # Generate explanation
-        explanation = None
-        if explainer:
+        # Generate explanation (network-bound, awaited on the event loop); the
+        # explainer's cache coalesces concurrent requests for the same upload
+        if explainer and explanation is None:
             try:
-                explanation = explainer.generate_explanation(
-                    original_image, 
-                    class_names[predicted_class], 
-                    confidence
+                explanation = await explainer.generate_explanation_async(
+                    original_image,
+                    prediction["prediction"]["class"],
+                    prediction["prediction"]["confidence"],
+                    image_hash=image_hash
                 )
             except Exception as e:
                 logger.warning(f"Explanation generation failed: {e}")
+                ERRORS_TOTAL.inc(stage='explanation')
                 explanation = {"error": "Explanation unavailable"}
         
-        # Get all class probabilities
-        all_probs = probabilities[0].cpu().numpy()
-        class_probabilities = {
-            class_names[i]: float(all_probs[i]) for i in range(len(class_names))
-        }
+        payload = {**prediction, "explanation": explanation, "status": "success"}
+        if map_error is not None:
+            return {**prediction, "saliency_maps": map_error, "explanation": explanation, "status": "success"}
+        if by_reference:
+            references = {
+                name: {**encoded_map.describe(), "url": f"/maps/{map_store.put(encoded_map)}"}
+                for name, encoded_map in saliency_maps.items()
+            }
+            return {**prediction, "saliency_maps": references, "explanation": explanation, "status": "success"}
+        if response_format == 'multipart':
+            body, media_type = encode_multipart(payload, saliency_maps)
+            return Response(content=body, media_type=media_type)
+        if response_format == 'msgpack':
+            try:
+                body = encode_msgpack(payload, saliency_maps)
+            except ImportError:
+                raise HTTPException(status_code=406, detail="msgpack responses require the msgpack package")
+            return Response(content=body, media_type="application/msgpack")
         
+        # The base64 step belongs to the encode stage too
+        with STAGE_SECONDS.time(stage='encode'):
+            encoded_maps = json_maps(saliency_maps)
         return {
-            "prediction": {
-                "class": class_names[predicted_class],
-                "confidence": confidence,
-                "class_index": predicted_class
-            },
-            "probabilities": class_probabilities,
-            "saliency_maps": saliency_maps,
+            **prediction,
+            "saliency_maps": encoded_maps,
             "explanation": explanation,
             "status": "success"
         }
         
+    except HTTPException:
+        raise
+    except ExecutorSaturatedError as e:
+        ERRORS_TOTAL.inc(stage='rejected')
+        logger.warning(f"Analysis rejected: {e}")
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
     except Exception as e:
         logger.error(f"Analysis error: {e}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+async def stream_analysis(image_hash, prediction, image, image_tensor, missing_maps, cached_maps,
+                          explanation, map_encoding='png', png_level=SALIENCY_PNG_LEVEL, fused_maps=None):
+    """Yield NDJSON lines for each saliency map and the explanation as they finish"""
+    predicted_class = prediction["prediction"]["class_index"]
+    fused_maps = fused_maps or {}
+    
+    def map_line(name, encoded_map):
+        with STAGE_SECONDS.time(stage='encode'):
+            data = json_maps({name: encoded_map})[name]
+        return {"type": "saliency_map", "name": name, "data": data, "status": "success"}
+    
+    async def build_map(name):
+        try:
+            if name in fused_maps:
+                # Grad-CAM from the prediction's own forward pass only needs encoding
+                encoded_map = await inference_executor.run(
+                    encode_saliency_map, fused_maps[name], map_encoding, png_level
+                )
+            else:
+                encoded_map = await inference_executor.run(
+                    generate_saliency_map, name, image_tensor, predicted_class, map_encoding, png_level
+                )
+            await result_cache.set_async(
+                image_hash, saliency_field(name, map_encoding, png_level), encoded_map.to_cache()
+            )
+            return map_line(name, encoded_map)
+        except ExecutorSaturatedError:
+            return {"type": "saliency_map", "name": name, "status": "error",
+                    "detail": "Server busy, please retry"}
+        except Exception as e:
+            logger.warning(f"Saliency map generation failed: {e}")
+            ERRORS_TOTAL.inc(stage='saliency')
+            return {"type": "saliency_map", "name": name, "status": "error",
+                    "detail": "Saliency map unavailable"}
+    
+    async def build_explanation():
+        try:
+            result = await explainer.generate_explanation_async(
+                image,
+                prediction["prediction"]["class"],
+                prediction["prediction"]["confidence"],
+                image_hash=image_hash
+            )
+        except Exception as e:
+            logger.warning(f"Explanation generation failed: {e}")
+            ERRORS_TOTAL.inc(stage='explanation')
+            result = {"error": "Explanation unavailable"}
+        return {"type": "explanation", "explanation": result, "status": "success"}
+    
+    for name, encoded_map in cached_maps.items():
+        yield json.dumps(map_line(name, encoded_map)) + "\n"
+    if explanation is not None:
+        yield json.dumps({"type": "explanation", "explanation": explanation, "status": "success"}) + "\n"
+    
+    stages = [build_map(name) for name in (missing_maps if saliency_generator else [])]
+    if explainer and explanation is None:
+        stages.append(build_explanation())
+    
+    for stage in asyncio.as_completed(stages):
+        yield json.dumps(await stage) + "\n"
+    
+    yield json.dumps({"type": "done", "status": "success"}) + "\n"
+
+@app.post("/analyze/stream")
+async def analyze_stream(
+    file: UploadFile = File(...),
+    maps: str = Query(",".join(DEFAULT_SALIENCY_MAPS), description="Comma-separated saliency maps to generate"),
+    map_encoding: str = Query('png', description="Saliency map encoding: png, uint8 or float16"),
+    png_level: int = Query(SALIENCY_PNG_LEVEL, ge=0, le=9, description="PNG zlib compression level")
+):
+    """Progressive /analyze: the prediction first, then each map and the explanation as they finish"""
+    
+    if model is None or inference_executor is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    map_names = parse_map_names(maps)
+    check_map_encoding(map_encoding)
+    
+    try:
+        image_bytes = await read_upload(file)
+        image_hash = content_hash(image_bytes)
+        
+        # Same eager prediction as /analyze, so it matches the model the maps explain
+        prediction = await result_cache.get_async(image_hash, prediction_field('eager'))
+        cached_maps = {}
+        for name in map_names:
+            cached_map = await result_cache.get_async(image_hash, saliency_field(name, map_encoding, png_level))
+            if cached_map is not None:
+                cached_maps[name] = EncodedMap.from_cache(cached_map, map_encoding)
+        missing_maps = [name for name in map_names if name not in cached_maps]
+        explanation = None
+        if explainer and prediction is not None:
+            explanation = await explainer.cached_explanation(
+                image_hash, prediction["prediction"]["class"], prediction["prediction"]["confidence"]
+            )
+        
+        image, image_tensor = None, None
+        if prediction is None or missing_maps or (explainer and explanation is None):
+            image, image_tensor = await inference_executor.run(load_image_and_tensor, image_bytes)
+        fused_maps = {}
+        if prediction is None:
+            # The first line is out at forward-pass latency; a requested Grad-CAM
+            # comes from that same pass and is only encoded afterwards
+            prediction, gradcam_map = await inference_executor.run(
+                eager_prediction, image_tensor, 'gradcam' in missing_maps
+            )
+            if gradcam_map is not None:
+                fused_maps['gradcam'] = gradcam_map
+            await result_cache.set_async(image_hash, prediction_field('eager'), prediction)
+        
+    except ExecutorSaturatedError as e:
+        ERRORS_TOTAL.inc(stage='rejected')
+        logger.warning(f"Analysis rejected: {e}")
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+    except Exception as e:
+        logger.error(f"Analysis error: {e}")
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+    
+    async def body():
+        yield json.dumps({"type": "prediction", **prediction, "status": "success"}) + "\n"
+        async for line in stream_analysis(image_hash, prediction, image, image_tensor, missing_maps,
+                                          cached_maps, explanation, map_encoding, png_level, fused_maps):
+            yield line
+    
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+@app.post("/compare")
+async def compare_scans(files: List[UploadFile] = File(...)):
+    """Compare a series of scans: per-scan predictions plus a combined LLM comparison"""
+    
+    if model is None or inference_engine is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if len(files) < 2:
+        raise HTTPException(status_code=400, detail="Comparison requires at least 2 images")
+    if len(files) > MAX_COMPARE_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many images ({len(files)}); the limit is {MAX_COMPARE_FILES}"
+        )
+    
+    async def predict_scan(image_bytes):
+        image_hash = content_hash(image_bytes)
+        prediction = await result_cache.get_async(image_hash, prediction_field())
+        if prediction is not None:
+            image = await inference_executor.run(decode_image, image_bytes)
+        else:
+            image, image_tensor = await inference_executor.run(load_image_and_tensor, image_bytes)
+            probabilities = await inference_engine.predict(image_tensor)
+            prediction = format_prediction(probabilities)
+            await result_cache.set_async(image_hash, prediction_field(), prediction)
+        return image_hash, image, prediction
+    
+    try:
+        uploads = [await read_upload(upload) for upload in files]
+        scans = await asyncio.gather(*[predict_scan(image_bytes) for image_bytes in uploads])
+        
+        comparison = None
+        if explainer:
+            comparison = await explainer.generate_comparison_analysis_async(
+                [(image, prediction["prediction"]["class"], prediction["prediction"]["confidence"])
+                 for _, image, prediction in scans],
+                image_hashes=[image_hash for image_hash, _, _ in scans]
+            )
+        
+        return {
+            "scans": [
+                {"index": index, "filename": upload.filename, **prediction}
+                for index, (upload, (_, _, prediction)) in enumerate(zip(files, scans))
+            ],
+            "comparison": comparison,
+            "status": "success"
+        }
+        
+    except ExecutorSaturatedError as e:
+        ERRORS_TOTAL.inc(stage='rejected')
+        logger.warning(f"Comparison rejected: {e}")
+        raise HTTPException(status_code=503, detail="Server busy, please retry")
+    except Exception as e:
+        logger.error(f"Comparison error: {e}")
+        raise HTTPException(status_code=500, detail=f"Comparison failed: {str(e)}")
+
+@app.get("/maps/{map_id}")
+async def get_saliency_map(map_id: str):
+    """Download a saliency map returned by reference from /analyze"""
+    encoded_map = map_store.get(map_id) if map_store is not None else None
+    if encoded_map is None:
+        raise HTTPException(status_code=404, detail="Saliency map not found or expired")
+    
+    headers = {"Cache-Control": "private, max-age=60"}
+    if encoded_map.encoding != 'png':
+        headers["X-Dtype"] = encoded_map.encoding
+        headers["X-Shape"] = ",".join(str(d) for d in encoded_map.shape)
+    return Response(content=encoded_map.data, media_type=encoded_map.media_type, headers=headers)
+
+@app.get("/admin/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    """List stored request profiles, newest first"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Missing or invalid admin token (PROFILE_ADMIN_TOKEN)")
+    profiles = await asyncio.to_thread(profile_store.list)
+    return {
+        "enabled": PROFILE_ENABLED,
+        "sample_rate": PROFILE_SAMPLE_RATE,
+        "max_profiles": profile_store.max_profiles,
+        "profiles": profiles
+    }
+
+@app.get("/admin/profiles/{profile_id}/{filename}")
+async def download_profile_file(profile_id: str, filename: str, x_admin_token: Optional[str] = Header(None)):
+    """Download a Chrome trace (open in chrome://tracing or Perfetto), operator table or stacks file"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="Missing or invalid admin token (PROFILE_ADMIN_TOKEN)")
+    path = await asyncio.to_thread(profile_store.file_path, profile_id, filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile file not found")
+    media_type = "application/json" if path.suffix == ".json" else "text/plain"
+    return FileResponse(path, media_type=media_type, filename=filename)
+
 @app.get("/classes")
 async def get_classes():
     """Get available classes"""
@@ -299,11 +1274,13 @@ async def get_model_info():
         "classes": len(class_names),
         "class_names": class_names,
         "device": str(device),
+        "inference_backend": serving_backend,
         "features": [
             "Transfer learning from ImageNet",
             "Data augmentation",
             "Grad-CAM saliency maps",
             "Integrated gradients",
+            "Occlusion sensitivity",
             "Multi-modal explanations"
         ]
     }
@@ -0,0 +1,164 @@
+import base64
+import io
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+MAP_ENCODINGS = ('png', 'uint8', 'float16')
+DEFAULT_PNG_LEVEL = 6  # PIL's default zlib level
+RESPONSE_FORMATS = ('json', 'multipart', 'msgpack')
+MEDIA_TYPES = {
+    'png': 'image/png',
+    'uint8': 'application/octet-stream',
+    'float16': 'application/octet-stream',
+}
+
+
+def encoding_id(encoding, png_level=DEFAULT_PNG_LEVEL):
+    """Cache/field suffix identifying an encoding ('png' means PNG at the default level)"""
+    if encoding == 'png' and png_level != DEFAULT_PNG_LEVEL:
+        return f"png{png_level}"
+    return encoding
+
+
+def encode_map(array, encoding='png', png_level=DEFAULT_PNG_LEVEL):
+    """Encode a [0, 1] float saliency map as PNG, raw uint8 or raw float16 bytes"""
+    if encoding == 'float16':
+        return np.ascontiguousarray(array, dtype=np.float16).tobytes()
+
+    # Normalize to 0-255
+    array_normalized = (array * 255).astype(np.uint8)
+    if encoding == 'uint8':
+        return array_normalized.tobytes()
+    if encoding != 'png':
+        raise ValueError(f"Unknown map encoding '{encoding}', choose from {list(MAP_ENCODINGS)}")
+
+    buffer = io.BytesIO()
+    Image.fromarray(array_normalized, mode='L').save(buffer, format='PNG', compress_level=png_level)
+    return buffer.getvalue()
+
+
+class EncodedMap:
+    """Encoded saliency map bytes plus what a client needs to decode them"""
+
+    __slots__ = ('data', 'encoding', 'shape')
+
+    def __init__(self, data, encoding, shape):
+        self.data = data
+        self.encoding = encoding
+        self.shape = list(shape)
+
+    @classmethod
+    def from_array(cls, array, encoding='png', png_level=DEFAULT_PNG_LEVEL):
+        return cls(encode_map(array, encoding, png_level), encoding, array.shape)
+
+    @property
+    def media_type(self):
+        return MEDIA_TYPES[self.encoding]
+
+    def describe(self):
+        """JSON-safe metadata; raw encodings are row-major with this dtype and shape"""
+        info = {"encoding": self.encoding, "media_type": self.media_type, "bytes": len(self.data)}
+        if self.encoding != 'png':
+            info.update(dtype=self.encoding, shape=self.shape)
+        return info
+
+    def to_cache(self):
+        """Cache value: the base64 PNG string used historically, or a dict for raw arrays"""
+        encoded = base64.b64encode(self.data).decode()
+        if self.encoding == 'png':
+            return encoded
+        return {"shape": self.shape, "data": encoded}
+
+    @classmethod
+    def from_cache(cls, value, encoding):
+        if encoding == 'png':
+            return cls(base64.b64decode(value), encoding, [])
+        return cls(base64.b64decode(value["data"]), encoding, value["shape"])
+
+
+def json_maps(maps):
+    """Maps for a JSON body: PNGs stay bare base64 strings, raw arrays carry dtype/shape"""
+    result = {}
+    for name, encoded_map in maps.items():
+        if encoded_map.encoding == 'png':
+            result[name] = base64.b64encode(encoded_map.data).decode()
+        else:
+            result[name] = {**encoded_map.describe(), "data": base64.b64encode(encoded_map.data).decode()}
+    return result
+
+
+def encode_multipart(payload, maps):
+    """multipart/mixed body: the JSON payload first, then one raw part per map"""
+    boundary = secrets.token_hex(16)
+    payload = {**payload, "saliency_maps": {name: m.describe() for name, m in maps.items()}}
+
+    chunks = [
+        f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode(),
+        json.dumps(payload).encode(),
+    ]
+    for name, encoded_map in maps.items():
+        headers = [f"Content-Type: {encoded_map.media_type}", f'Content-Disposition: inline; name="{name}"']
+        if encoded_map.encoding != 'png':
+            headers.append(f"X-Dtype: {encoded_map.encoding}")
+            headers.append(f"X-Shape: {','.join(str(d) for d in encoded_map.shape)}")
+        header_block = "".join(f"{header}\r\n" for header in headers)
+        chunks.append(f"\r\n--{boundary}\r\n{header_block}\r\n".encode())
+        chunks.append(encoded_map.data)
+    chunks.append(f"\r\n--{boundary}--\r\n".encode())
+    return b"".join(chunks), f"multipart/mixed; boundary={boundary}"
+
+
+def encode_msgpack(payload, maps):
+    """msgpack body with map bytes embedded as binary fields"""
+    import msgpack
+
+    payload = {
+        **payload,
+        "saliency_maps": {name: {**m.describe(), "data": m.data} for name, m in maps.items()}
+    }
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def negotiate_format(accept):
+    """Pick a response format from an Accept header (JSON unless a binary type is preferred)"""
+    accept = (accept or '').lower()
+    if 'application/msgpack' in accept or 'application/x-msgpack' in accept:
+        return 'msgpack'
+    if 'multipart/mixed' in accept:
+        return 'multipart'
+    return 'json'
+
+
+class MapStore:
+    """Short-lived in-memory store backing ``/maps/{id}`` downloads"""
+
+    def __init__(self, ttl=300.0, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max(1, int(max_entries))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, encoded_map):
+        map_id = secrets.token_urlsafe(16)
+        with self._lock:
+            self._entries[map_id] = (time.monotonic() + self.ttl, encoded_map)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return map_id
+
+    def get(self, map_id):
+        with self._lock:
+            entry = self._entries.get(map_id)
+            if entry is None:
+                return None
+            expires, encoded_map = entry
+            if expires <= time.monotonic():
+                del self._entries[map_id]
+                return None
+            return encoded_map
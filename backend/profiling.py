@@ -0,0 +1,193 @@
+import contextvars
+import json
+import re
+import secrets
+import shutil
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Set only for sampled requests; everything else sees None and skips profiling
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{8}T[0-9]{9}-[0-9a-f]{8}$")
+
+# Kineto allows one active torch.profiler per process
+_profiler_lock = threading.Lock()
+
+
+def job_name(fn):
+    """Filename-safe name of a job callable (unwrapping ``functools.partial``)"""
+    fn = getattr(fn, "func", fn)
+    return re.sub(r"[^A-Za-z0-9_]+", "", getattr(fn, "__name__", "")) or "job"
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval from a helper thread
+
+    Produces collapsed stacks (``outer;inner;leaf count``) that flame graph
+    tools read directly.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+class ProfileSession:
+    """Profiles every inference-pool job of one request into its own directory
+
+    Each job runs under ``torch.profiler`` plus a ``StackSampler`` on the
+    worker thread and writes a Chrome trace, an operator table and collapsed
+    Python stacks as soon as it finishes, so the event loop never serializes
+    traces. Ops from concurrent jobs on other workers may appear in a trace,
+    and a job that starts while another request holds the profiler runs
+    unprofiled and is recorded as skipped.
+    """
+
+    def __init__(self, root, method, path, reason, sample_interval=0.005):
+        created = datetime.now(timezone.utc)
+        # Millisecond timestamp first so names sort oldest to newest
+        self.profile_id = f"{created.strftime('%Y%m%dT%H%M%S')}{created.microsecond // 1000:03d}-{secrets.token_hex(4)}"
+        self.directory = Path(root) / self.profile_id
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.sample_interval = sample_interval
+        self.meta = {
+            "id": self.profile_id,
+            "created": created.isoformat(),
+            "method": method,
+            "path": path,
+            "reason": reason,
+            "jobs": []
+        }
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def wrap(self, fn):
+        """Return ``fn`` instrumented to profile itself on whichever thread runs it"""
+        def profiled(*args):
+            if not _profiler_lock.acquire(blocking=False):
+                self._record({"function": job_name(fn), "skipped": "profiler busy"})
+                return fn(*args)
+            try:
+                return self._profile(fn, args)
+            finally:
+                _profiler_lock.release()
+        return profiled
+
+    def _profile(self, fn, args):
+        import torch.profiler
+
+        function = job_name(fn)
+        with self._lock:
+            index = len(self.meta["jobs"])
+        name = f"{index:02d}_{function}"
+
+        sampler = StackSampler(threading.get_ident(), self.sample_interval).start()
+        start = time.perf_counter()
+        try:
+            with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU],
+                                        record_shapes=True) as prof:
+                with torch.profiler.record_function(function):
+                    result = fn(*args)
+        finally:
+            seconds = time.perf_counter() - start
+            stacks = sampler.stop()
+
+        prof.export_chrome_trace(str(self.directory / f"{name}.trace.json"))
+        (self.directory / f"{name}.ops.txt").write_text(
+            prof.key_averages(group_by_input_shape=True).table(sort_by="self_cpu_time_total", row_limit=40)
+        )
+        (self.directory / f"{name}.stacks.txt").write_text(
+            "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        )
+        self._record({"function": function, "seconds": seconds, "files": [
+            f"{name}.trace.json", f"{name}.ops.txt", f"{name}.stacks.txt"
+        ]})
+        return result
+
+    def _record(self, job):
+        with self._lock:
+            self.meta["jobs"].append(job)
+
+    def finish(self, status_code):
+        """Write the session summary (blocking; call off the event loop)"""
+        with self._lock:
+            self.meta["status"] = status_code
+            self.meta["seconds"] = time.perf_counter() - self._start
+            (self.directory / "meta.json").write_text(json.dumps(self.meta, indent=2))
+
+
+class ProfileStore:
+    """Bounded on-disk ring buffer of profile directories (oldest removed first)"""
+
+    def __init__(self, root="profiles", max_profiles=20):
+        self.root = Path(root)
+        self.max_profiles = max(1, int(max_profiles))
+        self._lock = threading.Lock()
+
+    def start(self, method, path, reason, sample_interval=0.005):
+        return ProfileSession(self.root, method, path, reason, sample_interval)
+
+    def finish(self, session, status_code):
+        session.finish(status_code)
+        with self._lock:
+            # Directories without meta.json belong to sessions still recording
+            profiles = [p for p in self._profile_dirs() if (p / "meta.json").exists()]
+            for stale in profiles[:-self.max_profiles]:
+                shutil.rmtree(stale, ignore_errors=True)
+
+    def _profile_dirs(self):
+        if not self.root.exists():
+            return []
+        return sorted(p for p in self.root.iterdir() if p.is_dir() and PROFILE_ID_PATTERN.match(p.name))
+
+    def list(self):
+        """Summaries of stored profiles, newest first"""
+        profiles = []
+        for directory in reversed(self._profile_dirs()):
+            meta_path = directory / "meta.json"
+            if not meta_path.exists():
+                continue  # still being recorded
+            meta = json.loads(meta_path.read_text())
+            meta["files"] = sorted(p.name for p in directory.iterdir() if p.is_file())
+            profiles.append(meta)
+        return profiles
+
+    def file_path(self, profile_id, filename):
+        """Path of a stored file, or None (names are validated against the store)"""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        directory = self.root / profile_id
+        if not directory.is_dir():
+            return None
+        for path in directory.iterdir():
+            if path.is_file() and path.name == filename:
+                return path
+        return None
@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from tiered_cache import TieredCache
+
+
+def content_hash(data):
+    """SHA-256 hex digest of uploaded bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def weights_version(model_path, chunk_size=1024 * 1024):
+    """Short content hash identifying a model weights file
+
+    The file is hashed in chunks instead of being read into memory, and the
+    result is remembered in a ``<weights>.version`` sidecar keyed on size and
+    modification time, so later startups skip hashing until the file changes.
+    """
+    model_path = Path(model_path)
+    stat = model_path.stat()
+    sidecar = model_path.with_name(model_path.name + ".version")
+    try:
+        recorded = json.loads(sidecar.read_text())
+        if recorded["size"] == stat.st_size and recorded["mtime_ns"] == stat.st_mtime_ns:
+            return recorded["version"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    version = digest.hexdigest()[:16]
+
+    try:
+        sidecar.write_text(json.dumps({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "version": version}))
+    except OSError:
+        pass  # read-only model directory: hash again next startup
+    return version
+
+
+class ResultCache(TieredCache):
+    """Content-addressed cache for per-upload results.
+
+    Entries are keyed on the SHA-256 of the uploaded bytes, the model weights
+    version and a field name such as ``prediction`` or ``saliency:gradcam``,
+    so each artefact of an analysis is cached separately and a ``/predict``
+    hit can be reused by a later ``/analyze``. LLM explanations have their
+    own cache (``explanation_cache.py``).
+
+    Values must be JSON-serializable. They are held as encoded JSON in an
+    in-memory LRU tier bounded by ``max_bytes`` and, when ``disk_path`` is
+    given, written through to a SQLite tier bounded by ``disk_max_bytes``.
+    Code on the event loop uses ``get_async``/``set_async``, which answer
+    memory hits inline and move SQLite work onto a thread.
+    """
+
+    def __init__(self, model_version, max_bytes=256 * 1024 * 1024, disk_path=None,
+                 disk_max_bytes=2 * 1024 * 1024 * 1024):
+        self.model_version = model_version
+        self.max_bytes = int(max_bytes)
+        self.disk_max_bytes = int(disk_max_bytes)
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        self._db = None
+        self._disk_size = 0
+        if disk_path:
+            Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(disk_path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self._db.commit()
+            # Tracked incrementally from here on, so writes never scan the table
+            self._disk_size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def _key(self, image_hash, field):
+        return f"{self.model_version}:{image_hash}:{field}"
+
+    def get(self, image_hash, field):
+        """Return the cached value for an upload field, or None on a miss"""
+        value = self._get_memory(image_hash, field)
+        if value is not None:
+            return value
+
+        key = self._key(image_hash, field)
+        with self._lock:
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._db.execute(
+                        "UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key)
+                    )
+                    self._db.commit()
+                    encoded = bytes(row[0])
+                    self._store_memory(key, encoded)
+                    self._disk_hits += 1
+                    return json.loads(encoded)
+
+            self._misses += 1
+            return None
+
+    def _get_memory(self, image_hash, field):
+        key = self._key(image_hash, field)
+        with self._lock:
+            encoded = self._entries.get(key)
+            if encoded is None:
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+        return json.loads(encoded)
+
+    def set(self, image_hash, field, value):
+        """Cache a JSON-serializable value for an upload field"""
+        key = self._key(image_hash, field)
+        encoded = json.dumps(value, separators=(',', ':')).encode()
+
+        with self._lock:
+            self._store_memory(key, encoded)
+
+            if self._db is not None:
+                previous = self._db.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, accessed) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, encoded, len(encoded), time.time())
+                )
+                self._disk_size += len(encoded) - (previous[0] if previous else 0)
+                self._prune_disk()
+                self._db.commit()
+
+    async def set_async(self, image_hash, field, value):
+        """``set`` for the event loop: SQLite writes run on a thread"""
+        if self._db is not None:
+            await asyncio.to_thread(self.set, image_hash, field, value)
+        else:
+            self.set(image_hash, field, value)
+
+    def _store_memory(self, key, encoded):
+        if len(encoded) > self.max_bytes:
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+
+        self._entries[key] = encoded
+        self._size += len(encoded)
+
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._evictions += 1
+
+    def _prune_disk(self):
+        if self._disk_size <= self.disk_max_bytes:
+            return
+
+        rows = self._db.execute("SELECT key, size FROM results ORDER BY accessed")
+        stale = []
+        for key, size in rows:
+            if self._disk_size <= self.disk_max_bytes:
+                break
+            stale.append((key,))
+            self._disk_size -= size
+        self._db.executemany("DELETE FROM results WHERE key = ?", stale)
+
+    def get_stats(self):
+        """Return hit/miss counters and tier sizes"""
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                "model_version": self.model_version,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "disk_hits": self._disk_hits,
+                "misses": self._misses,
+                "hit_rate": (self._hits + self._disk_hits) / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "disk_bytes": self._disk_size,
+                "disk_enabled": self._db is not None,
+            }
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
@@ -1,10 +1,9 @@
+import threading
+
 import torch
 import torch.nn.functional as F
 import numpy as np
-import cv2
 from PIL import Image
-import matplotlib.pyplot as plt
-import matplotlib.cm as cm
 
 class SaliencyMapGenerator:
     def __init__(self, model, device='cuda' if torch.cuda.is_available() else 'cpu'):
@@ -12,112 +11,179 @@ class SaliencyMapGenerator:
         self.device = device
         self.model.eval()
         
-    def generate_gradcam(self, image_tensor, target_class=None, target_layer_name='layer4'):
-        """Generate Grad-CAM saliency map"""
-        # Store gradients
-        gradients = []
-        activations = []
+        # Grad-CAM target layers with persistent capture hooks, resolved once
+        self._target_layers = {}
+        self._target_layers_lock = threading.Lock()
+        # Per-thread capture state so concurrent workers never share activations
+        self._capture = threading.local()
+    
+    def _get_target_layer(self, target_layer_name):
+        """Resolve the Grad-CAM target layer and attach its capture hook once"""
+        target_layer = self._target_layers.get(target_layer_name)
+        if target_layer is not None:
+            return target_layer
         
-        def forward_hook(module, input, output):
-            activations.append(output)
+        with self._target_layers_lock:
+            if target_layer_name in self._target_layers:
+                return self._target_layers[target_layer_name]
             
-        def backward_hook(module, grad_input, grad_output):
-            gradients.append(grad_output[0])
-        
-        # Register hooks
-        target_layer = None
-        for name, module in self.model.named_modules():
-            if target_layer_name in name:
-                target_layer = module
-                break
-                
-        if target_layer is None:
-            # Fallback to last conv layer
-            for module in self.model.modules():
-                if isinstance(module, torch.nn.Conv2d):
+            for name, module in self.model.named_modules():
+                if target_layer_name in name:
                     target_layer = module
+                    break
+            
+            if target_layer is None:
+                # Fallback to last conv layer
+                for module in self.model.modules():
+                    if isinstance(module, torch.nn.Conv2d):
+                        target_layer = module
+            
+            def capture_hook(module, input, output):
+                # Only record when this thread asked for this layer
+                if getattr(self._capture, 'layer_name', None) == target_layer_name:
+                    self._capture.activations = output
+            
+            target_layer.register_forward_hook(capture_hook)
+            self._target_layers[target_layer_name] = target_layer
+            return target_layer
+    
+    def predict_and_explain(self, image_tensor, target_class=None, target_layer_name='layer4'):
+        """Run one forward pass and return logits, probabilities and the Grad-CAM map
         
-        forward_handle = target_layer.register_forward_hook(forward_hook)
-        backward_handle = target_layer.register_backward_hook(backward_hook)
+        Target layer activations are captured by a persistent hook and
+        differentiated directly with ``autograd.grad``, so the prediction and
+        the CAM come from the same forward pass. Without ``target_class`` the
+        CAM explains the predicted class.
+        """
+        self._get_target_layer(target_layer_name)
         
-        # Forward pass
-        image_tensor = image_tensor.unsqueeze(0).to(self.device)
-        image_tensor.requires_grad_(True)
+        image_batch = image_tensor.unsqueeze(0).to(self.device)
+        image_batch.requires_grad_(True)
         
-        output = self.model(image_tensor)
+        self._capture.layer_name = target_layer_name
+        self._capture.activations = None
+        try:
+            with torch.enable_grad():
+                logits = self.model(image_batch)
+            activations = self._capture.activations
+        finally:
+            self._capture.layer_name = None
+            self._capture.activations = None
         
+        probabilities = F.softmax(logits.detach(), dim=1)[0]
         if target_class is None:
-            target_class = output.argmax(dim=1).item()
-        
-        # Backward pass
-        self.model.zero_grad()
-        one_hot = torch.zeros_like(output)
-        one_hot[0][target_class] = 1
-        output.backward(gradient=one_hot, retain_graph=True)
+            target_class = int(probabilities.argmax())
         
         # Generate CAM
-        if gradients and activations:
-            gradients_val = gradients[0].cpu().data.numpy()[0]
-            activations_val = activations[0].cpu().data.numpy()[0]
-            
-            weights = np.mean(gradients_val, axis=(1, 2))
-            cam = np.zeros(activations_val.shape[1:], dtype=np.float32)
+        if activations is not None and activations.requires_grad:
+            gradients = torch.autograd.grad(logits[0, target_class], activations)[0]
             
-            for i, w in enumerate(weights):
-                cam += w * activations_val[i]
-                
-            cam = np.maximum(cam, 0)
-            cam = cv2.resize(cam, (224, 224))
-            cam = (cam - cam.min()) / (cam.max() - cam.min())
+            # Channel weights are the spatially averaged gradients
+            weights = gradients.mean(dim=(2, 3), keepdim=True)
+            cam = F.relu((weights * activations.detach()).sum(dim=1, keepdim=True))
+            cam = F.interpolate(cam, size=image_batch.shape[2:], mode='bilinear', align_corners=False)[0, 0]
+            cam = (cam - cam.min()) / (cam.max() - cam.min()).clamp(min=1e-12)
+            cam = cam.cpu().numpy()
         else:
-            cam = np.zeros((224, 224))
+            cam = np.zeros(tuple(image_batch.shape[2:]), dtype=np.float32)
+        
+        return logits.detach()[0].cpu(), probabilities.cpu(), cam
+    
+    def generate_gradcam(self, image_tensor, target_class=None, target_layer_name='layer4'):
+        """Generate Grad-CAM saliency map"""
+        _, probabilities, cam = self.predict_and_explain(
+            image_tensor, target_class, target_layer_name
+        )
         
-        # Clean up
-        forward_handle.remove()
-        backward_handle.remove()
+        if target_class is None:
+            target_class = int(probabilities.argmax())
+        
+        return cam, target_class, probabilities.numpy()
+    
+    @staticmethod
+    def _integration_points(steps, method):
+        """Return interpolation alphas and their weights for a Riemann rule"""
+        if method == 'riemann_trapezoid':
+            if steps < 2:
+                raise ValueError("riemann_trapezoid needs at least 2 steps")
+            alphas = torch.linspace(0, 1, steps)
+            weights = torch.full((steps,), 1.0 / (steps - 1))
+            weights[0] /= 2
+            weights[-1] /= 2
+            return alphas, weights
         
-        return cam, target_class, F.softmax(output, dim=1).cpu().data.numpy()[0]
+        offsets = {'riemann_left': 0.0, 'riemann_middle': 0.5, 'riemann_right': 1.0}
+        if method not in offsets:
+            raise ValueError(f"Unknown integration method: {method}")
+        alphas = (torch.arange(steps, dtype=torch.float32) + offsets[method]) / steps
+        weights = torch.full((steps,), 1.0 / steps)
+        return alphas, weights
     
-    def generate_integrated_gradients(self, image_tensor, target_class=None, steps=50):
-        """Generate Integrated Gradients saliency map"""
+    def generate_integrated_gradients(self, image_tensor, target_class=None, steps=50,
+                                      internal_batch_size=16, method='riemann_trapezoid',
+                                      baseline=None, return_convergence_delta=False):
+        """Generate Integrated Gradients saliency map
+        
+        Interpolated inputs are evaluated ``internal_batch_size`` at a time, with
+        one ``autograd.grad`` call per chunk, so peak memory is bounded by the
+        chunk size rather than by ``steps``. ``method`` selects the Riemann rule
+        (left, right, middle or trapezoid). With ``return_convergence_delta``
+        the absolute gap between the summed attributions and the score
+        difference between input and baseline is returned as a third value.
+        """
         image_tensor = image_tensor.unsqueeze(0).to(self.device)
         
         if target_class is None:
-            output = self.model(image_tensor)
+            with torch.no_grad():
+                output = self.model(image_tensor)
             target_class = output.argmax(dim=1).item()
         
-        # Create baseline (black image)
-        baseline = torch.zeros_like(image_tensor)
+        # Default baseline is a black image
+        if baseline is None:
+            baseline = torch.zeros_like(image_tensor)
+        else:
+            baseline = baseline.reshape_as(image_tensor).to(self.device)
         
-        # Generate path from baseline to input
-        alphas = torch.linspace(0, 1, steps)
+        alphas, weights = self._integration_points(steps, method)
+        alphas = alphas.to(self.device).view(-1, 1, 1, 1)
+        weights = weights.to(self.device).view(-1, 1, 1, 1)
+        difference = image_tensor - baseline
         integrated_grads = torch.zeros_like(image_tensor)
+        chunk_size = max(1, int(internal_batch_size))
         
-        for alpha in alphas:
-            interpolated_input = baseline + alpha * (image_tensor - baseline)
-            interpolated_input.requires_grad_(True)
+        for start in range(0, steps, chunk_size):
+            # Build this chunk of the path from baseline to input in one op
+            chunk_alphas = alphas[start:start + chunk_size]
+            interpolated_inputs = (baseline + chunk_alphas * difference).requires_grad_(True)
             
-            output = self.model(interpolated_input)
-            self.model.zero_grad()
+            output = self.model(interpolated_inputs)
             
-            grad = torch.autograd.grad(
-                outputs=output[0, target_class],
-                inputs=interpolated_input,
-                create_graph=True
+            # Samples are independent in eval mode, so the summed score gives
+            # every sample's gradient in a single backward pass
+            grads = torch.autograd.grad(
+                outputs=output[:, target_class].sum(),
+                inputs=interpolated_inputs
             )[0]
             
-            integrated_grads += grad / steps
+            integrated_grads += (grads * weights[start:start + chunk_size]).sum(dim=0, keepdim=True)
         
         # Scale by input difference
-        integrated_grads *= (image_tensor - baseline)
+        attributions = integrated_grads * difference
         
         # Convert to numpy and aggregate across channels
-        attribution_map = integrated_grads.squeeze().cpu().data.numpy()
+        attribution_map = attributions.squeeze(0).detach().cpu().numpy()
         attribution_map = np.transpose(attribution_map, (1, 2, 0))
         attribution_map = np.sum(np.abs(attribution_map), axis=2)
         
         # Normalize
-        attribution_map = (attribution_map - attribution_map.min()) / (attribution_map.max() - attribution_map.min())
+        value_range = attribution_map.max() - attribution_map.min()
+        attribution_map = (attribution_map - attribution_map.min()) / max(value_range, 1e-12)
+        
+        if return_convergence_delta:
+            with torch.no_grad():
+                scores = self.model(torch.cat([image_tensor, baseline]))[:, target_class]
+            delta = (attributions.sum() - (scores[0] - scores[1])).abs().item()
+            return attribution_map, target_class, delta
         
         return attribution_map, target_class
     
@@ -133,6 +199,9 @@ class SaliencyMapGenerator:
             original_image = torch.clamp(original_image, 0, 1)
             original_image = original_image.permute(1, 2, 0).cpu().numpy()
         
+        # Imported here so serving never pays for matplotlib
+        import matplotlib.pyplot as plt
+        
         # Create figure
         fig, axes = plt.subplots(1, 3, figsize=(15, 5))
         
@@ -155,41 +224,60 @@ class SaliencyMapGenerator:
         plt.tight_layout()
         return fig
     
-    def generate_occlusion_map(self, image_tensor, target_class=None, patch_size=20, stride=10):
-        """Generate occlusion sensitivity map"""
-        image_tensor = image_tensor.unsqueeze(0).to(self.device)
-        
-        if target_class is None:
-            output = self.model(image_tensor)
-            target_class = output.argmax(dim=1).item()
-            baseline_confidence = F.softmax(output, dim=1)[0, target_class].item()
-        else:
-            output = self.model(image_tensor)
-            baseline_confidence = F.softmax(output, dim=1)[0, target_class].item()
+    def generate_occlusion_map(self, image_tensor, target_class=None, patch_size=20, stride=10,
+                               internal_batch_size=32, occlusion_value=0.0):
+        """Generate occlusion sensitivity map
         
-        # Get image dimensions
+        Patch positions are expressed as a batch of binary masks, and the
+        occluded variants are evaluated ``internal_batch_size`` at a time.
+        Each pixel's importance is the average confidence drop over every
+        patch that covered it.
+        """
+        image_tensor = image_tensor.unsqueeze(0).to(self.device)
         _, _, height, width = image_tensor.shape
         
-        # Initialize occlusion map
-        occlusion_map = np.zeros((height, width))
-        
-        # Slide occlusion patch across image
-        for y in range(0, height - patch_size + 1, stride):
-            for x in range(0, width - patch_size + 1, stride):
-                # Create occluded image
-                occluded_image = image_tensor.clone()
-                occluded_image[:, :, y:y+patch_size, x:x+patch_size] = 0
+        with torch.no_grad():
+            output = self.model(image_tensor)
+            if target_class is None:
+                target_class = output.argmax(dim=1).item()
+            baseline_confidence = F.softmax(output, dim=1)[0, target_class]
+            
+            # Top-left corners of every patch position
+            ys = torch.arange(0, height - patch_size + 1, stride, device=self.device)
+            xs = torch.arange(0, width - patch_size + 1, stride, device=self.device)
+            patch_ys = ys.repeat_interleave(len(xs))
+            patch_xs = xs.repeat(len(ys))
+            
+            rows = torch.arange(height, device=self.device)
+            cols = torch.arange(width, device=self.device)
+            importance_sum = torch.zeros(height, width, device=self.device)
+            coverage = torch.zeros(height, width, device=self.device)
+            chunk_size = max(1, int(internal_batch_size))
+            
+            for start in range(0, len(patch_ys), chunk_size):
+                chunk_ys = patch_ys[start:start + chunk_size, None]
+                chunk_xs = patch_xs[start:start + chunk_size, None]
                 
-                # Get prediction
-                with torch.no_grad():
-                    output = self.model(occluded_image)
-                    confidence = F.softmax(output, dim=1)[0, target_class].item()
+                # (P, H, W) masks, 1 inside each patch
+                row_mask = (rows >= chunk_ys) & (rows < chunk_ys + patch_size)
+                col_mask = (cols >= chunk_xs) & (cols < chunk_xs + patch_size)
+                masks = (row_mask[:, :, None] & col_mask[:, None, :]).to(image_tensor.dtype)
+                
+                occluded_images = (
+                    image_tensor * (1 - masks[:, None]) + occlusion_value * masks[:, None]
+                )
+                output = self.model(occluded_images)
+                confidences = F.softmax(output, dim=1)[:, target_class]
                 
                 # Calculate importance (difference from baseline)
-                importance = baseline_confidence - confidence
-                occlusion_map[y:y+patch_size, x:x+patch_size] = importance
+                importance = baseline_confidence - confidences
+                importance_sum += (importance[:, None, None] * masks).sum(dim=0)
+                coverage += masks.sum(dim=0)
+            
+            occlusion_map = (importance_sum / coverage.clamp(min=1)).cpu().numpy()
         
         # Normalize
-        occlusion_map = (occlusion_map - occlusion_map.min()) / (occlusion_map.max() - occlusion_map.min())
+        value_range = occlusion_map.max() - occlusion_map.min()
+        occlusion_map = (occlusion_map - occlusion_map.min()) / max(value_range, 1e-12)
         
         return occlusion_map, target_class
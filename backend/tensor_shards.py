@@ -0,0 +1,140 @@
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+
+SHARD_DIR = Path("data/shards")
+INDEX_NAME = "index.json"
+
+
+def load_resized(image_path, image_size=224):
+    """Decode an image once and resize it to a (3, H, W) uint8 array"""
+    with Image.open(image_path) as image:
+        image = image.convert('RGB').resize((image_size, image_size), Image.BILINEAR)
+        return np.asarray(image, dtype=np.uint8).transpose(2, 0, 1)
+
+
+def build_shards(image_paths, labels, output_dir=SHARD_DIR, image_size=224, shard_size=1024,
+                 num_workers=8):
+    """Write resized uint8 images into memory-mappable .npy shards plus an index file
+
+    Samples keep the order of ``image_paths`` so a split computed over the
+    index matches one computed over the original path list.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    shards = []
+    samples = []
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        for shard_id, start in enumerate(range(0, len(image_paths), shard_size)):
+            chunk_paths = image_paths[start:start + shard_size]
+            shard_name = f"shard_{shard_id:05d}.npy"
+            shard = np.lib.format.open_memmap(
+                output_dir / shard_name, mode='w+', dtype=np.uint8,
+                shape=(len(chunk_paths), 3, image_size, image_size)
+            )
+
+            # PIL releases the GIL while decoding and resizing
+            for offset, array in enumerate(pool.map(lambda p: load_resized(p, image_size), chunk_paths)):
+                shard[offset] = array
+            shard.flush()
+            del shard
+
+            shards.append({"file": shard_name, "count": len(chunk_paths)})
+            for offset, path in enumerate(chunk_paths):
+                samples.append({
+                    "path": str(path),
+                    "label": int(labels[start + offset]),
+                    "shard": shard_id,
+                    "offset": offset
+                })
+            print(f"  💾 {shard_name}: {len(chunk_paths)} images")
+
+    index = {"image_size": image_size, "layout": "NCHW", "shards": shards, "samples": samples}
+    index_path = output_dir / INDEX_NAME
+    index_path.write_text(json.dumps(index))
+    return index_path
+
+
+def load_shard_index(index_path):
+    return json.loads(Path(index_path).read_text())
+
+
+class ShardedBrainTumorDataset(Dataset):
+    """Reads preprocessed images from memory-mapped shards without decoding
+
+    Items are (3, H, W) uint8 tensors that share memory with the shard file,
+    so ``transform`` should hold only tensor-compatible augmentations and
+    the dtype conversion / normalization. Shards are opened lazily in each
+    DataLoader worker rather than pickled with the dataset.
+    """
+
+    def __init__(self, index_path, indices=None, transform=None):
+        self.index_path = Path(index_path)
+        index = load_shard_index(self.index_path)
+        self.shard_files = [self.index_path.parent / shard["file"] for shard in index["shards"]]
+        samples = index["samples"]
+        if indices is not None:
+            samples = [samples[i] for i in indices]
+        self.samples = samples
+        self.labels = [sample["label"] for sample in samples]
+        self.transform = transform
+        self.class_names = ['glioma', 'meningioma', 'notumor', 'pituitary']
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.samples)
+
+    def _get_shard(self, shard_id):
+        shard = self._shards.get(shard_id)
+        if shard is None:
+            # Copy-on-write mapping: tensors can wrap it without a copy or a
+            # read-only warning, and the file on disk is never modified
+            shard = np.load(self.shard_files[shard_id], mmap_mode='c')
+            self._shards[shard_id] = shard
+        return shard
+
+    def __getitem__(self, idx):
+        sample = self.samples[idx]
+        image = torch.from_numpy(self._get_shard(sample["shard"])[sample["offset"]])
+        label = sample["label"]
+
+        if self.transform:
+            image = self.transform(image)
+
+        return image, label
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess training images into tensor shards")
+    parser.add_argument('--data-dir', default="data")
+    parser.add_argument('--output-dir', default=str(SHARD_DIR))
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--shard-size', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    from train_model import find_training_images
+
+    image_paths, labels = find_training_images(args.data_dir)
+    print(f"🧩 Sharding {len(image_paths)} images into {args.output_dir}")
+    index_path = build_shards(
+        image_paths, labels, args.output_dir,
+        image_size=args.image_size, shard_size=args.shard_size, num_workers=args.workers
+    )
+    print(f"✅ Shard index written to {index_path}")
+
+
+if __name__ == "__main__":
+    main()
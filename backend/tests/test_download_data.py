@@ -0,0 +1,51 @@
+import io
+import zipfile
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from download_data import classify_member, ingest_archive, load_manifest  # noqa: E402
+
+
+def png_bytes(color):
+    buffer = io.BytesIO()
+    Image.new('RGB', (16, 16), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def test_classify_member():
+    assert classify_member("brain/Training/glioma/Tr-gl_0001.jpg") == ('train', 'glioma')
+    assert classify_member("Testing/notumor/Te-no_0001.PNG") == ('test', 'notumor')
+    assert classify_member("Training/glioma/notes.txt") is None
+    assert classify_member("Training/unknown/x.jpg") is None
+
+
+def test_classify_member_rejects_paths_outside_the_data_dir():
+    assert classify_member("Training/glioma/../../../x.jpg") is None
+    assert classify_member("/Training/glioma/x.jpg") is None
+
+
+def test_ingest_archive_skips_corrupt_images_and_indexes_duplicates_once(tmp_path):
+    archive_path = tmp_path / "dataset.zip"
+    with zipfile.ZipFile(archive_path, 'w') as archive:
+        archive.writestr("wrapper/Training/glioma/a.png", png_bytes((255, 0, 0)))
+        archive.writestr("wrapper/Training/glioma/b.png", png_bytes((255, 0, 0)))
+        archive.writestr("wrapper/Testing/pituitary/c.png", png_bytes((0, 0, 255)))
+        archive.writestr("wrapper/Testing/pituitary/broken.png", b"not an image")
+        archive.writestr("wrapper/README.txt", b"ignored")
+
+    data_dir = tmp_path / "data"
+    ingest_archive(archive_path, data_dir, num_workers=2)
+
+    rows = load_manifest(data_dir)
+    assert [row['path'] for row in rows] == ["Testing/pituitary/c.png", "Training/glioma/a.png"]
+    assert rows[0]['label'] == 3
+    assert rows[1]['width'] == 16
+    # The duplicate is left out of the manifest but never deleted
+    assert (data_dir / "Training/glioma/b.png").exists()
+    assert [row['path'] for row in load_manifest(data_dir, split='train')] == ["Training/glioma/a.png"]
+
+
+def test_load_manifest_without_a_manifest(tmp_path):
+    assert load_manifest(tmp_path) is None
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+from explanation_cache import ExplanationCache, confidence_bucket
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_key_uses_prompt_confidence_resolution():
+    cache = ExplanationCache()
+    assert cache.key("abc", "glioma", 0.91234) == cache.key("abc", "glioma", 0.91249)
+    assert cache.key("abc", "glioma", 0.912) != cache.key("abc", "glioma", 0.913)
+    assert confidence_bucket(0.5) == 500
+
+
+def test_key_is_scoped_to_the_explanation_source():
+    cache = ExplanationCache()
+    assert cache.key("abc", "glioma", 0.9, source="stub") != cache.key("abc", "glioma", 0.9, source="gemini:flash")
+
+
+def test_set_get_and_lru_eviction():
+    cache = ExplanationCache(max_entries=2)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}  # refreshes "a"
+    cache.set("c", {"v": 3})
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"v": 1}
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_expired_entries_are_not_served():
+    cache = ExplanationCache(ttl=0)
+    cache.set("a", {"v": 1})
+    assert cache.get("a") is None
+    assert cache.get_stats()["expirations"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = tmp_path / "explanations.sqlite3"
+    cache = ExplanationCache(disk_path=path)
+    cache.set("a", {"v": 1}, latency=0.5)
+    cache.close()
+
+    reopened = ExplanationCache(disk_path=path)
+    assert run(reopened.get_async("a")) == {"v": 1}
+    stats = reopened.get_stats()
+    assert stats["disk_hits"] == 1
+    assert stats["saved_latency_s"] == 0.5
+    reopened.close()
+
+
+def test_concurrent_callers_share_one_upstream_call():
+    cache = ExplanationCache()
+    calls = 0
+
+    async def factory():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"text": "ok"}
+
+    async def scenario():
+        return await asyncio.gather(*[cache.get_or_create("k", factory) for _ in range(5)])
+
+    assert run(scenario()) == [{"text": "ok"}] * 5
+    assert calls == 1
+    stats = cache.get_stats()
+    assert stats["misses"] == 1
+    assert stats["coalesced"] == 4
+    assert stats["in_flight"] == 0
+    assert cache.get("k") == {"text": "ok"}
+
+
+def test_cancelled_waiter_does_not_break_the_others():
+    cache = ExplanationCache()
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def factory():
+            await gate.wait()
+            return {"text": "ok"}
+
+        owner = asyncio.create_task(cache.get_or_create("k", factory))
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(cache.get_or_create("k", factory)) for _ in range(2)]
+        await asyncio.sleep(0)
+
+        waiters[0].cancel()
+        gate.set()
+        with pytest.raises(asyncio.CancelledError):
+            await waiters[0]
+        return await owner, await waiters[1]
+
+    assert run(scenario()) == ({"text": "ok"}, {"text": "ok"})
+
+
+def test_cancelled_owner_leaves_the_call_running_for_waiters():
+    cache = ExplanationCache()
+    calls = 0
+
+    async def factory():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"text": "ok"}
+
+    async def scenario():
+        owner = asyncio.create_task(cache.get_or_create("k", factory))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_create("k", factory))
+        await asyncio.sleep(0)
+
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await waiter
+
+    assert run(scenario()) == {"text": "ok"}
+    assert calls == 1
+
+
+def test_waiters_retry_when_the_shared_call_is_cancelled():
+    cache = ExplanationCache()
+    calls = 0
+
+    async def factory():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise asyncio.CancelledError()
+        return {"text": "second"}
+
+    assert run(cache.get_or_create("k", factory)) == {"text": "second"}
+    assert calls == 2
+
+
+def test_failures_propagate_and_are_not_cached():
+    cache = ExplanationCache()
+
+    async def failing():
+        raise RuntimeError("upstream down")
+
+    with pytest.raises(RuntimeError):
+        run(cache.get_or_create("k", failing))
+    assert cache.get_stats()["in_flight"] == 0
+
+    async def fallback():
+        return {"text": "fallback", "error": "upstream down"}
+
+    result = run(cache.get_or_create("k", fallback, cacheable=lambda value: "error" not in value))
+    assert result["text"] == "fallback"
+    assert cache.get("k") is None
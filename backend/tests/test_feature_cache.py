@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+
+import feature_cache  # noqa: E402
+from feature_cache import FeatureCache  # noqa: E402
+
+
+@pytest.fixture
+def hash_calls(monkeypatch):
+    calls = []
+
+    def counting_hash(path):
+        calls.append(path)
+        return f"hash-{open(path, 'rb').read().decode()}"
+
+    monkeypatch.setattr(feature_cache, "image_hash", counting_hash)
+    return calls
+
+
+def test_unchanged_images_are_not_read_again(tmp_path, hash_calls):
+    image = tmp_path / "scan.png"
+    image.write_bytes(b"abc")
+    cache = FeatureCache(torch.nn.Linear(2, 2), tmp_path / "cache")
+
+    assert cache._content_hash(image) == "hash-abc"
+    assert cache._content_hash(image) == "hash-abc"
+    assert len(hash_calls) == 1
+
+    # The remembered hashes survive a restart
+    cache._save_files()
+    reopened = FeatureCache(torch.nn.Linear(2, 2), tmp_path / "cache")
+    assert reopened._content_hash(image) == "hash-abc"
+    assert len(hash_calls) == 1
+
+
+def test_changed_images_are_hashed_again(tmp_path, hash_calls):
+    image = tmp_path / "scan.png"
+    image.write_bytes(b"abc")
+    cache = FeatureCache(torch.nn.Linear(2, 2), tmp_path / "cache")
+    cache._content_hash(image)
+
+    image.write_bytes(b"xyz")
+    stat = image.stat()
+    os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert cache._content_hash(image) == "hash-xyz"
+    assert len(hash_calls) == 2
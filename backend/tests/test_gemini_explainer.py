@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("dotenv")
+pytest.importorskip("PIL")
+
+from explanation_cache import ExplanationCache  # noqa: E402
+from gemini_explainer import CircuitBreaker, ExplanationClient, GeminiExplainer  # noqa: E402
+
+
+class SleepingClient(ExplanationClient):
+    def __init__(self, delay=10.0, text="ok"):
+        self.delay = delay
+        self.text = text
+
+    async def generate(self, prompt, images):
+        await asyncio.sleep(self.delay)
+        return self.text
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_admits_a_single_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    assert breaker.state == "half_open"
+    assert breaker.allow() == "trial"
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() is True
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout=60)
+    for _ in range(5):
+        breaker.record_failure()
+    breaker._opened_at -= 60  # let the reset timeout pass
+
+    assert breaker.allow() == "trial"
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_cancelled_trial_releases_the_slot():
+    explainer = GeminiExplainer(client=SleepingClient(), failure_threshold=1, reset_timeout=0)
+    explainer.breaker.record_failure()
+
+    async def scenario():
+        trial = asyncio.create_task(explainer._call_client("prompt", []))
+        await asyncio.sleep(0.01)
+        assert not explainer.breaker.allow()
+
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+        return explainer.breaker.allow()
+
+    assert asyncio.run(scenario()) == "trial"
+
+
+def test_timeouts_count_as_failures():
+    explainer = GeminiExplainer(client=SleepingClient(delay=1.0), timeout=0.01,
+                                failure_threshold=1, reset_timeout=60)
+
+    text, error = asyncio.run(explainer._call_client("prompt", []))
+    assert text is None
+    assert "timed out" in error
+    assert explainer.breaker.state == "open"
+
+    text, error = asyncio.run(explainer._call_client("prompt", []))
+    assert "circuit open" in error
+
+
+def test_successful_call_returns_text():
+    explainer = GeminiExplainer(client=SleepingClient(delay=0, text="explained"))
+    assert asyncio.run(explainer._call_client("prompt", [])) == ("explained", None)
+
+
+def test_cached_explanations_are_not_shared_between_clients(tmp_path):
+    path = tmp_path / "explanations.sqlite3"
+    stub = SleepingClient(delay=0, text="from stub")
+    stub.name = "stub"
+    first = GeminiExplainer(client=stub, cache=ExplanationCache(disk_path=path))
+    asyncio.run(first.generate_explanation_async(None, 'glioma', 0.9, image_hash="abc"))
+    assert asyncio.run(first.cached_explanation("abc", 'glioma', 0.9)) is not None
+    first.cache.close()
+
+    remote = SleepingClient(delay=0, text="from gemini")
+    remote.name = "gemini:gemini-1.5-flash"
+    second = GeminiExplainer(client=remote, cache=ExplanationCache(disk_path=path))
+    assert asyncio.run(second.cached_explanation("abc", 'glioma', 0.9)) is None
+    second.cache.close()
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from inference_engine import BatchingInferenceEngine  # noqa: E402
+from inference_executor import ExecutorSaturatedError, InferenceExecutor  # noqa: E402
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    return torch.nn.Linear(4, 3).eval()
+
+
+@pytest.fixture
+def executor():
+    pool = InferenceExecutor(num_workers=1, max_pending=4, threads_per_worker=1)
+    yield pool
+    pool.shutdown()
+
+
+def run_with_engine(engine, scenario):
+    async def wrapper():
+        await engine.start()
+        try:
+            return await scenario()
+        finally:
+            await engine.stop()
+
+    return asyncio.run(wrapper())
+
+
+def test_batches_concurrent_requests(model, executor):
+    engine = BatchingInferenceEngine(model, 'cpu', executor, max_batch_size=4, max_wait_ms=50)
+    inputs = [torch.randn(4) for _ in range(8)]
+
+    async def scenario():
+        return await asyncio.gather(*[engine.predict(tensor) for tensor in inputs])
+
+    results = run_with_engine(engine, scenario)
+
+    with torch.no_grad():
+        expected = torch.softmax(model(torch.stack(inputs)), dim=1)
+    assert torch.allclose(torch.stack(results), expected, atol=1e-6)
+    stats = engine.get_stats()
+    assert stats["items"] == 8
+    assert stats["batches"] < 8
+
+
+def test_sheds_load_when_its_queue_is_full(model, executor):
+    engine = BatchingInferenceEngine(model, 'cpu', executor, max_batch_size=1, max_queue_size=1)
+
+    async def scenario():
+        # The worker task has not run yet, so the first request fills the queue
+        first = asyncio.create_task(engine.predict(torch.randn(4)))
+        await asyncio.sleep(0)
+        with pytest.raises(ExecutorSaturatedError):
+            await engine.predict(torch.randn(4))
+        return await first
+
+    assert run_with_engine(engine, scenario).shape == (3,)
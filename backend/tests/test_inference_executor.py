@@ -0,0 +1,99 @@
+import asyncio
+import threading
+
+import pytest
+
+torch = pytest.importorskip("torch")
+
+from inference_executor import ExecutorSaturatedError, InferenceExecutor  # noqa: E402
+
+
+@pytest.fixture
+def executor():
+    pool = InferenceExecutor(num_workers=1, max_pending=2, threads_per_worker=1)
+    yield pool
+    pool.shutdown()
+
+
+def blocking_job(gate):
+    # Bounded wait so a failed assertion cannot leave the worker stuck forever
+    return lambda: gate.wait(5)
+
+
+async def wait_for_idle(executor):
+    # Slots are released by a done-callback on the worker thread
+    for _ in range(200):
+        if executor.get_stats()["pending"] == 0:
+            return
+        await asyncio.sleep(0.005)
+
+
+def test_rejects_bounded_jobs_beyond_max_pending(executor):
+    gate = threading.Event()
+
+    async def scenario():
+        jobs = [asyncio.create_task(executor.run(blocking_job(gate))) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(ExecutorSaturatedError):
+            await executor.run(blocking_job(gate))
+
+        # Unbounded jobs (the batching engine's) are not subject to the limit
+        unbounded = asyncio.create_task(executor.run(lambda: 42, bounded=False))
+        gate.set()
+        return await asyncio.gather(*jobs), await unbounded
+
+    assert asyncio.run(scenario()) == ([True, True], 42)
+    stats = executor.get_stats()
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 3
+
+
+def test_cancelled_caller_holds_its_slot_until_the_job_ends():
+    executor = InferenceExecutor(num_workers=1, max_pending=1, threads_per_worker=1)
+    gate = threading.Event()
+
+    async def scenario():
+        job = asyncio.create_task(executor.run(blocking_job(gate)))
+        await asyncio.sleep(0.01)
+        job.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await job
+
+        # The abandoned job is still running on the worker
+        with pytest.raises(ExecutorSaturatedError):
+            await executor.run(lambda: 1)
+
+        gate.set()
+        await wait_for_idle(executor)
+        return await executor.run(lambda: 1)
+
+    assert asyncio.run(scenario()) == 1
+    executor.shutdown()
+
+
+def test_failures_propagate_and_are_counted(executor):
+    def boom():
+        raise ValueError("bad input")
+
+    with pytest.raises(ValueError):
+        asyncio.run(executor.run(boom))
+    assert executor.get_stats()["failed"] == 1
+
+
+def test_unbounded_jobs_do_not_use_up_bounded_slots(executor):
+    gate = threading.Event()
+
+    async def scenario():
+        unbounded = [asyncio.create_task(executor.run(blocking_job(gate), bounded=False)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        stats = executor.get_stats()
+        assert (stats["pending"], stats["unbounded_pending"]) == (0, 3)
+
+        # Both bounded slots are still free behind the queued unbounded jobs
+        bounded = [asyncio.create_task(executor.run(lambda: 7)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        gate.set()
+        return await asyncio.gather(*unbounded), await asyncio.gather(*bounded)
+
+    assert asyncio.run(scenario()) == ([True] * 3, [7, 7])
+    assert executor.get_stats()["rejected"] == 0
@@ -0,0 +1,89 @@
+import asyncio
+import json
+import os
+
+from result_cache import ResultCache, content_hash, weights_version
+
+
+def test_entries_are_scoped_to_weights_version_and_field():
+    cache = ResultCache("v1")
+    cache.set("img", "prediction", {"class": "glioma"})
+
+    assert cache.get("img", "prediction") == {"class": "glioma"}
+    assert cache.get("img", "saliency:gradcam") is None
+    assert ResultCache("v2").get("img", "prediction") is None
+
+
+def test_memory_tier_is_bounded_by_bytes():
+    cache = ResultCache("v1", max_bytes=40)
+    for i in range(4):
+        cache.set(f"img{i}", "f", "x" * 10)  # 12 bytes of JSON each
+
+    stats = cache.get_stats()
+    assert stats["bytes"] <= 40
+    assert stats["evictions"] == 1
+    assert cache.get("img0", "f") is None
+    assert cache.get("img3", "f") == "x" * 10
+
+
+def test_disk_tier_survives_restart_and_tracks_its_size(tmp_path):
+    path = tmp_path / "results.sqlite3"
+    cache = ResultCache("v1", disk_path=path)
+    cache.set("img", "f", "a" * 10)
+    cache.set("img", "f", "b" * 20)  # replacing must not double count
+    size = cache.get_stats()["disk_bytes"]
+    assert size == len('"' + "b" * 20 + '"')
+    cache.close()
+
+    reopened = ResultCache("v1", max_bytes=0, disk_path=path)
+    assert reopened.get_stats()["disk_bytes"] == size
+    assert reopened.get("img", "f") == "b" * 20
+    assert reopened.get_stats()["disk_hits"] == 1
+    reopened.close()
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = ResultCache("v1", max_bytes=0, disk_path=tmp_path / "results.sqlite3", disk_max_bytes=50)
+    for i in range(5):
+        cache.set(f"img{i}", "f", "x" * 10)
+
+    assert cache.get_stats()["disk_bytes"] <= 50
+    assert cache.get("img0", "f") is None
+    assert cache.get("img4", "f") == "x" * 10
+    cache.close()
+
+
+def test_async_accessors_round_trip(tmp_path):
+    cache = ResultCache("v1", disk_path=tmp_path / "results.sqlite3")
+
+    async def scenario():
+        await cache.set_async("img", "prediction", {"class": "notumor"})
+        return await cache.get_async("img", "prediction"), await cache.get_async("other", "prediction")
+
+    assert asyncio.run(scenario()) == ({"class": "notumor"}, None)
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    cache.close()
+
+
+def test_content_hash_is_stable():
+    assert content_hash(b"scan") == content_hash(b"scan")
+    assert content_hash(b"scan") != content_hash(b"scan2")
+
+
+def test_weights_version_is_hashed_once_per_file_state(tmp_path):
+    weights = tmp_path / "model.pth"
+    weights.write_bytes(b"w" * 3000)
+    version = weights_version(weights, chunk_size=1024)
+    assert version == content_hash(b"w" * 3000)[:16]
+
+    # An unchanged file is answered from the sidecar without hashing
+    sidecar = tmp_path / "model.pth.version"
+    sidecar.write_text(json.dumps({**json.loads(sidecar.read_text()), "version": "from-sidecar"}))
+    assert weights_version(weights) == "from-sidecar"
+
+    weights.write_bytes(b"v" * 3000)
+    stat = weights.stat()
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert weights_version(weights) == content_hash(b"v" * 3000)[:16]
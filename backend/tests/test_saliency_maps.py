@@ -0,0 +1,278 @@
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("PIL")
+
+from saliency_maps import SaliencyMapGenerator  # noqa: E402
+
+
+class TinyNet(torch.nn.Module):
+    """Conv net small enough to run the reference loops in milliseconds"""
+
+    def __init__(self):
+        super().__init__()
+        self.layer1 = torch.nn.Conv2d(3, 4, 3, padding=1)
+        self.layer4 = torch.nn.Sequential(torch.nn.Conv2d(4, 6, 3, stride=2, padding=1), torch.nn.ReLU())
+        self.fc = torch.nn.Linear(6, 3)
+
+    def forward(self, x):
+        x = self.layer4(torch.relu(self.layer1(x)))
+        return self.fc(x.mean(dim=(2, 3)))
+
+
+@pytest.fixture
+def model():
+    torch.manual_seed(0)
+    return TinyNet().eval()
+
+
+@pytest.fixture
+def generator(model):
+    return SaliencyMapGenerator(model, device='cpu')
+
+
+@pytest.fixture
+def image():
+    torch.manual_seed(1)
+    return torch.randn(3, 16, 16)
+
+
+def normalize(values):
+    return (values - values.min()) / (values.max() - values.min())
+
+
+def per_step_attributions(model, image, baseline, target_class, alphas, weights):
+    """The original Integrated Gradients loop: one forward and backward pass per step"""
+    image = image.unsqueeze(0)
+    baseline = baseline.unsqueeze(0)
+    integrated_grads = torch.zeros_like(image)
+    for alpha, weight in zip(alphas, weights):
+        interpolated_input = (baseline + alpha * (image - baseline)).requires_grad_(True)
+        output = model(interpolated_input)
+        grad = torch.autograd.grad(output[0, target_class], interpolated_input)[0]
+        integrated_grads += grad * weight
+    return integrated_grads * (image - baseline)
+
+
+def attribution_map(attributions):
+    return normalize(attributions[0].abs().sum(dim=0).detach().numpy())
+
+
+@pytest.mark.parametrize("method, alphas, weights", [
+    ('riemann_trapezoid', [0.0, 0.25, 0.5, 0.75, 1.0], [0.125, 0.25, 0.25, 0.25, 0.125]),
+    ('riemann_left', [0.0, 0.2, 0.4, 0.6, 0.8], [0.2] * 5),
+    ('riemann_middle', [0.1, 0.3, 0.5, 0.7, 0.9], [0.2] * 5),
+    ('riemann_right', [0.2, 0.4, 0.6, 0.8, 1.0], [0.2] * 5),
+])
+def test_integration_points(method, alphas, weights):
+    points, point_weights = SaliencyMapGenerator._integration_points(5, method)
+    assert torch.allclose(points, torch.tensor(alphas))
+    assert torch.allclose(point_weights, torch.tensor(weights))
+    assert point_weights.sum().item() == pytest.approx(1.0)
+
+
+def test_integration_points_reject_bad_arguments():
+    with pytest.raises(ValueError):
+        SaliencyMapGenerator._integration_points(1, 'riemann_trapezoid')
+    with pytest.raises(ValueError):
+        SaliencyMapGenerator._integration_points(8, 'simpson')
+
+
+@pytest.mark.parametrize("method", ['riemann_trapezoid', 'riemann_middle'])
+def test_integrated_gradients_do_not_depend_on_chunk_size(generator, image, method):
+    results = [
+        generator.generate_integrated_gradients(image, target_class=1, steps=20, internal_batch_size=size,
+                                                method=method, return_convergence_delta=True)
+        for size in (1, 7, 64)
+    ]
+
+    reference_map, _, reference_delta = results[-1]
+    for attributions, target_class, delta in results[:-1]:
+        assert target_class == 1
+        assert np.allclose(attributions, reference_map, atol=1e-4)
+        assert delta == pytest.approx(reference_delta, rel=1e-3, abs=1e-5)
+
+
+@pytest.mark.parametrize("method", ['riemann_trapezoid', 'riemann_left', 'riemann_middle', 'riemann_right'])
+def test_integrated_gradients_match_the_per_step_loop(model, generator, image, method):
+    baseline = torch.full_like(image, 0.5)
+    attributions, _ = generator.generate_integrated_gradients(
+        image, target_class=2, steps=12, internal_batch_size=5, method=method, baseline=baseline
+    )
+
+    alphas, weights = SaliencyMapGenerator._integration_points(12, method)
+    expected = per_step_attributions(model, image, baseline, 2, alphas, weights)
+    assert np.allclose(attributions, attribution_map(expected), atol=1e-4)
+
+
+def test_integrated_gradients_match_the_original_implementation(model, generator, image):
+    # The original loop used equal 1/steps weights on linspace points, which
+    # differs from the trapezoid rule only in the endpoint weights
+    steps = 256
+    original = per_step_attributions(
+        model, image, torch.zeros_like(image), 0, torch.linspace(0, 1, steps), [1.0 / steps] * steps
+    )
+    attributions, _ = generator.generate_integrated_gradients(image, target_class=0, steps=steps)
+    assert np.allclose(attributions, attribution_map(original), atol=0.05)
+
+
+def test_convergence_delta_is_the_completeness_gap(model, generator, image):
+    baseline = torch.full_like(image, -0.25)
+    _, _, delta = generator.generate_integrated_gradients(
+        image, target_class=1, steps=32, baseline=baseline, return_convergence_delta=True
+    )
+
+    alphas, weights = SaliencyMapGenerator._integration_points(32, 'riemann_trapezoid')
+    attributions = per_step_attributions(model, image, baseline, 1, alphas, weights)
+    with torch.no_grad():
+        scores = model(torch.stack([image, baseline]))[:, 1]
+    expected = (attributions.sum() - (scores[0] - scores[1])).abs().item()
+    assert delta == pytest.approx(expected, rel=1e-3, abs=1e-5)
+
+
+def sliding_window_occlusion(model, image, target_class, patch_size, stride, average_overlaps=True):
+    """The original sliding-window loop; with ``average_overlaps`` each pixel
+    gets the mean drop over the patches covering it instead of the last one"""
+    image = image.unsqueeze(0)
+    _, _, height, width = image.shape
+    with torch.no_grad():
+        baseline_confidence = torch.softmax(model(image), dim=1)[0, target_class].item()
+        importance_sum = np.zeros((height, width))
+        coverage = np.zeros((height, width))
+        for y in range(0, height - patch_size + 1, stride):
+            for x in range(0, width - patch_size + 1, stride):
+                occluded_image = image.clone()
+                occluded_image[:, :, y:y + patch_size, x:x + patch_size] = 0
+                confidence = torch.softmax(model(occluded_image), dim=1)[0, target_class].item()
+                importance = baseline_confidence - confidence
+                if average_overlaps:
+                    importance_sum[y:y + patch_size, x:x + patch_size] += importance
+                    coverage[y:y + patch_size, x:x + patch_size] += 1
+                else:
+                    importance_sum[y:y + patch_size, x:x + patch_size] = importance
+                    coverage[y:y + patch_size, x:x + patch_size] = 1
+    return normalize(importance_sum / np.maximum(coverage, 1))
+
+
+@pytest.mark.parametrize("internal_batch_size", [1, 5, 64])
+def test_occlusion_averages_overlapping_patches(model, generator, image, internal_batch_size):
+    # 5x5 patches every 3 pixels stop at column 14, so the last two rows and
+    # columns are never occluded
+    occlusion_map, target_class = generator.generate_occlusion_map(
+        image, target_class=0, patch_size=5, stride=3, internal_batch_size=internal_batch_size
+    )
+
+    expected = sliding_window_occlusion(model, image, 0, patch_size=5, stride=3)
+    assert target_class == 0
+    assert occlusion_map.shape == (16, 16)
+    assert np.allclose(occlusion_map, expected, atol=1e-4)
+    # Uncovered pixels all sit at the level of a zero confidence drop
+    zero_drop = occlusion_map[15, 15]
+    assert np.allclose(occlusion_map[14:, :], zero_drop)
+    assert np.allclose(occlusion_map[:, 14:], zero_drop)
+
+
+def test_occlusion_matches_the_original_loop_without_overlap(model, generator, image):
+    # Without overlap averaging and overwriting agree; 4 does not divide 18,
+    # so the last two rows and columns stay uncovered
+    image = torch.nn.functional.pad(image, (0, 2, 0, 2))
+    occlusion_map, target_class = generator.generate_occlusion_map(image, patch_size=4, stride=4)
+
+    expected = sliding_window_occlusion(model, image, target_class, patch_size=4, stride=4,
+                                        average_overlaps=False)
+    assert np.allclose(occlusion_map, expected, atol=1e-4)
+    assert np.allclose(occlusion_map[16:, :], occlusion_map[16, 0])
+
+
+def separate_predict_and_gradcam(model, image, target_layer):
+    """The original path: a no-grad prediction, then Grad-CAM from its own
+    forward pass with temporary forward and backward hooks"""
+    with torch.no_grad():
+        probabilities = torch.softmax(model(image.unsqueeze(0)), dim=1)[0]
+
+    activations, gradients = [], []
+    forward_handle = target_layer.register_forward_hook(lambda module, input, output: activations.append(output))
+    backward_handle = target_layer.register_full_backward_hook(
+        lambda module, grad_input, grad_output: gradients.append(grad_output[0])
+    )
+    try:
+        image_batch = image.unsqueeze(0).clone().requires_grad_(True)
+        output = model(image_batch)
+        target_class = output.argmax(dim=1).item()
+        model.zero_grad()
+        one_hot = torch.zeros_like(output)
+        one_hot[0, target_class] = 1
+        output.backward(gradient=one_hot)
+    finally:
+        forward_handle.remove()
+        backward_handle.remove()
+
+    weights = gradients[0][0].mean(dim=(1, 2))
+    cam = torch.relu((weights[:, None, None] * activations[0][0].detach()).sum(dim=0))
+    # cv2.resize in the original, which samples bilinearly like this
+    cam = torch.nn.functional.interpolate(cam[None, None], size=image.shape[1:], mode='bilinear',
+                                          align_corners=False)[0, 0]
+    return probabilities, target_class, normalize(cam).numpy()
+
+
+@pytest.fixture
+def positive_head_model(model):
+    # Non-negative class weights keep every CAM non-degenerate
+    with torch.no_grad():
+        model.fc.weight.abs_()
+    return model
+
+
+def test_fused_gradcam_matches_separate_predict_and_gradcam(positive_head_model, image):
+    generator = SaliencyMapGenerator(positive_head_model, device='cpu')
+    logits, probabilities, cam = generator.predict_and_explain(image)
+
+    expected_probabilities, expected_class, expected_cam = separate_predict_and_gradcam(
+        positive_head_model, image, positive_head_model.layer4
+    )
+    assert torch.allclose(probabilities, expected_probabilities, atol=1e-6)
+    assert torch.allclose(torch.softmax(logits, dim=0), expected_probabilities, atol=1e-6)
+    assert cam.shape == (16, 16)
+    assert np.allclose(cam, expected_cam, atol=1e-5)
+
+    gradcam, target_class, gradcam_probabilities = generator.generate_gradcam(image)
+    assert target_class == expected_class
+    assert np.allclose(gradcam, expected_cam, atol=1e-5)
+    assert np.allclose(gradcam_probabilities, expected_probabilities.numpy(), atol=1e-6)
+
+
+def test_fused_gradcam_is_isolated_between_threads_and_calls(positive_head_model):
+    generator = SaliencyMapGenerator(positive_head_model, device='cpu')
+    torch.manual_seed(2)
+    images = [torch.randn(3, 16, 16) for _ in range(2)]
+    expected = [separate_predict_and_gradcam(positive_head_model, image, positive_head_model.layer4)
+                for image in images]
+
+    barrier = threading.Barrier(len(images))
+    mismatches = []
+
+    def worker(index):
+        barrier.wait()
+        for _ in range(25):
+            _, probabilities, cam = generator.predict_and_explain(images[index])
+            expected_probabilities, _, expected_cam = expected[index]
+            if not (torch.allclose(probabilities, expected_probabilities, atol=1e-6)
+                    and np.allclose(cam, expected_cam, atol=1e-5)):
+                mismatches.append(index)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(len(images))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert mismatches == []
+
+    # One persistent hook, and nothing captured outside predict_and_explain
+    generator.predict_and_explain(images[0])
+    assert len(positive_head_model.layer4._forward_hooks) == 1
+    with torch.no_grad():
+        positive_head_model(images[0].unsqueeze(0))
+    assert getattr(generator._capture, 'activations', None) is None
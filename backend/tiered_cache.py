@@ -0,0 +1,27 @@
+import asyncio
+
+
+class TieredCache:
+    """Base for caches with an in-memory tier and an optional SQLite tier
+
+    Subclasses set ``_db`` (None without a disk tier) and implement ``get``,
+    which checks both tiers, and ``_get_memory``, which checks only the
+    in-memory tier, counts its hits and never blocks on I/O.
+    """
+
+    _db = None
+
+    def get(self, *key):
+        raise NotImplementedError
+
+    def _get_memory(self, *key):
+        raise NotImplementedError
+
+    async def get_async(self, *key):
+        """``get`` for the event loop: memory hits inline, SQLite lookups on a thread"""
+        if self._db is None:
+            return self.get(*key)
+        value = self._get_memory(*key)
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self.get, *key)
@@ -2,7 +2,8 @@ import torch
 import torch.nn as nn
 import torch.optim as optim
 from torch.utils.data import DataLoader, Dataset
-from torchvision import transforms, models
+from torch.utils.data.distributed import DistributedSampler
+from torchvision import transforms
 from PIL import Image
 import os
 import pandas as pd
@@ -13,8 +14,17 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
 import json
+import argparse
+import contextlib
 from tqdm import tqdm
 
+from tensor_shards import SHARD_DIR, INDEX_NAME, ShardedBrainTumorDataset, load_shard_index
+from batch_augment import AugmentedLoader, BatchAugment, decode_transform
+from checkpointing import CheckpointManager, capture_rng_state, restore_rng_state
+from distributed import all_reduce_sum, cleanup_distributed, init_distributed, is_main_process
+from download_data import load_manifest
+from classifier import BrainTumorClassifier
+
 class BrainTumorDataset(Dataset):
     def __init__(self, image_paths, labels, transform=None):
         self.image_paths = image_paths
@@ -35,91 +45,172 @@ class BrainTumorDataset(Dataset):
             
         return image, label
 
-class BrainTumorClassifier(nn.Module):
-    def __init__(self, num_classes=4, model_name='resnet50'):
-        super(BrainTumorClassifier, self).__init__()
-        
-        if model_name == 'resnet50':
-            self.backbone = models.resnet50(pretrained=True)
-            num_features = self.backbone.fc.in_features
-            self.backbone.fc = nn.Linear(num_features, num_classes)
-        elif model_name == 'efficientnet':
-            self.backbone = models.efficientnet_b0(pretrained=True)
-            num_features = self.backbone.classifier[1].in_features
-            self.backbone.classifier = nn.Sequential(
-                nn.Dropout(0.2),
-                nn.Linear(num_features, num_classes)
-            )
-        
-    def forward(self, x):
-        return self.backbone(x)
-
 class ModelTrainer:
-    def __init__(self, model, device='cuda' if torch.cuda.is_available() else 'cpu'):
-        self.model = model.to(device)
+    def __init__(self, model, device='cuda' if torch.cuda.is_available() else 'cpu',
+                 precision='fp32', channels_last=False, grad_accum_steps=1, distributed=False):
+        if precision not in ('fp32', 'bf16'):
+            raise ValueError(f"Unknown precision '{precision}', choose 'fp32' or 'bf16'")
+        
         self.device = device
+        self.precision = precision
+        self.channels_last = channels_last
+        self.grad_accum_steps = max(1, int(grad_accum_steps))
+        
+        self.model = model.to(device)
+        if channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+        if distributed:
+            self.model = nn.parallel.DistributedDataParallel(self.model)
+        self.is_main = is_main_process()
+        
         self.train_losses = []
         self.val_losses = []
         self.train_accuracies = []
         self.val_accuracies = []
+    
+    @property
+    def base_model(self):
+        """The underlying model, without any DistributedDataParallel wrapper"""
+        if isinstance(self.model, nn.parallel.DistributedDataParallel):
+            return self.model.module
+        return self.model
+    
+    def _log(self, message):
+        if self.is_main:
+            print(message)
+    
+    def _reduce_metrics(self, running_loss, correct, total, num_batches):
+        """Combine epoch metrics across processes with a single host sync"""
+        metrics = torch.stack([
+            running_loss.detach().double().cpu(),
+            correct.double().cpu(),
+            torch.tensor(float(total), dtype=torch.float64),
+            torch.tensor(float(num_batches), dtype=torch.float64)
+        ])
+        loss_sum, correct, total, num_batches = all_reduce_sum(metrics).tolist()
+        return loss_sum / num_batches, 100 * correct / total
+    
+    def _autocast(self):
+        """bfloat16 autocast when enabled (a no-op context for fp32)"""
+        return torch.autocast(
+            device_type=torch.device(self.device).type,
+            dtype=torch.bfloat16,
+            enabled=self.precision == 'bf16'
+        )
+    
+    def _no_sync(self, sync):
+        """Skip DDP's gradient all-reduce on micro-steps that do not end an accumulation window"""
+        if sync or not isinstance(self.model, nn.parallel.DistributedDataParallel):
+            return contextlib.nullcontext()
+        return self.model.no_sync()
+    
+    def _to_device(self, images, labels):
+        images = images.to(self.device, non_blocking=True)
+        if self.channels_last:
+            images = images.contiguous(memory_format=torch.channels_last)
+        return images, labels.to(self.device, non_blocking=True)
         
     def train_epoch(self, dataloader, criterion, optimizer):
         self.model.train()
-        running_loss = 0.0
-        correct = 0
+        # Metrics stay on the device and are read back once per epoch
+        running_loss = torch.zeros((), device=self.device)
+        correct = torch.zeros((), dtype=torch.long, device=self.device)
         total = 0
+        num_batches = len(dataloader)
         
-        for images, labels in tqdm(dataloader, desc="Training"):
-            images, labels = images.to(self.device), labels.to(self.device)
+        optimizer.zero_grad()
+        for step, (images, labels) in enumerate(tqdm(dataloader, desc="Training", disable=not self.is_main)):
+            images, labels = self._to_device(images, labels)
             
-            optimizer.zero_grad()
-            outputs = self.model(images)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
+            # Step once per accumulation window; the last window may be shorter
+            window_start = step - step % self.grad_accum_steps
+            window_size = min(self.grad_accum_steps, num_batches - window_start)
+            is_boundary = step + 1 == window_start + window_size
             
-            running_loss += loss.item()
-            _, predicted = torch.max(outputs.data, 1)
-            total += labels.size(0)
-            correct += (predicted == labels).sum().item()
+            with self._no_sync(is_boundary):
+                with self._autocast():
+                    outputs = self.model(images)
+                    loss = criterion(outputs, labels)
+                (loss / window_size).backward()
+            
+            if is_boundary:
+                optimizer.step()
+                optimizer.zero_grad()
             
-        epoch_loss = running_loss / len(dataloader)
-        epoch_acc = 100 * correct / total
+            running_loss += loss.detach()
+            correct += (outputs.detach().argmax(dim=1) == labels).sum()
+            total += labels.size(0)
         
-        return epoch_loss, epoch_acc
+        return self._reduce_metrics(running_loss, correct, total, num_batches)
     
     def validate_epoch(self, dataloader, criterion):
         self.model.eval()
-        running_loss = 0.0
-        correct = 0
+        running_loss = torch.zeros((), device=self.device)
+        correct = torch.zeros((), dtype=torch.long, device=self.device)
         total = 0
         
         with torch.no_grad():
-            for images, labels in tqdm(dataloader, desc="Validation"):
-                images, labels = images.to(self.device), labels.to(self.device)
-                outputs = self.model(images)
-                loss = criterion(outputs, labels)
+            for images, labels in tqdm(dataloader, desc="Validation", disable=not self.is_main):
+                images, labels = self._to_device(images, labels)
+                with self._autocast():
+                    outputs = self.model(images)
+                    loss = criterion(outputs, labels)
                 
-                running_loss += loss.item()
-                _, predicted = torch.max(outputs.data, 1)
+                running_loss += loss.detach()
+                correct += (outputs.argmax(dim=1) == labels).sum()
                 total += labels.size(0)
-                correct += (predicted == labels).sum().item()
-                
-        epoch_loss = running_loss / len(dataloader)
-        epoch_acc = 100 * correct / total
         
-        return epoch_loss, epoch_acc
+        return self._reduce_metrics(running_loss, correct, total, len(dataloader))
+    
+    def training_state(self, epoch, optimizer, scheduler, best_val_acc):
+        """Everything needed to continue training after ``epoch``"""
+        return {
+            "epoch": epoch,
+            "model": self.base_model.state_dict(),
+            "optimizer": optimizer.state_dict(),
+            "scheduler": scheduler.state_dict(),
+            "best_val_acc": best_val_acc,
+            "history": {
+                "train_losses": self.train_losses,
+                "val_losses": self.val_losses,
+                "train_accuracies": self.train_accuracies,
+                "val_accuracies": self.val_accuracies
+            },
+            "rng": capture_rng_state()
+        }
     
-    def train(self, train_loader, val_loader, num_epochs=25, lr=0.001):
+    def load_training_state(self, state, optimizer, scheduler):
+        """Restore a checkpoint and return (next_epoch, best_val_acc)"""
+        self.base_model.load_state_dict(state["model"])
+        optimizer.load_state_dict(state["optimizer"])
+        scheduler.load_state_dict(state["scheduler"])
+        self.train_losses = list(state["history"]["train_losses"])
+        self.val_losses = list(state["history"]["val_losses"])
+        self.train_accuracies = list(state["history"]["train_accuracies"])
+        self.val_accuracies = list(state["history"]["val_accuracies"])
+        restore_rng_state(state["rng"])
+        return state["epoch"] + 1, state["best_val_acc"]
+    
+    def train(self, train_loader, val_loader, num_epochs=25, lr=0.001,
+              checkpoint_manager=None, checkpoint_every=1, resume_state=None):
         criterion = nn.CrossEntropyLoss()
         optimizer = optim.Adam(self.model.parameters(), lr=lr)
         scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, 'min', patience=5)
         
         best_val_acc = 0.0
+        start_epoch = 0
+        
+        if resume_state is not None:
+            start_epoch, best_val_acc = self.load_training_state(resume_state, optimizer, scheduler)
+            self._log(f"↩️  Resuming from epoch {start_epoch + 1} (best Val Acc: {best_val_acc:.2f}%)")
         
-        for epoch in range(num_epochs):
-            print(f"\nEpoch {epoch+1}/{num_epochs}")
-            print("-" * 40)
+        for epoch in range(start_epoch, num_epochs):
+            self._log(f"\nEpoch {epoch+1}/{num_epochs}")
+            self._log("-" * 40)
+            
+            # Reshuffle distributed shards differently every epoch
+            if hasattr(train_loader.sampler, 'set_epoch'):
+                train_loader.sampler.set_epoch(epoch)
             
             # Training phase
             train_loss, train_acc = self.train_epoch(train_loader, criterion, optimizer)
@@ -131,25 +222,45 @@ class ModelTrainer:
             self.val_losses.append(val_loss)
             self.val_accuracies.append(val_acc)
             
-            print(f"Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}%")
-            print(f"Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}%")
+            self._log(f"Train Loss: {train_loss:.4f}, Train Acc: {train_acc:.2f}%")
+            self._log(f"Val Loss: {val_loss:.4f}, Val Acc: {val_acc:.2f}%")
             
             # Learning rate scheduling
             scheduler.step(val_loss)
             
-            # Save best model
+            # Save best model (metrics are already reduced, so ranks agree)
             if val_acc > best_val_acc:
                 best_val_acc = val_acc
-                torch.save(self.model.state_dict(), 'models/best_brain_tumor_model.pth')
-                print(f"✅ New best model saved! Val Acc: {val_acc:.2f}%")
+                if self.is_main:
+                    torch.save(self.base_model.state_dict(), 'models/best_brain_tumor_model.pth')
+                self._log(f"✅ New best model saved! Val Acc: {val_acc:.2f}%")
+            
+            # Periodic full checkpoint, written in the background
+            if checkpoint_manager is not None and (
+                (epoch + 1) % checkpoint_every == 0 or epoch + 1 == num_epochs
+            ):
+                checkpoint_manager.save(
+                    epoch, self.training_state(epoch, optimizer, scheduler, best_val_acc)
+                )
+        
+        if checkpoint_manager is not None:
+            checkpoint_manager.wait()
         
         return self.model
 
-def prepare_data():
-    """Prepare dataset for training"""
-    data_dir = Path("data")
+def find_training_images(data_dir="data"):
+    """Return image paths and labels under data/Training in a stable order
+    
+    Reads the manifest written by ``download_data.py`` when present, so
+    corrupt and duplicate images are already excluded and the directory
+    tree is not globbed on every run.
+    """
+    data_dir = Path(data_dir)
+    manifest = load_manifest(data_dir, split='train')
+    if manifest is not None:
+        manifest = sorted(manifest, key=lambda row: row['path'])
+        return [str(data_dir / row['path']) for row in manifest], [row['label'] for row in manifest]
     
-    # Find all image files
     image_paths = []
     labels = []
     class_names = ['glioma', 'meningioma', 'notumor', 'pituitary']
@@ -157,18 +268,30 @@ def prepare_data():
     for class_idx, class_name in enumerate(class_names):
         class_dir = data_dir / "Training" / class_name
         if class_dir.exists():
-            for img_path in class_dir.glob("*.jpg"):
+            for img_path in sorted(class_dir.glob("*.jpg")):
                 image_paths.append(str(img_path))
                 labels.append(class_idx)
     
-    print(f"Found {len(image_paths)} images across {len(class_names)} classes")
-    
-    # Split data
-    train_paths, val_paths, train_labels, val_labels = train_test_split(
-        image_paths, labels, test_size=0.2, random_state=42, stratify=labels
-    )
+    return image_paths, labels
+
+def build_transforms(sharded=False):
+    """Per-sample (train, val) transforms for PIL images or uint8 shard tensors"""
+    if sharded:
+        # Shards are already 224x224 uint8, so only tensor ops remain
+        train_transform = transforms.Compose([
+            transforms.RandomRotation(10),
+            transforms.RandomHorizontalFlip(),
+            transforms.ColorJitter(brightness=0.1, contrast=0.1),
+            transforms.ConvertImageDtype(torch.float),
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        ])
+        
+        val_transform = transforms.Compose([
+            transforms.ConvertImageDtype(torch.float),
+            transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
+        ])
+        return train_transform, val_transform
     
-    # Data transforms
     train_transform = transforms.Compose([
         transforms.Resize((224, 224)),
         transforms.RandomRotation(10),
@@ -183,14 +306,67 @@ def prepare_data():
         transforms.ToTensor(),
         transforms.Normalize([0.485, 0.456, 0.406], [0.229, 0.224, 0.225])
     ])
+    return train_transform, val_transform
+
+def prepare_data(shard_index=None, augment='pil', distributed=False):
+    """Prepare dataset for training
+    
+    With ``shard_index`` (written by ``tensor_shards.py``) images are read
+    pre-resized from memory-mapped shards; otherwise JPEGs listed in the
+    dataset manifest (or found under ``data/Training``) are decoded.
+    ``augment='pil'`` augments each image in the DataLoader workers, while
+    ``augment='batch'`` has workers return uint8 tensors and augments whole
+    collated batches with ``BatchAugment``.
+    With ``distributed`` every process computes the same stratified split and
+    a ``DistributedSampler`` gives each one a disjoint shard of it.
+    """
+    if augment not in ('pil', 'batch'):
+        raise ValueError(f"Unknown augment mode '{augment}', choose 'pil' or 'batch'")
+    
+    class_names = ['glioma', 'meningioma', 'notumor', 'pituitary']
+    
+    if shard_index is not None:
+        samples = load_shard_index(shard_index)["samples"]
+        labels = [sample["label"] for sample in samples]
+        image_refs = list(range(len(samples)))
+    else:
+        image_refs, labels = find_training_images()
+    
+    print(f"Found {len(image_refs)} images across {len(class_names)} classes")
+    
+    # Split data
+    train_refs, val_refs, train_labels, val_labels = train_test_split(
+        image_refs, labels, test_size=0.2, random_state=42, stratify=labels
+    )
+    
+    # Data transforms
+    if augment == 'batch':
+        # Workers only load uint8 tensors; augmentation happens after collation
+        train_transform = val_transform = None if shard_index is not None else decode_transform()
+    else:
+        train_transform, val_transform = build_transforms(sharded=shard_index is not None)
     
     # Create datasets
-    train_dataset = BrainTumorDataset(train_paths, train_labels, train_transform)
-    val_dataset = BrainTumorDataset(val_paths, val_labels, val_transform)
+    if shard_index is not None:
+        train_dataset = ShardedBrainTumorDataset(shard_index, train_refs, train_transform)
+        val_dataset = ShardedBrainTumorDataset(shard_index, val_refs, val_transform)
+    else:
+        train_dataset = BrainTumorDataset(train_refs, train_labels, train_transform)
+        val_dataset = BrainTumorDataset(val_refs, val_labels, val_transform)
     
     # Create dataloaders
-    train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True, num_workers=4)
-    val_loader = DataLoader(val_dataset, batch_size=32, shuffle=False, num_workers=4)
+    if distributed:
+        train_sampler = DistributedSampler(train_dataset, shuffle=True, seed=42)
+        val_sampler = DistributedSampler(val_dataset, shuffle=False)
+        train_loader = DataLoader(train_dataset, batch_size=32, sampler=train_sampler, num_workers=4)
+        val_loader = DataLoader(val_dataset, batch_size=32, sampler=val_sampler, num_workers=4)
+    else:
+        train_loader = DataLoader(train_dataset, batch_size=32, shuffle=True, num_workers=4)
+        val_loader = DataLoader(val_dataset, batch_size=32, shuffle=False, num_workers=4)
+    
+    if augment == 'batch':
+        train_loader = AugmentedLoader(train_loader, BatchAugment(train=True))
+        val_loader = AugmentedLoader(val_loader, BatchAugment(train=False))
     
     return train_loader, val_loader
 
@@ -218,31 +394,90 @@ def plot_training_history(trainer):
     plt.savefig('training_history.png', dpi=300, bbox_inches='tight')
     plt.show()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Train the brain tumor classifier")
+    parser.add_argument('--augment', choices=['pil', 'batch'], default='pil',
+                        help="Augment per image in workers (pil) or per collated batch (batch)")
+    parser.add_argument('--epochs', type=int, default=25)
+    parser.add_argument('--precision', choices=['fp32', 'bf16'], default='fp32',
+                        help="bf16 enables bfloat16 autocast")
+    parser.add_argument('--channels-last', action='store_true',
+                        help="Use the channels_last memory format")
+    parser.add_argument('--grad-accum-steps', type=int, default=1,
+                        help="Accumulate gradients over N batches per optimizer step")
+    parser.add_argument('--resume', nargs='?', const='latest', default=None,
+                        help="Resume from the newest checkpoint, or from the given checkpoint file")
+    parser.add_argument('--checkpoint-dir', default='models/checkpoints')
+    parser.add_argument('--checkpoint-every', type=int, default=1,
+                        help="Write a full checkpoint every N epochs")
+    parser.add_argument('--keep-last', type=int, default=3,
+                        help="Number of checkpoints to keep")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
+    
+    # Under torchrun, join the gloo group; rank 0 owns logging and files
+    distributed = init_distributed()
+    main_process = is_main_process()
+    log = print if main_process else (lambda *_, **__: None)
+    
     # Create models directory
     os.makedirs('models', exist_ok=True)
     
-    print("🧠 Brain Tumor Classification Training")
-    print("=" * 50)
+    log("🧠 Brain Tumor Classification Training")
+    log("=" * 50)
     
-    # Prepare data
-    print("📊 Preparing data...")
-    train_loader, val_loader = prepare_data()
+    # Prepare data (from tensor shards when `python tensor_shards.py` has been run)
+    log("📊 Preparing data...")
+    shard_index = SHARD_DIR / INDEX_NAME
+    if shard_index.exists():
+        log(f"🧩 Using preprocessed shards from {shard_index}")
+        train_loader, val_loader = prepare_data(
+            shard_index=shard_index, augment=args.augment, distributed=distributed
+        )
+    else:
+        train_loader, val_loader = prepare_data(augment=args.augment, distributed=distributed)
     
     # Create model
-    print("🏗️  Building model...")
+    log("🏗️  Building model...")
     model = BrainTumorClassifier(num_classes=4, model_name='resnet50')
     
-    # Train model
-    print("🚀 Starting training...")
-    trainer = ModelTrainer(model)
-    trained_model = trainer.train(train_loader, val_loader, num_epochs=25)
+    # Checkpointing and resume (every rank loads, only rank 0 writes)
+    checkpoint_manager = CheckpointManager(args.checkpoint_dir, keep_last=args.keep_last)
+    resume_state = None
+    if args.resume is not None:
+        resume_path = None if args.resume == 'latest' else args.resume
+        resume_state = checkpoint_manager.load(resume_path)
     
-    # Plot results
-    print("📈 Plotting training history...")
-    plot_training_history(trainer)
+    # Train model
+    log("🚀 Starting training...")
+    trainer = ModelTrainer(
+        model,
+        device='cpu' if distributed else ('cuda' if torch.cuda.is_available() else 'cpu'),
+        precision=args.precision,
+        channels_last=args.channels_last,
+        grad_accum_steps=args.grad_accum_steps,
+        distributed=distributed
+    )
+    try:
+        trained_model = trainer.train(
+            train_loader, val_loader,
+            num_epochs=args.epochs,
+            checkpoint_manager=checkpoint_manager if main_process else None,
+            checkpoint_every=args.checkpoint_every,
+            resume_state=resume_state
+        )
+    finally:
+        checkpoint_manager.close()
+        cleanup_distributed()
     
-    print("✅ Training completed! Model saved to 'models/best_brain_tumor_model.pth'")
+    if main_process:
+        # Plot results
+        print("📈 Plotting training history...")
+        plot_training_history(trainer)
+        
+        print("✅ Training completed! Model saved to 'models/best_brain_tumor_model.pth'")
 
 if __name__ == "__main__":
     main()